@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmarks the black_magic compiler by kompiling every module of the kg library for every format.
+
+Run this from the repo root, e.g., "python3 dev/bench_kompile.py -r 5". Parsing is timed separately from
+the whole kompilation. No caches, no tree-shaking.
+"""
+
+from contextlib import redirect_stdout
+from time import perf_counter
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kg.black_magic.compiler import compile_lines, parse_lines
+from kg.script.details import Details
+
+kg_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'kg')
+FORMATS = ['local', 'kg', 'pg', 'hr', 'pc2', 'dom', 'cms', 'cms-it']
+
+def library_modules():
+    modules = {}
+    for folder in '', 'utils', 'graphs', 'grids', 'math':
+        for filename in sorted(os.listdir(os.path.join(kg_path, folder))):
+            base, ext = os.path.splitext(filename)
+            if ext != '.py': continue
+            if not folder and base not in {'formatters', 'generators', 'validators', 'interactors', 'checkers'}: continue
+            parts = ['kg', *([folder] if folder else []), *([] if base == '__init__' else [base])]
+            with open(os.path.join(kg_path, folder, filename)) as f:
+                modules['.'.join(parts)] = [line.rstrip('\n') for line in f]
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark kg kompile over the kg library.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of runs (the best one is reported)')
+    args = parser.parse_args()
+
+    modules = library_modules()
+    details = Details({'valid_subtasks': [1, 2, 3]})
+    subtasks_files = [(0, 4, [1, 2, 3]), (5, 9, [2, 3])]
+
+    def load_module(module_id):
+        return modules[module_id], {'location': module_id, 'label': module_id}
+
+    def get_module_id(module, context):
+        # same as in kg kompile
+        if not module.startswith('.'): return module
+        parts = context['module_id'].split('.')
+        while module.startswith('.'):
+            module = module[1:]
+            parts.pop()
+        return '.'.join([*parts, module])
+
+    source_lines = sum(map(len, modules.values()))
+    print(f'{len(modules)} modules, {source_lines} lines, {len(FORMATS)} formats', file=sys.stderr)
+
+    parse_best = kompile_best = float('inf')
+    for run in range(args.repeat):
+        start = perf_counter()
+        for module_id, lines in modules.items():
+            parse_lines(lines, module_id)
+        parse_best = min(parse_best, perf_counter() - start)
+
+        start = perf_counter()
+        kompiled = 0
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):  # the progress messages
+            for fmt in FORMATS:
+                for module_id, lines in modules.items():
+                    kompiled += len(compile_lines(lines,
+                            module_id=module_id,
+                            load_module=load_module,
+                            get_module_id=get_module_id,
+                            format=fmt,
+                            details=details,
+                            subtasks_files=subtasks_files,
+                            snippet=False,
+                            subtasks_only=False,
+                            seed=run,
+                        ))
+        kompile_best = min(kompile_best, perf_counter() - start)
+
+    print(f'parse:   {parse_best:.3f} sec. ({source_lines / parse_best:,.0f} lines/sec.)')
+    print(f'kompile: {kompile_best:.3f} sec. ({kompiled / kompile_best:,.0f} output lines/sec.)')
+
+if __name__ == '__main__': main()
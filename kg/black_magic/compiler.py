@@ -10,7 +10,7 @@ except ImportError:
 
 from itertools import count
 from sys import stdout, stderr
-import base64, re, zlib
+import ast, base64, hashlib, os, pickle, re, zlib
 
 from ..script.utils import *
 
@@ -44,12 +44,27 @@ SYNTAX_RULES = [
     (re.compile(r'^.*##\s*@.*$'), Directive.COULD_BE_BAD, "'## @' found but couldn't parse. Possible mistake."),
     (re.compile(r'.*'), Directive.ECHO, None),
 ]
+
+# every rule but the last needs a '##' in the line, so most lines skip the regexes entirely. the rest are
+# classified by a single regex trying all rules in order, and only the winning rule is matched again for its groups.
+assert all('##' in pattern.pattern for pattern, directive, message in SYNTAX_RULES[:-1])
+_ECHO_RULE = SYNTAX_RULES[-1]
+_combined_rules = re.compile('|'.join(f'({pattern.pattern})' for pattern, directive, message in SYNTAX_RULES))
+_rule_at_group = {}
+_group = 1
+for _rule in SYNTAX_RULES:
+    _rule_at_group[_group] = _rule
+    _group += 1 + _rule[0].groups
+
 def get_directive_type(line):
-    for pattern, directive, message in SYNTAX_RULES:
-        match = pattern.match(line)
-        if match: return pattern, match, directive, message
+    if '##' not in line:
+        pattern, directive, message = _ECHO_RULE
+        return pattern, None, directive, message
 
-    assert False, f"Unmatched line by any syntax rule! This shouldn't happen. {line}"
+    combined = _combined_rules.match(line)
+    assert combined, f"Unmatched line by any syntax rule! This shouldn't happen. {line}"
+    pattern, directive, message = _rule_at_group[combined.lastindex]
+    return pattern, pattern.match(line), directive, message
 
 command_re = re.compile(r'\s*([-_A-Za-z0-9]+) (.*)$')
 
@@ -144,12 +159,149 @@ def parse_lines(lines, module_loc):
     except StopIteration:
         return parsed
 
+
+def compiler_fingerprint():
+    ''' changes whenever the compiler itself does, so caches made by another version are ignored '''
+    if compiler_fingerprint.value is None:
+        digest = hashlib.sha256()
+        for name in 'compiler.py', 'commands.py', 'exceptions.py':
+            with open(os.path.join(os.path.dirname(__file__), name), 'rb') as f:
+                digest.update(f.read())
+        compiler_fingerprint.value = digest.hexdigest()
+    return compiler_fingerprint.value
+compiler_fingerprint.value = None
+
+def lines_digest(lines, *extras):
+    return hashlib.sha256(repr((compiler_fingerprint(), *extras, lines)).encode('utf-8')).hexdigest()
+
+def write_atomically(filename, data):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, filename)
+
+def touch_cached(filename):
+    ''' mark a cache entry as just used, so it's the last to be pruned '''
+    try:
+        os.utime(filename)
+    except OSError:
+        ...
+
+class ParseCache:
+    ''' Parsed modules, pickled in 'folder' and keyed by the module location and the hash of its lines '''
+    def __init__(self, folder):
+        self.folder = folder
+        self.hits = self.misses = 0
+        super().__init__()
+
+    def parse_lines(self, lines, module_loc):
+        lines = list(lines)
+        digest = lines_digest(lines, module_loc)
+        filename = os.path.join(self.folder, digest[:2], digest + '.pickle')
+        try:
+            with open(filename, 'rb') as f:
+                parsed = pickle.load(f)
+        except FileNotFoundError:
+            ...
+        except Exception as exc:
+            warn_print(f"Warning: ignoring the corrupted parse cache file {filename} ({exc!r})", file=stderr)
+        else:
+            self.hits += 1
+            touch_cached(filename)
+            return parsed
+
+        self.misses += 1
+        parsed = parse_lines(lines, module_loc)
+        try:
+            write_atomically(filename, pickle.dumps(parsed))
+        except OSError as exc:
+            warn_print(f"Warning: couldn't write to the parse cache ({exc})", file=stderr)
+        return parsed
+
+
+# decorators that only wrap the function, so the definition can still be dropped if it's never used
+PURE_DECORATORS = {'listify', 'memoize', 'lru_cache', 'functools.lru_cache', 'cache', 'functools.cache'}
+
+# if any of these are reachable, any name could be looked up, so nothing can be dropped
+DYNAMIC_NAMES = {'globals', 'locals', 'vars', 'eval', 'exec', '__import__'}
+
+def _dotted_name(node):
+    if isinstance(node, ast.Call): node = node.func
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name): return '.'.join([node.id, *reversed(parts)])
+
+def _referenced_names(node):
+    # conservative: attribute names count too, since those can't be told apart from globals here
+    names = set()
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Name):
+            names.add(sub.id)
+        elif isinstance(sub, ast.Attribute):
+            names.add(sub.attr)
+        elif isinstance(sub, (ast.Global, ast.Nonlocal)):
+            names.update(sub.names)
+    return names
+
+def tree_shake(lines, label=None):
+    """Drop the top-level functions and classes that are never referenced, even indirectly.
+
+    Everything else (assignments, calls, decorated definitions, etc.) is assumed to be used. Returns the
+    remaining lines, or the lines themselves if the program can't be parsed or looks names up dynamically.
+    """
+    # the line numbers of the tree must be the indices of the lines
+    if any('\r' in line or '\n' in line for line in lines): return lines
+    try:
+        tree = ast.parse('\n'.join(lines))
+    except SyntaxError as exc:
+        warn_print(f"[{label}] Warning: not tree-shaking, since the kompiled program can't be parsed: {exc}", file=stderr)
+        return lines
+
+    definitions = {}
+    used = set()
+    for node in tree.body:
+        if (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and
+                all(_dotted_name(decorator) in PURE_DECORATORS for decorator in node.decorator_list)):
+            definitions.setdefault(node.name, []).append(node)
+        else:
+            used |= _referenced_names(node)
+
+    reachable = set()
+    frontier = used & definitions.keys()
+    while frontier:
+        reachable |= frontier
+        refs = {ref for name in frontier for node in definitions[name] for ref in _referenced_names(node)}
+        used |= refs
+        frontier = (refs & definitions.keys()) - reachable
+
+    if used & DYNAMIC_NAMES:
+        info_print(f"[{label}] Not tree-shaking, since the program uses {', '.join(sorted(used & DYNAMIC_NAMES))}")
+        return lines
+
+    dropped = set()
+    for name in definitions.keys() - reachable:
+        for node in definitions[name]:
+            start = min([node.lineno, *(decorator.lineno for decorator in node.decorator_list)])
+            dropped.update(range(start - 1, node.end_lineno))
+
+    kept = [line for index, line in enumerate(lines) if index not in dropped]
+    total = sum(len(line) + 1 for line in lines)
+    saved = total - sum(len(line) + 1 for line in kept)
+    info_print(f"[{label}] Tree-shaking dropped {len(definitions.keys() - reachable)} unused definition(s), "
+               f"saving {saved} bytes ({saved / total if total else 0:.1%})")
+    return kept
+
 add_context(strong={
-        'parse_lines': (lambda context: parse_lines),
+        'parse_lines': (lambda context: context['parse_cache'].parse_lines if context.get('parse_cache') else parse_lines),
     }, weak={
+        'parse_cache': None,
         'write': True,
         'shift_left': False,
         'compress': False,
+        'tree_shake': False,
     }, copy={
         'write',
     })
@@ -164,14 +316,18 @@ def compile_lines(lines, **context):
 
 
     def get_raw_lines():
-        for lcontext, line in parse_lines(lines, context.get('module_id')).compile(context):
-            if lcontext['write']:
-                if context['shift_left']:
-                    tabs = (len(line) - len(line.lstrip(' '))) // 4
-                    line = '\t'*tabs + line.lstrip(' ')
-                yield line
+        raw_lines = [line for lcontext, line in context['parse_lines'](lines, context.get('module_id')).compile(context)
+                     if lcontext['write']]
+        if context['tree_shake']:
+            raw_lines = tree_shake(raw_lines, label=context.get('module_id'))
+        for line in raw_lines:
+            if context['shift_left']:
+                tabs = (len(line) - len(line.lstrip(' '))) // 4
+                line = '\t'*tabs + line.lstrip(' ')
+            yield line
 
 
+    uniquify_prefix = '__BLACK_MAGIC_UNIQUIFY'
     uniquify_re = re.compile(r'__BLACK_MAGIC_UNIQUIFY(?:_\d+)+__')
     def get_lines():
         """Replace __BLACK_MAGIC_UNIQUIFY*__ tokens with unique shorter tokens.
@@ -185,37 +341,23 @@ def compile_lines(lines, **context):
         lines = [*get_raw_lines()]
         assert all(isinstance(line, str) for line in lines)
 
-        def all_substrings_shortlex(lines=[*lines]):
-            yield ''
-            for l in range(1, sum(map(len, lines))):
-                for line in lines:
-                    for i in range(len(line) - l + 1):
-                        yield line[i:i+l]
-
-        all_substrings_shortlex = all_substrings_shortlex()
-        subs = set()
-        def is_substring(s):
-            while True:
-                sub = next(all_substrings_shortlex)
-                subs.add(sub)
-                if len(sub) > len(s): break
-            return s in subs
-
+        # tokens don't contain newlines, so this is the same as checking each line
+        text = '\n'.join(lines)
         tokens = (f"BM{i}" for i in count())
 
         def new_token():
             while True:
                 token = next(tokens)
-                if not is_substring(token): return token
+                if token not in text: return token
                 info_print("Skipping", token)
 
-        all_reps = {to_rep for line in lines for to_rep in uniquify_re.findall(line)}
-        all_reps = {to_rep: new_token() for to_rep in all_reps}
+        all_reps = {to_rep for to_rep in uniquify_re.findall(text)}
+        all_reps = {to_rep: new_token() for to_rep in sorted(all_reps)}
         info_print("Replacing", len(all_reps), "'uniquify tokens'")
 
         for line in lines:
-            for to_rep in {*uniquify_re.findall(line)}:
-                line = line.replace(to_rep, all_reps[to_rep])
+            if uniquify_prefix in line:
+                line = uniquify_re.sub(lambda match: all_reps[match.group()], line)
             yield line
 
     if context['compress']:
@@ -1,4 +1,4 @@
-import argparse, contextlib, functools, os, os.path, sys, traceback
+import argparse, contextlib, functools, json, os, os.path, sys, traceback
 
 from .utils import * ### @import
 from .utils.streams import * ### @import
@@ -427,9 +427,9 @@ def _check_dom(check, *, title='', log_file=sys.stdout, help=None, exit_after=Tr
 def _check_local(check, *, title='', log_file=sys.stdout, help=None, force_verbose=False, exit_after=True):
     desc = help or CURR_PLATFORM + (' checker for the problem' + (f' "{title}"' if title else ''))
     parser = argparse.ArgumentParser(description=desc)
-    parser.add_argument('input_path', help='input file path')
-    parser.add_argument('output_path', help="contestant's file path")
-    parser.add_argument('judge_path', help='judge auxiliary data file path')
+    parser.add_argument('input_path', nargs='?', help='input file path')
+    parser.add_argument('output_path', nargs='?', help="contestant's file path")
+    parser.add_argument('judge_path', nargs='?', help='judge auxiliary data file path')
     parser.add_argument('result_file', nargs='?', help='target file to contain the verdict in XML format')
     parser.add_argument('extra_args', nargs='*', help='extra arguments that will be ignored')
     parser.add_argument('-C', '--code', default='n/a', help='path to the solution used')
@@ -439,11 +439,22 @@ def _check_local(check, *, title='', log_file=sys.stdout, help=None, force_verbo
     else:
         parser.add_argument('-v', '--verbose', action='store_true', help='print more details')
     parser.add_argument('-i', '--identical', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--batch', action='store_true',
+            help='read JSON requests from stdin, one per line, and print a JSON verdict line for each')
     args = parser.parse_args()
 
     verbose = force_verbose or (not args.quiet if CURR_PLATFORM == 'pc2' else args.verbose)
     tc_id = args.tc_id or ''
 
+    if args.batch:
+        _check_batch(check, sys.stdin, sys.stdout, verbose=verbose)
+        if exit_after: exit(0)
+        return 0
+
+    # the file paths are only optional in batch mode
+    if args.judge_path is None:
+        parser.error('the following arguments are required: input_path, output_path, judge_path')
+
     if verbose:
         if args.extra_args:
             warn_print(f"{tc_id:>3} [C] Received extra args {args.extra_args}... ignoring them.", file=log_file)
@@ -484,6 +495,32 @@ def _check_local(check, *, title='', log_file=sys.stdout, help=None, force_verbo
 
     return exit_code
 
+def _check_batch(check, infile, outfile, *, verbose=False, log_file=sys.stderr):
+    # each request has the paths "input", "output" and "judge", and optionally "result_file", "code" and "tc_id",
+    # like the command line arguments. One JSON line per request, flushed right away since the other end waits for it.
+    # The first line says we're ready
+    print(json.dumps({'ready': True}), file=outfile, flush=True)
+    for line in iter(infile.readline, ''):
+        if not line.strip(): continue
+        request = json.loads(line)
+        tc_id = request.get('tc_id')
+        # keep stray prints away from the verdicts
+        with contextlib.redirect_stdout(log_file):
+            verdict, score, message = _check_generic(check,
+                input=request['input'],
+                output=request['output'],
+                judge=request['judge'],
+                code_path=request.get('code', 'n/a'),
+                tc_id=tc_id,
+                identical=False,
+                verbose=verbose,
+            )
+        print(f"{tc_id or '':>3} [C] Score={score} {verdict}", file=log_file)
+        if message and verbose: print(f"{tc_id or '':>3} [C] Message: {overflow_ell(message, 100)}", file=log_file)
+        if request.get('result_file'): write_json_verdict(verdict, message, score, request['result_file'])
+        print(json.dumps({'verdict': verdict, 'score': float(score), 'message': message, 'rcode': kg_rcode[verdict]}),
+                file=outfile, flush=True)
+
 ### @@ }
 
 
@@ -7,15 +7,21 @@ def is_exactly_equal(seq1, seq2):
 @checker(extra_chars_allowed=['input'])
 @default_score
 def check_exactly_equal(input_file, output_file, judge_file, **kwargs):
-    output_lines = list(output_file)
-    judge_lines = list(judge_file)
-    if not is_exactly_equal(output_lines, judge_lines):
+    # identical leading lines are skipped without being parsed, and we stop at the first differing line
+    skip_common_prefix(output_file, judge_file)
+    if not is_exactly_equal(output_file, judge_file):
         ### @@if format not in ('pg', 'hr', 'cms') {
         if 'output_path' in kwargs and 'judge_path' in kwargs:
             import difflib
+
+            # the diff is still taken over the whole files, so it doesn't depend on where we stopped
+            def read_lines(path):
+                with open(path) as file, InteractiveStream(file, mode=ISMode.LINES, extra_chars_allowed=True) as stream:
+                    return [*stream]
+
             diff = '\n'.join(difflib.unified_diff(
-                output_lines,
-                judge_lines,
+                read_lines(kwargs['output_path']),
+                read_lines(kwargs['judge_path']),
                 fromfile='Output File',
                 tofile='Judge File',
             ))
@@ -3,25 +3,41 @@
 
 # Don't edit this file. Edit real_abs_rel_template.py instead, and then run _real_check_gen.py
 
-from itertools import zip_longest
 from decimal import Decimal, InvalidOperation
 from kg.checkers import * ### @import
 
 EPS = Decimal('1e-12') 
 
 EPS *= 1+Decimal('1e-5') # add some leniency
+
+# Two tiers: the error is first computed with floats. This is off from the exact one by less than
+# (|f1| + |f2|) * 2**-50, so exact Decimals are only needed when that isn't enough to tell whether
+# the error is within EPS, or whether it's a new worst.
+SAFE = 1 - 2**-40
+
 @checker(extra_chars_allowed=['input'])
 @default_score
 def check_real(input_file, output_file, judge_file, **kwargs):
     worst = 0
+    safe = 0.0 # float errors certainly below this are neither wrong nor a new worst
     try:
-        for line1, line2 in zip_longest(output_file, judge_file):
-            if (line1 is None) != (line2 is None): raise Wrong("Unequal number of lines")
+        # identical lines have no error, so skip them without parsing
+        skip_common_prefix(output_file, judge_file)
+        for line1 in output_file:
+            line2 = next(judge_file, None)
+            if line2 is None: raise Wrong("Unequal number of lines")
             p1 = line1.rstrip().split(" ")
             p2 = line2.rstrip().split(" ")
             if len(p1) != len(p2): raise Wrong("Incorrect number of values in line")
             for v1, v2 in zip(p1, p2):
                 if v1 != v2:
+                    try:
+                        f1, f2 = float(v1), float(v2)
+                    except ValueError:
+                        ...
+                    else:
+                        a1, a2 = abs(f1), abs(f2)
+                        if abs(f1 - f2) + (a1 + a2) * 2**-49 + 1e-300 < safe: continue
                     try:
                         v1, v2 = Decimal(v1), Decimal(v2)
                     except InvalidOperation as ex:
@@ -29,8 +45,10 @@ def check_real(input_file, output_file, judge_file, **kwargs):
                     else:
                         err = abs_error(v1, v2) 
                         worst = max(worst, err)
+                        safe = min(float(EPS), float(worst)) * SAFE
                         if err > EPS:
                             raise Wrong(f"Not within the required precision: got error {err}")
+        if next(judge_file, None) is not None: raise Wrong("Unequal number of lines")
     finally:
         ...
         print('Worst error found:', worst) ### @if format not in ('pg', 'hr', 'cms')
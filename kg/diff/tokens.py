@@ -7,6 +7,8 @@ def is_exactly_equal(seq1, seq2):
 @checker('tokens', extra_chars_allowed=['input'])
 @default_score
 def check_tokens(input_file, output_file, judge_file, **kwargs):
+    # identical leading tokens are skipped without being parsed, and we stop at the first differing token
+    skip_common_prefix(output_file, judge_file, ends={SPACE, EOLN})
     if not is_exactly_equal(output_file, judge_file):
         raise Wrong("Incorrect.")
 
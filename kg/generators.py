@@ -1,4 +1,5 @@
-import functools, io, random, sys
+import functools, io, queue, random, sys, threading
+import hashlib, inspect, itertools, multiprocessing, pathlib, pickle, shutil, sysconfig, types ### @rem
 
 from .utils import * ### @import
 
@@ -24,6 +25,10 @@ class KGRandom(random.Random):
         return x
     shuff = shuffled
 
+    def lazy_seq(self, n, f):
+        ''' n values, each made by f(rand), but only when they're iterated through; see LazySeq ''' ### @rem
+        return LazySeq(n, f, self.getrandbits(64))
+
     def randinterval(self, a, b):
         while True:
             x = self.randint(a, b)
@@ -44,7 +49,7 @@ class KGRandom(random.Random):
             res.append((a if self.randrange(len(a) + len(b)) < len(a) else b).pop())
         return res
 
-    def randdistrib(self, total, count, *, min_=0, max_=None, skew=1): ### @@ rem {
+    def randdistrib(self, total, count, *, min_=0, max_=None, skew=1, version=1): ### @@ rem {
         '''
         Generates a random partition of a number into given number of parts.
 
@@ -53,10 +58,16 @@ class KGRandom(random.Random):
         min_: minimum size of each part
         max_: maximum size of each part
         skew: how "skewed" the partition is; higher skew means more variance
+        version: 1 (the default) always gives the same partitions as before, but takes O(total) time.
+            2 takes O(count log count) time however big the total is, but gives different partitions.
 
-        Reasonable values for skew are from 1 to 3*count.
+        Reasonable values for skew are from 1 to 3*count. In version 2, skew can be any positive number; with
+        skew=1, the part sizes are spread like in a uniformly random partition (when the total is much bigger than
+        the count), and less than 1 makes them closer to each other.
         '''
         ### @@ }
+        if version not in {1, 2}:
+            raise ValueError(f"Unknown randdistrib version: {version}")
         if min_*count > total:
             raise ValueError(f"The total must be at least {min_}*{count}={min_*count} when count={count} and min_={min_}")
         if max_ is not None and max_*count < total:
@@ -65,6 +76,8 @@ class KGRandom(random.Random):
             raise ValueError("The skew has to be at least 1.")
         if max_ is None:
             max_ = total
+        if version == 2:
+            return self._randdistrib2(total, count, min_, max_, skew)
         dist = [min_]*count
 
         inds = self.shuffled(range(count))
@@ -87,6 +100,45 @@ class KGRandom(random.Random):
 
         return dist
 
+    def _randdistrib2(self, total, count, min_, max_, skew):
+        # random proportions (Dirichlet, with concentration 1/skew) of what's left after min_, with the parts that
+        # would go over max_ capped and the rest divided among the others. All in integers, so it's exact.
+        if not count:
+            if total: raise ValueError("The count must be positive if the total is.")
+            return []
+        extra = total - min_*count
+        cap = max_ - min_
+        gammas = [self.gammavariate(1 / skew, 1) for it in range(count)]
+        top = max(gammas) or 1.0
+        weights = [int(gamma / top * (1 << 62)) + 1 for gamma in gammas]
+        order = sorted(range(count), key=weights.__getitem__, reverse=True)
+
+        # the parts with the biggest weights are capped, until the biggest one left fits ### @rem
+        rest = sum(weights)
+        capped = 0
+        while capped < count and (extra - capped*cap) * weights[order[capped]] > cap * rest:
+            rest -= weights[order[capped]]
+            capped += 1
+        left = extra - capped*cap
+
+        dist = [min_]*count
+        for idx in order[:capped]: dist[idx] = max_
+
+        # round the shares randomly, but so each part gets its share on average: the remainders add up to a ### @rem
+        # multiple of rest, and every (point + k*rest) in them gives one more to the part whose remainder it's in ### @rem
+        point = self.randrange(rest) if rest else 0
+        before = 0
+        for idx in self.shuffled(order[capped:]):
+            share, rem = divmod(left * weights[idx], rest)
+            after = before + rem
+            dist[idx] += share + max(0, (after - point + rest - 1) // rest) - max(0, (before - point + rest - 1) // rest)
+            before = after
+
+        assert sum(dist) == total
+        assert min_ <= min(dist) <= max(dist) <= max_
+
+        return dist
+
     @listify
     def randpartition(self, total, min_=1, skew=2): ### @@ rem {
         '''
@@ -120,6 +172,28 @@ class KGRandom(random.Random):
 
 
 
+class LazySeq: ### @@ rem {
+    '''
+    A sequence of n values, each made by f(rand), which are only made while it's being iterated through, so the
+    values are never all in memory. Every iteration makes the same values, from its own random generator; so a
+    case can have these as parts (with len) and be formatted and validated in a single pass.
+    '''
+    ### @@ }
+    def __init__(self, n, f, seed):
+        self.n = n
+        self.f = f
+        self.seed = seed
+        super().__init__()
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        f = self.f
+        rand = KGRandom(self.seed)
+        for _ in range(self.n): yield f(rand)
+
+
 # some hash on a sequence of integers. Don't change this! This is used by seed computation based on command line args. ### @rem
 _pmod = 2013265921
 _pbase = 1340157138
@@ -139,17 +213,236 @@ def _make_seed(args):
     return _chash_seq(_chash_seq(map(ord, arg)) for arg in args) ^ 0xBEABDEEF
 
 
+class _ChunkReader(io.TextIOBase):
+    ''' Reads the chunks put in a queue, until None '''
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._chunk = ''
+        self._pos = 0
+        self.eof = False
+        super().__init__()
+
+    def readable(self): return True
+
+    def _fill(self):
+        while self._pos == len(self._chunk) and not self.eof:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self.eof = True
+            else:
+                self._chunk, self._pos = chunk, 0
+        return self._pos < len(self._chunk)
+
+    def _take(self, end):
+        data = self._chunk[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def read(self, size=-1):
+        parts = []
+        left = -1 if size is None else size # negative means everything
+        while left and self._fill():
+            parts.append(self._take(len(self._chunk) if left < 0 else self._pos + left))
+            if left > 0: left -= len(parts[-1])
+        return ''.join(parts)
+
+    def readline(self, size=-1):
+        parts = []
+        left = -1 if size is None else size
+        while left and self._fill():
+            end = self._chunk.find(EOLN, self._pos) + 1 or len(self._chunk)
+            parts.append(self._take(end if left < 0 else min(end, self._pos + left)))
+            if left > 0: left -= len(parts[-1])
+            if parts[-1].endswith(EOLN): break
+        return ''.join(parts)
+
+
+class _ValidatingWriter(io.TextIOBase):
+    '''
+    Writes to 'file', while 'validate' reads the same text in another thread, through a bounded queue.
+    So the case is validated while it's being written, and is never all in memory.
+    '''
+    _CHUNK = 1 << 16
+    def __init__(self, file, validate, *, max_chunks=16):
+        self._file = file
+        self._pending = []
+        self._size = 0
+        self._chunks = queue.Queue(max_chunks)
+        self._error = None
+        self._thread = threading.Thread(target=self._validate, args=(validate,), daemon=True)
+        super().__init__()
+        self._thread.start()
+
+    def _validate(self, validate):
+        reader = _ChunkReader(self._chunks)
+        try:
+            validate(reader)
+        except BaseException as exc:
+            self._error = exc
+        # drop whatever wasn't read, so that writing never blocks ### @rem
+        while not reader.eof: reader.eof = self._chunks.get() is None
+
+    def writable(self): return True
+
+    def write(self, s):
+        if self._error is not None: raise self._error
+        self._file.write(s)
+        self._pending.append(s)
+        self._size += len(s)
+        if self._size >= self._CHUNK: self._send()
+        return len(s)
+
+    def _send(self):
+        self._chunks.put(''.join(self._pending))
+        self._pending = []
+        self._size = 0
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        # the formatter closes its stream when it's done, but 'file' is left open
+        if self.closed: return
+        try:
+            if self._pending: self._send()
+        finally:
+            self._chunks.put(None)
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self._thread.join()
+        if exc_type is None and self._error is not None: raise self._error
+
+
 def _write_with_validate(format_case, file, case, *, validate=None):
     if validate is not None:
-        tfile = io.StringIO()
-        format_case(tfile, case)
-        tfile.seek(0) # reset the StringIO
-        validate(tfile)
-        file.write(tfile.getvalue())
+        with _ValidatingWriter(file, validate) as tfile:
+            format_case(tfile, case)
     else:
         format_case(file, case)
 
 
+### @@ rem {
+# The groups of a DistribCase can be kept across runs (keyed by the generator's source, its arguments and its seed),
+# so that a generator that writes only the group at some index doesn't run 'make' and 'distribute' again each time.
+# Each group has its own file, with each case stored as where its function is, its seed and its arguments. So this
+# only works if the functions can be found again, and don't use the variables of the functions around them (which
+# is what the arguments of new_case are for); otherwise, the groups are just made again. The cache is off unless
+# KG_GENERATOR_CACHE is set, and the least recently used groups are deleted once it gets bigger than
+# KG_GENERATOR_CACHE_SIZE megabytes.
+
+DEFAULT_GENERATOR_CACHE_SIZE = 500
+
+def _generator_cache_folder():
+    ''' KG_GENERATOR_CACHE ("on" means the user's cache folder), or None if it's unset or "off" '''
+    folder = os.environ.get('KG_GENERATOR_CACHE')
+    if not folder or folder == 'off': return None
+    if folder != 'on': return folder
+    return os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'kompgen', 'generators')
+
+def _generator_cache_size():
+    return int(float(os.environ.get('KG_GENERATOR_CACHE_SIZE') or DEFAULT_GENERATOR_CACHE_SIZE) * 10**6)
+
+def _kg_digest():
+    ''' changes whenever any of kg's own sources do, so groups stored by another version are ignored '''
+    if _kg_digest.value is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for file in sorted(pathlib.Path(root).rglob('*.py')):
+            with open(file, 'rb') as f:
+                digest.update(str(file.relative_to(root)).encode() + b'\0' + hashlib.sha256(f.read()).digest())
+        _kg_digest.value = digest.hexdigest()
+    return _kg_digest.value
+_kg_digest.value = None
+
+def _reachable_files(roots):
+    ''' the source files of the modules that the globals of roots lead to, directly or through other such modules
+    (mapped to None), except the standard library's and kg's. Installed packages are mapped to their version. '''
+    paths = sysconfig.get_paths()
+    stdlib = {os.path.abspath(paths[key]) for key in ('stdlib', 'platstdlib')}
+    installed = {os.path.abspath(paths[key]) for key in ('purelib', 'platlib')}
+    kg_root = os.path.dirname(os.path.abspath(__file__))  # kg has its own digest
+    def under(file, folders): return any(os.path.commonpath([file, folder]) == folder for folder in folders)
+    files = {}
+    seen = set()
+    def visit(namespace):
+        for value in list(namespace.values()):
+            if isinstance(value, types.ModuleType):
+                module = value
+            elif isinstance(value, (types.FunctionType, type)):
+                module = sys.modules.get(value.__module__)
+            else:
+                continue
+            if module is None or module.__name__ in seen: continue
+            seen.add(module.__name__)
+            file = getattr(module, '__file__', None)
+            if not file: continue  # built in
+            file = os.path.abspath(file)
+            if under(file, stdlib | {kg_root}): continue
+            if under(file, installed):
+                top = sys.modules.get(module.__name__.partition('.')[0], module)
+                files[top.__name__] = str(getattr(top, '__version__', None))
+                continue
+            files[file] = None
+            visit(vars(module))
+    for root in roots: visit(root.__globals__)
+    return files
+
+def _source_digest(roots):
+    # what the groups could depend on: kg itself, everything in the generator's folder, and everything else
+    # the generator uses
+    files = _reachable_files(roots)
+    folders = {os.path.dirname(os.path.abspath(sys.modules[root.__module__].__file__)) for root in roots}
+    for module in list(sys.modules.values()):
+        file = getattr(module, '__file__', None)
+        if file and os.path.dirname(os.path.abspath(file)) in folders: files.setdefault(os.path.abspath(file), None)
+    digest = hashlib.sha256(_kg_digest().encode())
+    for file, version in sorted(files.items()):
+        if version is not None:
+            digest.update(f'{file}=={version}'.encode() + b'\0')
+            continue
+        with open(file, 'rb') as f:
+            digest.update(file.encode() + b'\0' + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def _code_path(code, root):
+    # the indices in co_consts that lead from root to code
+    if code is root: return ()
+    for index, const in enumerate(root.co_consts):
+        if isinstance(const, types.CodeType):
+            path = _code_path(code, const)
+            if path is not None: return (index, *path)
+
+def _case_location(f, roots):
+    ''' where f can be found again, or None '''
+    if not isinstance(f, types.FunctionType) or f.__closure__: return None
+    if '<locals>' not in f.__qualname__:
+        if f.__module__ in {root.__module__ for root in roots}:
+            try:
+                if functools.reduce(getattr, f.__qualname__.split('.'), sys.modules[f.__module__]) is f:
+                    return 'global', f.__module__, f.__qualname__
+            except AttributeError:
+                ...
+        return None
+    for index, root in enumerate(roots):
+        if f.__globals__ is root.__globals__:
+            path = _code_path(f.__code__, root.__code__)
+            if path is not None: return 'local', index, path
+
+def _cached_casemaker(location, seed, fwd_args, defaults, kwdefaults, roots):
+    if location[0] == 'global':
+        f = functools.reduce(getattr, location[2].split('.'), sys.modules[location[1]])
+    else:
+        root = roots[location[1]]
+        code = root.__code__
+        for index in location[2]: code = code.co_consts[index]
+        f = types.FunctionType(code, root.__globals__, code.co_name, defaults)
+        f.__kwdefaults__ = kwdefaults
+    return lambda: f(KGRandom(seed), *fwd_args)
+### @@ }
+
 class DistribCase:
     def __init__(self, make, distribute, *, single_case=False):
         self.make = make
@@ -166,6 +459,7 @@ class DistribCase:
                 # now new_f is deterministic ### @rem
                 def new_f():
                     return f(KGRandom(nrand_seed), *fwd_args)
+                new_f._kg_case = f, nrand_seed, fwd_args ### @rem
                 casemakers.append(new_f)
                 mnew_case.total_cases += 1
                 # forward any info ### @rem
@@ -183,6 +477,7 @@ class DistribCase:
                 # now new_f is deterministic ### @rem
                 def new_f():
                     return f(KGRandom(nrand_seed), *fwd_args)
+                new_f._kg_case = f, nrand_seed, fwd_args ### @rem
                 for name, value in info.items(): # forward any info
                     setattr(new_f, name, value)
                 return new_f
@@ -197,11 +492,87 @@ class DistribCase:
 
     def __getitem__(self, index):
         def get(rand, *args):
+            ### @@ rem {
+            folder = self._cache_folder(rand, args)
+            cached = self._load_group(folder, index) if folder else None
+            if cached:
+                count, group = cached
+                print(f"    [G] Generating file index {index} of {count} (cached)", file=sys.stderr)
+                if not (0 <= index < count): raise GeneratorError(f"Invalid index: {index} of {count} groups")
+                return self.realize(group)
+            ### @@ }
             groups = self.lazy(rand, *args)
+            if folder: self._save_groups(folder, groups) ### @rem
             print(f"    [G] Generating file index {index} of {len(groups)}", file=sys.stderr) ### @rem
             if not (0 <= index < len(groups)): raise GeneratorError(f"Invalid index: {index} of {len(groups)} groups")
             return self.realize(groups[index])
         return get
+    ### @@ rem {
+
+    def _roots(self):
+        return [inspect.unwrap(self.make), inspect.unwrap(self.distribute)]
+
+    def _cache_folder(self, rand, args):
+        cache = _generator_cache_folder()
+        if not cache: return None
+        try:
+            roots = self._roots()
+            key = hashlib.sha256(pickle.dumps((_source_digest(roots),
+                                               self.single_case, args, rand.getstate()))).hexdigest()
+        except (AttributeError, KeyError, OSError, TypeError, pickle.PicklingError):
+            return None  # e.g., the generator isn't in a file
+        return os.path.join(cache, key[:2], key)
+
+    def _load_group(self, folder, index):
+        ''' (the number of groups, the group at index) if they're in the cache, otherwise None '''
+        try:
+            with open(os.path.join(folder, 'count')) as f:
+                count = int(f.read())
+            if not (0 <= index < count): return count, None
+            roots = self._roots()
+            with open(os.path.join(folder, f'{index}.pickle'), 'rb') as f:
+                group = [_cached_casemaker(*entry, roots) for entry in pickle.load(f)]
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            warn_print(f"Warning: ignoring the corrupted generator cache {folder} ({exc!r})", file=sys.stderr)
+            return None
+        try:
+            os.utime(folder)  # just used, so it's the last to be pruned
+        except OSError:
+            ...
+        return count, group[0] if self.single_case else group
+
+    def _save_groups(self, folder, groups):
+        roots = self._roots()
+        def entry(make):
+            f, seed, fwd_args = make._kg_case
+            location = _case_location(f, roots)
+            if location is None: raise TypeError(f"{f!r} can't be found again")
+            defaults, kwdefaults = (None, None) if location[0] == 'global' else (f.__defaults__, f.__kwdefaults__)
+            return location, seed, fwd_args, defaults, kwdefaults
+        try:
+            data = [pickle.dumps([entry(make) for make in ([group] if self.single_case else group)]) for group in groups]
+        except (AttributeError, TypeError, pickle.PicklingError):
+            return  # these groups can't be stored
+        # written to a temporary folder first, so that other runs only ever see all the groups (or none)
+        tmp = f'{folder}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(tmp)
+            for index, pickled in enumerate(data):
+                with open(os.path.join(tmp, f'{index}.pickle'), 'wb') as f:
+                    f.write(pickled)
+            with open(os.path.join(tmp, 'count'), 'w') as f:
+                f.write(str(len(data)))
+            os.rename(tmp, folder)
+        except OSError as exc:
+            if not os.path.isdir(folder):
+                warn_print(f"Warning: couldn't write to the generator cache ({exc})", file=sys.stderr)
+        else:
+            prune_cache(os.path.dirname(os.path.dirname(folder)), _generator_cache_size())
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    ### @@ }
 
 # TODO replace with write_to_file(format_case, make, *args, file=stdout, validate=None) (maybe? maybe not?) ### @rem
 def write_to_file(format_case, make, args, file, *, validate=None): ### @@ rem {
@@ -231,7 +602,37 @@ def write_to_file(format_case, make, args, file, *, validate=None): ### @@ rem {
     _write_with_validate(format_case, file, case, validate=validate)
 
 
-def write_to_files(format_case, make, filenames, *args, validate=None):
+### @@ rem {
+def _generator_workers():
+    ''' KG_GENERATOR_WORKERS is the number of processes that write the files of a DistribCase (default 1) '''
+    workers = os.environ.get('KG_GENERATOR_WORKERS') or '1'
+    try:
+        return max(1, os.cpu_count() or 1) if workers == 'auto' else int(workers)
+    except ValueError as exc:
+        raise GeneratorError(f"Invalid KG_GENERATOR_WORKERS: {workers!r}") from exc
+
+# what the forked workers need. The case makers are closures, so they're inherited instead of pickled.
+_parallel_job = None
+
+def _write_group(index):
+    format_case, make, groups, filenames, validate = _parallel_job
+    with open(filenames[index], 'w') as file:
+        _write_with_validate(format_case, file, make.realize(groups[index]), validate=validate)
+
+def _write_groups_in_parallel(format_case, make, groups, filenames, *, validate=None, workers):
+    global _parallel_job
+    # every group is made with its own seed (see DistribCase.lazy), so the files are the same as when they're
+    # written one after another, as long as the case makers don't share state
+    _parallel_job = format_case, make, groups, filenames, validate
+    try:
+        with multiprocessing.get_context('fork').Pool(max(1, min(workers, len(groups)))) as pool:
+            for filename, _ in zip(filenames, pool.imap(_write_group, range(len(groups)))):
+                print("    [G] Generator wrote to", filename, file=sys.stderr)
+    finally:
+        _parallel_job = None
+### @@ }
+
+def write_to_files(format_case, make, filenames, *args, validate=None, workers=None):
     try:
         make, distribute = make
     except (ValueError, TypeError):
@@ -248,6 +649,20 @@ def write_to_files(format_case, make, filenames, *args, validate=None):
     if isinstance(filenames, str):
         filenames = file_sequence(filenames, mktemp=True)
     filenames = iter(filenames)
+
+    ### @@ rem {
+    # only the files of a DistribCase can be written in parallel, since a plain 'make' shares 'rand' among the cases
+    if workers is None: workers = _generator_workers()
+    if workers > 1 and isinstance(make, DistribCase) and 'fork' in multiprocessing.get_all_start_methods():
+        groups = make.lazy(rand, *args)
+        names = [*itertools.islice(filenames, len(groups))]
+        if len(names) < len(groups):
+            raise GeneratorError(f"Not enough files! Need more than {len(names)}")
+        _write_groups_in_parallel(format_case, make, groups, names, validate=validate, workers=workers)
+        print("    [G] Generated", len(groups), "files", file=sys.stderr)
+        return
+
+    ### @@ }
     filecount = 0
     for index, case in enumerate(make(rand, *args)):
         try:
@@ -1,4 +1,5 @@
 import argparse, contextlib, functools, io, json, sys, traceback
+import bisect, os, time ### @rem
 
 from .utils import * ### @import
 from .utils.streams import * ### @import
@@ -17,18 +18,20 @@ class Interactor:
                 exc=lambda message: Fail(f'[input] {message}'),
                 **self.stream_settings['input'],
             ))
-            # enable line buffering for all writers
-            for user in users:
-                user.writer.reconfigure(line_buffering=True)
+            # everything written to any user is flushed before reading from any user (by default)
+            flush_group = FlushGroup()
             user_ss = [
                 stack.enter_context(InteractiveStream(
                     user.reader,
                     user.writer,
                     mode=ISMode(self.from_user_mode),
                     exc=lambda message: ParseError(f'[user {userid}] {message}'),
+                    flush=self.flush,
+                    flush_group=flush_group,
                     **self.stream_settings['user'],
                 )) for userid, user in enumerate(users)
             ]
+            stack.callback(flush_group.flush)
             output_s = stack.enter_context(InteractiveStream(
                 None,
                 output_file,
@@ -52,6 +55,9 @@ class Interactor:
         if len(args) != 3: raise ValueError(f"Invalid args: {args}")
         self.input_mode, self.from_user_mode, self.judge_mode = args
 
+        # when to flush what's written to the users ### @rem
+        self.flush = FlushPolicy(kwargs.pop('flush', FlushPolicy.BEFORE_READ))
+
         valid_fields = {'input', 'user', 'judge'}
         def to_fields(arg):
             value = kwargs.pop(arg, False)
@@ -194,7 +200,75 @@ def interactor_iterate_single(it, *, cas=0):
 
 
 
-def _interact_generic(interactor, input, *users, output=None, judge=None, **kwargs):
+### @@ rem {
+class InteractionProfile:
+    # round trips are bucketed by these upper bounds (in seconds), the last bucket being unbounded
+    BOUNDS = [1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1, 3e-1, 1.0]
+
+    def __init__(self):
+        self.waiting = 0.0 # blocked reading from the users, i.e., waiting for them
+        self.writing = 0.0 # writing (and flushing) to the users
+        self.latencies = []
+        self._sent = {}
+        self.start = self.end = time.perf_counter()
+        super().__init__()
+
+    def timed_read(self, userid, read, *args):
+        start = time.perf_counter()
+        data = read(*args)
+        end = time.perf_counter()
+        self.waiting += end - start
+        # a read after a write to the same user completes a query
+        if data and userid in self._sent: self.latencies.append(end - self._sent.pop(userid))
+        return data
+
+    def timed_write(self, userid, write, *args):
+        # the user may already be answering while this returns, so the query counts as sent when this starts
+        self._sent[userid] = start = time.perf_counter()
+        res = write(*args)
+        self.writing += time.perf_counter() - start
+        return res
+
+    def wrap(self, userid, file):
+        return _ProfiledIO(file, self, userid)
+
+    def dump(self):
+        lats = sorted(self.latencies)
+        def pct(p): return lats[min(len(lats) - 1, int(p * len(lats)))] if lats else None
+        histogram = [0] * (len(self.BOUNDS) + 1)
+        for lat in lats: histogram[bisect.bisect_right(self.BOUNDS, lat)] += 1
+        return {
+            'queries': len(lats),
+            'wall': self.end - self.start,
+            'waiting': self.waiting,
+            'writing': self.writing,
+            'latency': {'p50': pct(.5), 'p90': pct(.9), 'p99': pct(.99), 'max': lats[-1] if lats else None,
+                        'total': sum(lats)},
+            'bounds': self.BOUNDS,
+            'histogram': histogram,
+        }
+
+
+class _ProfiledIO:
+    # times the reads and writes going through 'file'; everything else is passed through ### @rem
+    def __init__(self, file, profile, userid):
+        self._file = file
+        self._profile = profile
+        self._userid = userid
+        super().__init__()
+
+    def __getattr__(self, name): return getattr(self._file, name)
+    def read(self, *args): return self._profile.timed_read(self._userid, self._file.read, *args)
+    def readline(self, *args): return self._profile.timed_read(self._userid, self._file.readline, *args)
+    def write(self, *args): return self._profile.timed_write(self._userid, self._file.write, *args)
+    def flush(self, *args): return self._profile.timed_write(self._userid, self._file.flush, *args)
+
+    @property
+    def buffer(self): return _ProfiledIO(self._file.buffer, self._profile, self._userid)
+### @@ }
+
+
+def _interact_generic(interactor, input, *users, output=None, judge=None, profile=None, **kwargs): ### @replace 'profile=None, ', ''
     def handle(exc, verdict):
         if kwargs.get('verbose'): traceback.print_exc(limit=None) ### @replace None, -1
         return verdict, getattr(exc, 'score', 0.0), str(exc)
@@ -224,6 +298,11 @@ def _interact_generic(interactor, input, *users, output=None, judge=None, **kwar
         ### @@ }
         to_users_info = [maybe_open(to_user, 'w', buffering=1) for fr_user, to_user in users]
         fr_users_info = [maybe_open(fr_user) for fr_user, to_user in users]
+        ### @@ rem {
+        if profile:
+            fr_users_info = [(path, profile.wrap(userid, file)) for userid, (path, file) in enumerate(fr_users_info)]
+            to_users_info = [(path, profile.wrap(userid, file)) for userid, (path, file) in enumerate(to_users_info)]
+        ### @@ }
         (
             kwargs['from_user_paths'],
             kwargs['to_user_paths'],
@@ -232,9 +311,10 @@ def _interact_generic(interactor, input, *users, output=None, judge=None, **kwar
             fr_user_path,
             to_user_path,
             TextIOPair(fr_user, to_user),
-        ) for userid, ((fr_user_path, fr_user), (to_user_path, to_user)) in enumerate(zip(fr_users_info, to_users_info))))
+        ) for (fr_user_path, fr_user), (to_user_path, to_user) in zip(fr_users_info, to_users_info)))
 
         try:
+            if profile: profile.start = time.perf_counter() ### @rem
             score = interactor(input_f, *user_ios, output_file=output_f, judge_file=judge_f, **kwargs)
             if not (0.0 <= score <= 1.0):
                 raise InteractorError(f"The interactor returned an invalid score: {score!r}")
@@ -361,6 +441,12 @@ def _interact_local(interact, *, log_file=sys.stderr, force_verbose=False, exit_
     else:
         users = [(sys.stdin, sys.stdout)]
 
+    ### @@ rem {
+    # opt-in: time everything sent to and received from the users (used by 'kg test --profile-interaction')
+    profile_file = os.environ.get('KG_INTERACTION_PROFILE')
+    profile = InteractionProfile() if profile_file else None
+    ### @@ }
+
     verdict, score, message = _interact_generic(
         interact,
         args.input_path,
@@ -370,8 +456,16 @@ def _interact_local(interact, *, log_file=sys.stderr, force_verbose=False, exit_
         judge=args.judge_path,
         tc_id=args.tc_id,
         verbose=verbose,
+        profile=profile, ### @rem
     )
 
+    ### @@ rem {
+    if profile:
+        profile.end = time.perf_counter()
+        with open(profile_file, 'w') as f:
+            json.dump(profile.dump(), f)
+    ### @@ }
+
     if verbose:
         print(f"{tc_id:>3} [I] Result:  {verdict}", file=log_file)
         print(f"{tc_id:>3} [I] Score:   {score}", file=log_file)
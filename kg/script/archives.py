@@ -0,0 +1,245 @@
+from collections import deque
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import stat
+import struct
+import tarfile
+import tempfile
+import zlib
+
+from .compressed import *
+from .utils import *
+
+# Deterministic archives: members are written in the order they're added, with fixed timestamps and owners, so
+# the same files always give the same archive. Zip members are compressed in parallel (zlib releases the GIL)
+# and written out in order; tar archives are compressed as a single stream.
+
+class ArchiveError(Exception): ...
+
+ARCHIVE_KINDS = {
+    'zip': '.zip',
+    'tar': '.tar',
+    'tar.gz': '.tar.gz',
+    'tgz': '.tgz',
+    'tar.xz': '.tar.xz',
+    'tar.bz2': '.tar.bz2',
+}
+
+def archive_kind(filename):
+    for kind, ext in sorted(ARCHIVE_KINDS.items(), key=lambda item: -len(item[1])):
+        if filename.endswith(ext): return kind
+
+def parse_archive_loc(loc):
+    ''' "zip:path/to/file.zip" (or "tar.gz:...", etc.) gives (kind, path); other locations give None '''
+    kind, sep, path = loc.partition(':')
+    if sep and kind in ARCHIVE_KINDS and path: return kind, path
+
+def _member_mode(filename):
+    return 0o755 if os.stat(filename).st_mode & stat.S_IXUSR else 0o644
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_MARK = 0xFFFFFFFF  # the actual value is in the zip64 extra field/record
+_ZIP_TIME, _ZIP_DATE = 0, (1 << 5) | 1  # 1980-01-01 00:00:00, the earliest possible
+_ZIP_UTF8 = 0x800
+
+def _zip32(value):
+    return value if value < _ZIP64_LIMIT else _ZIP64_MARK
+
+def _deflate(read, level, spool_size):
+    # compress everything 'read' gives into a spooled file, as raw deflate data; returns (crc, size, spool)
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = size = 0
+    for chunk in iter(lambda: read(1 << 20), b''):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    return crc, size, spool
+
+class ArchiveWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.names = set()
+        touch_container(filename)
+        self.file = open(filename, 'wb')
+        super().__init__()
+
+    def _check_name(self, arcname):
+        arcname = arcname.replace(os.sep, '/')
+        if arcname in self.names: raise ArchiveError(f"Duplicate archive member: {arcname}")
+        self.names.add(arcname)
+        return arcname
+
+    def add_tree(self, folder, prefix=''):
+        ''' adds every file and folder in folder, in sorted order (except the archive itself, if it's in there) '''
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            if root != folder: self.add_directory(os.path.join(prefix, os.path.relpath(root, folder)))
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                if os.path.abspath(path) == os.path.abspath(self.filename): continue
+                self.add_file(path, os.path.join(prefix, os.path.relpath(path, folder)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    def __init__(self, filename, *, level=6, max_workers=None, spool_size=1 << 23):
+        self.level = level
+        self.spool_size = spool_size
+        self.entries = []
+        max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = thread_pool_executor(
+                "Compressing archive members",
+                max_workers=max_workers,
+                thread_name_prefix="kg_zip_members",
+            )
+        self._pending = deque()
+        self._max_pending = 2 * max_workers  # bounds the memory (and disk) used by compressed members
+        super().__init__(filename)
+
+    def add_file(self, filename, arcname):
+        self._add(arcname, stat.S_IFREG | _member_mode(filename), lambda: open(filename, 'rb'))
+
+    def add_decompressed(self, filename, arcname):
+        self._add(arcname, stat.S_IFREG | _member_mode(filename), lambda: open_data(filename))
+
+    def add_bytes(self, data, arcname, mode=0o644):
+        self._add(arcname, stat.S_IFREG | mode, lambda: io.BytesIO(data))
+
+    def add_directory(self, arcname):
+        self._add(arcname.rstrip(os.sep + '/') + '/', stat.S_IFDIR | 0o755, lambda: io.BytesIO())
+
+    def _add(self, arcname, mode, open_raw):
+        arcname = self._check_name(arcname)
+        def compress():
+            with open_raw() as f:
+                return _deflate(f.read, self.level, self.spool_size)
+        self._pending.append((arcname, mode, open_raw, self._executor.submit(compress)))
+        while len(self._pending) > self._max_pending: self._write_next()
+
+    def _write_next(self):
+        arcname, mode, open_raw, future = self._pending.popleft()
+        crc, size, spool = future.result()
+        with spool:
+            # incompressible members are stored as is instead
+            method = zlib.DEFLATED if spool.tell() < size else 0
+            csize = spool.tell() if method else size
+            offset = self.file.tell()
+            name = arcname.encode('utf-8')
+            zip64 = size >= _ZIP64_LIMIT or csize >= _ZIP64_LIMIT
+            extra = struct.pack('<HHQQ', 1, 16, size, csize) if zip64 else b''
+            self.file.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if zip64 else 20, _ZIP_UTF8, method,
+                    _ZIP_TIME, _ZIP_DATE, crc, _ZIP64_MARK if zip64 else csize, _ZIP64_MARK if zip64 else size,
+                    len(name), len(extra)))
+            self.file.write(name)
+            self.file.write(extra)
+            if method:
+                spool.seek(0)
+                shutil.copyfileobj(spool, self.file)
+        if not method:
+            with open_raw() as f:
+                shutil.copyfileobj(f, self.file)
+        self.entries.append((name, mode, method, crc, size, csize, offset))
+
+    def close(self):
+        try:
+            while self._pending: self._write_next()
+            self._write_central_directory()
+        finally:
+            self.abort()
+
+    def abort(self):
+        for arcname, mode, open_raw, future in self._pending: future.cancel()
+        self._executor.shutdown()
+        self.file.close()
+
+    def _write_central_directory(self):
+        start = self.file.tell()
+        for name, mode, method, crc, size, csize, offset in self.entries:
+            fields = [value for value in (size, csize, offset) if value >= _ZIP64_LIMIT]
+            extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+            version = 45 if fields else 20
+            self.file.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, _ZIP_UTF8,
+                    method, _ZIP_TIME, _ZIP_DATE, crc, _zip32(csize), _zip32(size),
+                    len(name), len(extra), 0, 0, 0, mode << 16 | (0x10 if stat.S_ISDIR(mode) else 0), _zip32(offset)))
+            self.file.write(name)
+            self.file.write(extra)
+        end = self.file.tell()
+        count = len(self.entries)
+        if count >= 0xFFFF or start >= _ZIP64_LIMIT or end - start >= _ZIP64_LIMIT:
+            self.file.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                    count, count, end - start, start))
+            self.file.write(struct.pack('<IIQI', 0x07064b50, 0, end, 1))
+        self.file.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                _zip32(end - start), _zip32(start), 0))
+
+
+class TarArchiveWriter(ArchiveWriter):
+    def __init__(self, filename, kind='tar'):
+        super().__init__(filename)
+        if kind in {'tar.gz', 'tgz'}:
+            self.stream = gzip.GzipFile(filename='', mode='wb', fileobj=self.file, mtime=0)
+        elif kind == 'tar.xz':
+            self.stream = lzma.LZMAFile(self.file, 'wb')
+        elif kind == 'tar.bz2':
+            self.stream = bz2.BZ2File(self.file, 'wb')
+        else:
+            self.stream = None
+        self.tar = tarfile.open(fileobj=self.stream or self.file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def _tarinfo(self, arcname, size, mode, type=tarfile.REGTYPE):
+        info = tarfile.TarInfo(self._check_name(arcname))
+        info.size = size
+        info.mode = mode
+        info.type = type
+        info.mtime = 0
+        return info
+
+    def add_file(self, filename, arcname):
+        with open(filename, 'rb') as f:
+            self.tar.addfile(self._tarinfo(arcname, os.fstat(f.fileno()).st_size, _member_mode(filename)), f)
+
+    def add_decompressed(self, filename, arcname):
+        # tar needs the size first
+        with tempfile.TemporaryFile() as spool:
+            with open_data(filename) as f:
+                shutil.copyfileobj(f, spool, 1 << 20)
+            size = spool.tell()
+            spool.seek(0)
+            self.tar.addfile(self._tarinfo(arcname, size, _member_mode(filename)), spool)
+
+    def add_bytes(self, data, arcname, mode=0o644):
+        self.tar.addfile(self._tarinfo(arcname, len(data), mode), io.BytesIO(data))
+
+    def add_directory(self, arcname):
+        self.tar.addfile(self._tarinfo(arcname.rstrip(os.sep + '/'), 0, 0o755, tarfile.DIRTYPE))
+
+    def close(self):
+        try:
+            self.tar.close()
+            if self.stream: self.stream.close()
+        finally:
+            self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+def open_archive(filename, kind=None, *, max_workers=None):
+    kind = kind or archive_kind(filename)
+    if kind == 'zip': return ZipArchiveWriter(filename, max_workers=max_workers)
+    if kind in ARCHIVE_KINDS: return TarArchiveWriter(filename, kind)
+    raise ArchiveError(f"Unknown archive type for {filename} (expected one of {', '.join(ARCHIVE_KINDS.values())})")
@@ -0,0 +1,144 @@
+from subprocess import PIPE
+from sys import stderr
+import json
+import os
+import os.path
+import queue
+import threading
+
+from .programs import *
+from .utils import *
+
+class BatchError(Exception): ...
+class BatchValidationError(BatchError): ...
+class BatchWorkerError(BatchError): ...
+
+def supports_batch(program):
+    '''
+    kg validators and checkers (Python) understand --batch; others can opt in/out with the "batch" attribute in
+    details.json. Those that turn out not to (e.g., a validator that just calls validate(stdin)) never send the
+    ready line, so they're run once per file instead.
+    '''
+    if 'batch' in program.attributes: return program.attributes['batch']
+    return infer_lang(program.filename) == 'python3'
+
+
+class BatchRunner:
+    ''' A few long-lived processes of a program that answer one JSON line per request line. Thread-safe. '''
+    def __init__(self, program, *args, max_workers=None, env=None):
+        self.program = program
+        self.args = args
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.env = env
+        self._idle = queue.Queue()
+        self._procs = []
+        self._lock = threading.Lock()
+        self._unsupported = None
+        super().__init__()
+
+    # the first line a worker prints, before reading anything
+    ready_line = '{"ready": true}'
+    ready_timeout = 5  # seconds
+
+    def _get_proc(self):
+        while True:
+            if self._unsupported:
+                self._idle.put(None)  # wake up the next one waiting
+                raise self._unsupported
+            try:
+                proc = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    start = len(self._procs) < self.max_workers
+                    if start:
+                        proc = self.program.get_runner_process('--batch', *self.args,
+                                stdin=PIPE, stdout=PIPE, env=self.env, universal_newlines=True, bufsize=1)
+                        self._procs.append(proc)
+                if start:
+                    self._wait_ready(proc)
+                    return proc
+                proc = self._idle.get()
+            if proc: return proc  # None means a worker exited, so there's room for a new one
+
+    def _wait_ready(self, proc):
+        # read in another thread, since a program that doesn't understand --batch may never print anything
+        lines = queue.Queue()
+        threading.Thread(target=lambda: lines.put(proc.stdout.readline()), daemon=True).start()
+        try:
+            line = lines.get(timeout=self.ready_timeout)
+        except queue.Empty:
+            line = None
+        if line is not None and line.strip() == self.ready_line: return
+        proc.kill()
+        with self._lock: self._procs.remove(proc)
+        self._unsupported = BatchWorkerError(f"{self.program.rel_filename} doesn't seem to support --batch "
+                f"(it didn't say it's ready within {self.ready_timeout} seconds)")
+        self._idle.put(None)
+        proc.wait()
+        raise self._unsupported
+
+    def _query(self, request, filename):
+        proc = self._get_proc()
+        try:
+            proc.stdin.write(request + '\n')
+            proc.stdin.flush()
+            line = proc.stdout.readline()
+        except BrokenPipeError:
+            line = ''
+        if not line:
+            # forget it, so that it doesn't take up a worker slot forever
+            with self._lock: self._procs.remove(proc)
+            self._idle.put(None)
+            raise BatchWorkerError(f"{self.program.rel_filename} worker exited unexpectedly (exit code {proc.wait()}) on {filename}. "
+                    "If it doesn't support --batch, set the 'batch' attribute to false in details.json")
+        self._idle.put(proc)
+        return json.loads(line)
+
+    def close(self):
+        for proc in self._procs:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                ...
+            proc.wait()
+        self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BatchValidator(BatchRunner):
+    ''' Validates one file path at a time. '''
+    def __init__(self, validator, *args, max_workers=None, extremes=False):
+        self.extremes = extremes
+        # in batch mode, the extremes are sent along with each result instead of written to the file
+        super().__init__(validator, *args, max_workers=max_workers,
+                env={**os.environ, 'KG_EXTREMES_FILE': '-'} if extremes else None)
+
+    def validate(self, filename):
+        ''' returns the JSON result for 'filename'; raises BatchValidationError if the file is rejected '''
+        result = self.query(filename)
+        if 'error' in result:
+            raise BatchValidationError(f"Validator rejected {filename}: {result['error']}")
+        return result
+
+    def query(self, filename):
+        return self._query(os.path.abspath(filename), filename)
+
+
+class BatchChecker(BatchRunner):
+    ''' Checks one (input, output, judge) triple at a time. '''
+    def check(self, input_, output_, judge_, **kwargs):
+        '''
+        returns the verdict as a dict with 'verdict', 'score', 'message' and 'rcode' (the exit code the
+        checker would have returned). kwargs can be 'code' and 'tc_id', like the -C and -t options.
+        '''
+        return self._query(json.dumps({
+            'input': os.path.abspath(input_),
+            'output': os.path.abspath(output_),
+            'judge': os.path.abspath(judge_),
+            **kwargs,
+        }), output_)
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from threading import Thread
+import gzip
+import os
+import shutil
+import tempfile
+
+from .utils import *
+
+# Test data can be stored compressed, e.g., "tests/000.in.gz" or "tests/000.ans.zst". Programs never see the
+# compressed files: their stdin is fed (and their stdout is compressed) by a thread through a pipe, and programs
+# that take file names (checkers, interactors) get a decompressed temporary copy.
+#
+# gzip is in the standard library; zstd needs the 'zstandard' package (pip install KompGen[zstd]).
+
+class CompressionError(Exception): ...
+
+COMPRESSIONS = {
+    'gz': '.gz',
+    'zst': '.zst',
+}
+
+def compression_of(filename):
+    ''' 'gz', 'zst', or None if the file isn't compressed (judging by its extension) '''
+    for compression, ext in COMPRESSIONS.items():
+        if filename.endswith(ext): return compression
+
+def strip_compression(filename):
+    compression = compression_of(filename)
+    return filename[:-len(COMPRESSIONS[compression])] if compression else filename
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise CompressionError("zstd-compressed files need the 'zstandard' package (pip install zstandard)") from exc
+    return zstandard
+
+def open_data(filename, mode='rb'):
+    ''' open, but (de)compresses the file according to its extension '''
+    compression = compression_of(filename)
+    if compression == 'gz':
+        # mtime=0 so that the same data always gives the same file
+        return gzip.open(filename, mode) if 'r' in mode else gzip.GzipFile(filename, mode, mtime=0)
+    if compression == 'zst':
+        return _zstandard().open(filename, mode)
+    return open(filename, mode)
+
+def _pump(source, dest):
+    try:
+        with source, dest:
+            shutil.copyfileobj(source, dest, 1 << 16)
+    except BrokenPipeError:
+        ...  # the program stopped reading early, which is its own business
+
+@contextmanager
+def data_stdin(filename):
+    ''' something to pass as a program's stdin, which gives the (decompressed) contents of filename '''
+    if not compression_of(filename):
+        with open(filename, 'rb') as f:
+            yield f
+        return
+    source = open_data(filename)  # open it here, so that errors are raised here
+    rfd, wfd = os.pipe()
+    pump = Thread(target=_pump, args=(source, os.fdopen(wfd, 'wb')), daemon=True)
+    pump.start()
+    try:
+        with os.fdopen(rfd, 'rb') as stdin:
+            yield stdin
+    finally:
+        # if the program didn't read everything, closing our read end makes the pump stop
+        pump.join()
+
+@contextmanager
+def data_stdout(filename):
+    ''' something to pass as a program's stdout, whose output is (compressed and) written to filename '''
+    if not compression_of(filename):
+        with open(filename, 'wb') as f:
+            yield f
+        return
+    dest = open_data(filename, 'wb')
+    rfd, wfd = os.pipe()
+    pump = Thread(target=_pump, args=(os.fdopen(rfd, 'rb'), dest), daemon=True)
+    pump.start()
+    try:
+        with os.fdopen(wfd, 'wb') as stdout:
+            yield stdout
+    finally:
+        pump.join()
+
+@contextmanager
+def plain_file(filename):
+    ''' the name of an uncompressed copy of filename, for programs that take file names '''
+    if not compression_of(filename):
+        yield filename
+        return
+    with tempfile.NamedTemporaryFile(delete=False, prefix='kg_tmp_plain_') as tmp:
+        with open_data(filename) as source:
+            shutil.copyfileobj(source, tmp, 1 << 20)
+    try:
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+@contextmanager
+def plain_output(filename):
+    ''' the name of a file to write to, for programs that take file names; it's compressed to filename afterwards '''
+    if not compression_of(filename):
+        yield filename
+        return
+    with tempfile.NamedTemporaryFile(delete=False, prefix='kg_tmp_plain_') as tmp: ...
+    try:
+        yield tmp.name
+        recompress_file(tmp.name, filename)
+    finally:
+        os.remove(tmp.name)
+
+def recompress_file(source, dest):
+    ''' copies source to dest, (de)compressing it as needed according to their extensions '''
+    touch_container(dest)
+    with open_data(source) as fsrc, open_data(dest, 'wb') as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from subprocess import DEVNULL
+import json
+import os
+import tempfile
+
+from natsort import natsorted
+
+from .utils import *
+
+# Extreme-value coverage: kg validators write the smallest and largest values checked against each
+# bound to the file named by KG_EXTREMES_FILE. These are merged here across files and subtasks.
+
+def run_validator_with_extremes(validator, filename, *args, label='VALIDATOR', **kwargs):
+    ''' run the validator on 'filename' with extremes tracking; returns the records, or None if none were written '''
+    with tempfile.NamedTemporaryFile(delete=False, prefix='kg_tmp_ext_') as tmp:
+        pass
+    try:
+        with open(filename) as file:
+            validator.do_run(*args, stdin=file, label=label,
+                    env={**os.environ, 'KG_EXTREMES_FILE': tmp.name}, **kwargs)
+        with open(tmp.name) as f:
+            data = f.read()
+    finally:
+        os.remove(tmp.name)
+    return json.loads(data) if data else None
+
+
+def merge_extremes(extremes, records):
+    for record in records:
+        merged = extremes.setdefault(record['subtask'], {})
+        for name, ext in record['extremes'].items():
+            if name not in merged:
+                merged[name] = dict(ext)
+            else:
+                curr = merged[name]
+                if Decimal(ext['min']) < Decimal(curr['min']): curr['min'] = ext['min']
+                if Decimal(ext['max']) > Decimal(curr['max']): curr['max'] = ext['max']
+    return extremes
+
+
+def untouched_extremes(extremes):
+    for subtask in natsorted(extremes, key=str):
+        for name, ext in extremes[subtask].items():
+            if ext['lo'] is not None and Decimal(ext['min']) != Decimal(ext['lo']):
+                yield subtask, name, 'min', ext['lo'], ext['min']
+            if ext['hi'] is not None and Decimal(ext['max']) != Decimal(ext['hi']):
+                yield subtask, name, 'max', ext['hi'], ext['max']
+
+
+def print_extremes_report(extremes):
+    info_print("EXTREME VALUES COVERAGE")
+    if not extremes:
+        warn_print("No extremes were recorded. Only kg validators using 'lim' bounds support this.")
+        return
+    found = False
+    for subtask, name, side, extreme, seen in untouched_extremes(extremes):
+        found = True
+        where = 'all files' if subtask is None else f'subtask {subtask}'
+        warn_print(f"{where}:", end=' ')
+        print(key_text(name), warn_text(f"{side} {extreme} never reached (closest: {seen})"))
+    if not found:
+        succ_print("All extremes of the bounds were reached.")
@@ -1,42 +1,102 @@
 from sys import stderr
-from glob import glob
+from functools import lru_cache
+from glob import glob, has_magic
+import fnmatch
 import re
+import os
 import os.path
+import time
 from itertools import count
 
-from natsort import natsorted
+from natsort import natsort_keygen
 
+from .compressed import *
 from .utils import *
 
 class InferError(Exception): ...
 class FormatError(Exception): ...
 
+# natural sort keys only depend on the file name, and the same names get sorted over and over
+_natural_key = lru_cache(maxsize=1 << 16)(natsort_keygen())
+
+def _natsorted(names):
+    return sorted(names, key=_natural_key)
+
+
+# The test folders are listed over and over (each Format globs its inputs and outputs, and "kg make all" makes
+# several Formats), so the listings are cached, keyed by folder. A folder's mtime changes whenever a file is
+# added to it or removed from it, so a listing is reused as long as the mtime is the same. Like "racy git", a
+# listing taken right after the folder changed isn't trusted, since the mtime might not have ticked yet.
+
+_RACY_NS = 2 * 10**9  # some filesystems only keep the mtime to the second (or two)
+_listings = {}
+
+def list_folder(folder):
+    ''' the names in folder (cached; see above), or an empty list if it doesn't exist '''
+    folder = os.path.abspath(folder)
+    try:
+        mtime = os.stat(folder).st_mtime_ns
+    except OSError:
+        _listings.pop(folder, None)
+        return []
+    cached = _listings.get(folder)
+    if cached and cached[0] == mtime and cached[1] - mtime > _RACY_NS:
+        return cached[2]
+    scanned = time.time_ns()
+    try:
+        with os.scandir(folder) as entries:
+            names = [entry.name for entry in entries]
+    except OSError:
+        return []
+    _listings[folder] = mtime, scanned, names
+    return names
+
+def find_files(pattern):
+    ''' same as glob(pattern), but uses the cached folder listings when only the file name has wildcards '''
+    folder, pat = os.path.split(pattern)
+    if has_magic(folder) or not has_magic(pat): return glob(pattern)
+    names = fnmatch.filter(list_folder(folder), pat)
+    if not pat.startswith('.'): names = [name for name in names if not name.startswith('.')]  # same as glob
+    return [os.path.join(folder, name) for name in names]
+
+def find_stored_files(pattern):
+    ''' the files matching pattern, including compressed ones (e.g., "tests/000.in.gz" for "tests/*.in") '''
+    return {*find_files(pattern), *(file for ext in COMPRESSIONS.values() for file in find_files(pattern + ext))}
+
+@lru_cache(maxsize=None)
+def _split_pattern(pat):
+    return pat.split('*')
+
 def _check_simple(x, name):
     if any(r'\*' in part for part in os.path.split(x)):
         raise FormatError(f"Invalid {name} pattern: {x} ... cannot handle patterns with {invalid}")
 
 class Format:
-    def __init__(self, inputg=None, outputg=None, *, read='', write='', clear='', name=None):
+    def __init__(self, inputg=None, outputg=None, *, read='', write='', clear='', name=None, compress=None):
         if not read and not write: raise FormatError("read and write modes cannot both be empty")
         if not set(read) <= set('io'): raise FormatError(f"Unknown read mode: {read}")
         if not set(write) <= set('io'): raise FormatError(f"Unknown write mode: {write}")
         if not set(clear) <= set('io'):  raise FormatError(f"Unknown clear mode: {clear}")
         if set(read) & set(write):
             raise FormatError(f"You cannot read and write at the same time: {''.join(sorted(set(read) & set(write)))}")
+        if compress is not None and compress not in COMPRESSIONS:
+            raise FormatError(f"Unknown compression: {compress}")
 
         if 'i' in clear:
             if inputg is None:
                 raise FormatError("Cannot clear inputs: inputg not found!")
             else:
-                for inputf in glob(inputg): os.remove(inputf)
+                for inputf in find_stored_files(inputg): os.remove(inputf)
 
         if 'o' in clear:
             if outputg is None:
                 raise FormatError("Cannot clear outputs: outputg not found!")
             else:
-                for outputf in glob(outputg): os.remove(outputf)
+                for outputf in find_stored_files(outputg): os.remove(outputf)
 
         self.name = name
+        # written outputs are compressed with this
+        self.compress = compress
 
         self._checked = False
         self._i_re = None
@@ -44,8 +104,8 @@ class Format:
 
         self.inputg = inputg
         self.outputg = outputg
-        self.inputs = set(glob(inputg) if inputg is not None else [])
-        self.outputs = set(glob(outputg) if outputg is not None else [])
+        self.inputs = find_stored_files(inputg) if inputg is not None else set()
+        self.outputs = find_stored_files(outputg) if outputg is not None else set()
 
         self.i_to_o = {}
         self.o_to_i = {}
@@ -59,6 +119,9 @@ class Format:
         if self.inputs <= self.outputs: self.outputs -= self.inputs
         elif self.outputs <= self.inputs: self.inputs -= self.outputs
 
+        self._check_stored(self.inputs)
+        self._check_stored(self.outputs)
+
         if 'i' in read and not self.inputs:
             raise FormatError(f"Invalid input pattern: {inputg} ... did not match any file")
         if 'o' in read and not self.outputs:
@@ -80,7 +143,7 @@ class Format:
             if not self.outputs and write == 'o':
                 assert (read, write) == ('i', 'o')
                 try:
-                    self.outputs = set(map(self.infer_i_to_o, self.inputs))
+                    self.outputs = {self._compressed(self.infer_i_to_o(inputf)) for inputf in self.inputs}
                 except InferError as e:
                     raise FormatError("Can't infer output file name!") from e
 
@@ -101,34 +164,36 @@ class Format:
                     "unequal number of files matched.")
 
         if read and set(read + write) == set('io'):
-            # now, need to match
+            # now, need to match (regardless of which files are compressed)
+            stored_inputs = self._check_stored(self.inputs)
+            stored_outputs = self._check_stored(self.outputs)
             for inputf in self.inputs:
                 try:
                     outputf = self.infer_i_to_o(inputf)
                 except InferError as e:
                     raise FormatError(f"Can't infer output file name for {inputf}!") from e
-                if outputf not in self.outputs:
+                if strip_compression(outputf) not in stored_outputs:
                     raise FormatError(f"Cannot find match for {inputf} ... expected {outputf}")
-                self.i_to_o[inputf] = outputf
+                self.i_to_o[inputf] = stored_outputs[strip_compression(outputf)]
 
             for outputf in self.outputs:
                 try:
                     inputf = self.infer_o_to_i(outputf)
                 except InferError as e:
                     raise FormatError(f"Can't infer input file name for {outputf}!") from e
-                if inputf not in self.inputs:
+                if strip_compression(inputf) not in stored_inputs:
                     raise FormatError(f"Cannot find match for {outputf} ... expected {inputf}")
-                self.o_to_i[outputf] = inputf
+                self.o_to_i[outputf] = stored_inputs[strip_compression(inputf)]
 
             assert set(self.o_to_i) <= self.outputs
             assert set(self.i_to_o) <= self.inputs
             if len(self.o_to_i) < len(self.outputs):
-                missing = natsorted(self.outputs - set(self.o_to_i))
+                missing = _natsorted(self.outputs - set(self.o_to_i))
                 missing = ', '.join(missing) if len(missing) <= 5 else ', '.join(missing[:5] + '...')
                 raise FormatError(f"Cannot match these output files to input files: {missing}")
 
             if len(self.i_to_o) < len(self.inputs):
-                missing = natsorted(self.inputs - set(self.i_to_o))
+                missing = _natsorted(self.inputs - set(self.i_to_o))
                 missing = ', '.join(missing) if len(missing) <= 5 else ', '.join(missing[:5] + '...')
                 raise FormatError(f"Cannot match these input files to output files: {missing}")
 
@@ -142,9 +207,24 @@ class Format:
 
         super().__init__()
 
+    @staticmethod
+    def _check_stored(files):
+        # the files by their uncompressed names
+        stored = {}
+        for f in files:
+            plain = strip_compression(f)
+            if plain in stored:
+                raise FormatError(f"Found both {min(f, stored[plain])} and {max(f, stored[plain])} ... keep only one")
+            stored[plain] = f
+        return stored
+
+    def _compressed(self, f):
+        return strip_compression(f) + COMPRESSIONS[self.compress] if self.compress else f
+
     def _infer_parts(self, g, _re, f):
         if _re is None: raise InferError("Cannot infer: missing pattern.")
-        m = _re.match(f)
+        # compressed files are matched by their uncompressed names, unless the pattern itself is compressed
+        m = _re.match(strip_compression(f)) or _re.match(f)
         if not m: raise InferError(f"Cannot match {f} to {g}")
         return m.groups()
 
@@ -158,7 +238,7 @@ class Format:
 
     def _join_parts(self, pat, *p):
         if pat is None: raise InferError("Cannot join: missing pattern.")
-        parts = pat.split('*')
+        parts = _split_pattern(pat)
         if len(parts) != len(p) + 1:
             raise InferError("Cannot perform inference: unequal number of '*' parts in "
                     f"{self.inputg} and {self.outputg}.")
@@ -194,18 +274,19 @@ class Format:
             self._checked = True
 
     def thru_inputs(self):
-        return natsorted(self.inputs)
+        return _natsorted(self.inputs)
 
     def thru_outputs(self):
-        return natsorted(self.outputs)
+        return _natsorted(self.outputs)
 
     def thru_io(self):
-        return natsorted(self.i_to_o.items())
+        # the inputs are distinct, so this is the same as sorting the pairs
+        return sorted(self.i_to_o.items(), key=lambda io: _natural_key(io[0]))
 
     def thru_expected_io(self):
         for parts in self.expected_parts():
             inputf = self._join_iparts(*parts)
-            outputf = self._join_oparts(*parts)
+            outputf = self._compressed(self._join_oparts(*parts))
             yield inputf, outputf
 
     def thru_expected_inputs(self):
@@ -237,14 +318,14 @@ def set_format(short, *names):
 
 @set_format('hr', 'hackerrank')
 class HRFormat(Format):
-    def __init__(self, loc='.', *, read='', write='', clear=''):
+    def __init__(self, loc='.', *, read='', write='', clear='', compress=None):
         super().__init__(
                 os.path.join(loc, 'input', 'input*.txt'),
                 os.path.join(loc, 'output', 'output*.txt'),
-            read=read, write=write, clear=clear, name='hr')
-        for inputf, ex in zip(natsorted(self.inputs), self.expected_parts()):
+            read=read, write=write, clear=clear, compress=compress, name='hr')
+        for inputf, ex in zip(_natsorted(self.inputs), self.expected_parts()):
             expinpf = self._join_iparts(*ex)
-            if inputf != expinpf:
+            if strip_compression(inputf) != expinpf:
                 raise FormatError(f"Expected {expinpf} but got {inputf}")
 
     @classmethod
@@ -256,14 +337,14 @@ class HRFormat(Format):
 
 @set_format('pg', 'polygon')
 class PGFormat(Format):
-    def __init__(self, loc='.', *, read='', write='', clear=''):
+    def __init__(self, loc='.', *, read='', write='', clear='', compress=None):
         super().__init__(
                 os.path.join(loc, 'tests', '*'),
                 os.path.join(loc, 'tests', '*.a'),
-            read=read, write=write, clear=clear, name='pg')
-        for inputf, ex in zip(natsorted(self.inputs), self.expected_parts()):
+            read=read, write=write, clear=clear, compress=compress, name='pg')
+        for inputf, ex in zip(_natsorted(self.inputs), self.expected_parts()):
             expinpf = self._join_iparts(*ex)
-            if inputf != expinpf:
+            if strip_compression(inputf) != expinpf:
                 raise FormatError(f"Expected {expinpf} but got {inputf}")
 
     @classmethod
@@ -274,14 +355,14 @@ class PGFormat(Format):
 
 @set_format('kg', 'kompgen')
 class KGFormat(Format):
-    def __init__(self, loc='.', *, read='', write='', clear='', tests_folder='tests'):
+    def __init__(self, loc='.', *, read='', write='', clear='', compress=None, tests_folder='tests'):
         super().__init__(
                 os.path.join(loc, tests_folder, '*.in'),
                 os.path.join(loc, tests_folder, '*.ans'),
-            read=read, write=write, clear=clear, name='kg')
-        for inputf, ex in zip(natsorted(self.inputs), self.expected_parts()):
+            read=read, write=write, clear=clear, compress=compress, name='kg')
+        for inputf, ex in zip(_natsorted(self.inputs), self.expected_parts()):
             expinpf = self._join_iparts(*ex)
-            if inputf != expinpf:
+            if strip_compression(inputf) != expinpf:
                 raise FormatError(f"Expected {expinpf} but got {inputf}")
 
     @classmethod
@@ -292,16 +373,16 @@ class KGFormat(Format):
 
 @set_format('cms', 'CMS')
 class CMSFormat(Format):
-    def __init__(self, loc='.', *, read='', write='', clear='', subtasks=None, **kwargs):
+    def __init__(self, loc='.', *, read='', write='', clear='', compress=None, subtasks=None, **kwargs):
         super().__init__(
                 os.path.join(loc, 'tests', '**.in'),
                 os.path.join(loc, 'tests', '**.ans'),
-            read=read, write=write, clear=clear, name='cms')
+            read=read, write=write, clear=clear, compress=compress, name='cms')
         self.subtasks = subtasks
         self.kwargs = kwargs
         testcode_re = re.compile(r'^(?P<pre>\d+)(?:_subs_(?:\d+_)+(?:end|))?\.in\Z')
-        for inputf, ex in zip(natsorted(self.inputs), self.expected_parts()):
-            match = testcode_re.match(os.path.basename(inputf))
+        for inputf, ex in zip(_natsorted(self.inputs), self.expected_parts()):
+            match = testcode_re.match(os.path.basename(strip_compression(inputf)))
             if not match or match.group('pre') != ex[0]:
                 raise FormatError(f"Expected {ex[0]}*.in but got {inputf}")
 
@@ -333,14 +414,14 @@ class CMSFormat(Format):
 
 @set_format('cms-it', 'CMS-Italian')
 class CMSItFormat(Format):
-    def __init__(self, loc='.', *, read='', write='', clear=''):
+    def __init__(self, loc='.', *, read='', write='', clear='', compress=None):
         super().__init__(
                 os.path.join(loc, 'input', 'input*.txt'),
                 os.path.join(loc, 'output', 'output*.txt'),
-            read=read, write=write, clear=clear, name='cms-it')
-        for inputf, ex in zip(natsorted(self.inputs), self.expected_parts()):
+            read=read, write=write, clear=clear, compress=compress, name='cms-it')
+        for inputf, ex in zip(_natsorted(self.inputs), self.expected_parts()):
             expinpf = self._join_iparts(*ex)
-            if inputf != expinpf:
+            if strip_compression(inputf) != expinpf:
                 raise FormatError(f"Expected {expinpf} but got {inputf}")
 
     @classmethod
@@ -360,8 +441,8 @@ def get_format(args, *, read='', write='', clear='', **kwargs):
         else:
             raise ValueError(f'Unrecognized format: {args.format}')
 
-def get_format_from_type(format, loc, *, read='', write='', clear=''):
-    return formats[format](loc, read=read, write=write, clear=clear)
+def get_format_from_type(format, loc, *, read='', write='', clear='', **kwargs):
+    return formats[format](loc, read=read, write=write, clear=clear, **kwargs)
 
 def is_same_format(a, b):
     return short_format[a] == short_format[b]
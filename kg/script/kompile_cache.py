@@ -0,0 +1,102 @@
+from sys import stderr
+import json
+import os
+
+from ..black_magic.compiler import ParseCache, compile_lines, lines_digest, touch_cached, write_atomically
+from .details import *
+from .utils import *
+
+# Caches for "kg kompile", kept across runs: the parse trees of the modules (keyed by their contents), and
+# the kompiled lines of each target (keyed by the full render context). A kompiled target is reused as long
+# as every module it imported, directly or not, is unchanged. The least recently used entries are deleted
+# once the cache gets bigger than KG_KOMPILE_CACHE_SIZE megabytes.
+
+DEFAULT_KOMPILE_CACHE_SIZE = 200
+
+def kompile_cache_folder():
+    ''' KG_KOMPILE_CACHE if set (or None if it's "off"), otherwise in the user's cache folder '''
+    folder = os.environ.get('KG_KOMPILE_CACHE')
+    if folder == 'off': return None
+    return folder or os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'kompgen', 'kompile')
+
+def kompile_cache_size():
+    ''' the most bytes the kompile cache may take up '''
+    return int(float(os.environ.get('KG_KOMPILE_CACHE_SIZE') or DEFAULT_KOMPILE_CACHE_SIZE) * 10**6)
+
+def _render_context_default(obj):
+    if isinstance(obj, Details): return {'details': obj.details, 'source': obj.source, 'relpath': obj.relpath}
+    # not repr(obj): two different objects can have the same one, e.g., the default one after the first is freed
+    raise TypeError(f"Can't key the kompile cache on a {type(obj).__name__} object")
+
+class KompileCache:
+    def __init__(self, folder):
+        self.folder = folder
+        self.parse_cache = ParseCache(os.path.join(folder, 'parsed'))
+        self.reused = self.kompiled = 0
+        super().__init__()
+
+    @staticmethod
+    def _module_digest(load_module, module_id):
+        try:
+            lines, add_context = load_module(module_id)
+        except Exception:
+            return None  # it's gone, so the kompiled target is stale
+        return lines_digest(lines, add_context)
+
+    @staticmethod
+    def _load_entry(filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            ...
+        except Exception as exc:
+            warn_print(f"Warning: ignoring the corrupted kompile cache file {filename} ({exc!r})", file=stderr)
+
+    def compile_lines(self, module_id, load_module, get_module_id, **context):
+        ''' Like compile_lines, but loads module_id itself, and reuses the result of an identical earlier call. '''
+        lines, add_context = load_module(module_id)
+        try:
+            key = lines_digest(json.dumps({'module_id': module_id, **add_context, **context},
+                                          sort_keys=True, default=_render_context_default))
+        except (TypeError, ValueError):
+            filename = None  # the context can't be written down exactly, so it's kompiled without the cache
+        else:
+            filename = os.path.join(self.folder, 'kompiled', key[:2], key + '.json')
+
+        entry = self._load_entry(filename) if filename else None
+        if entry and all(self._module_digest(load_module, mod) == digest for mod, digest in entry['modules'].items()):
+            self.reused += 1
+            touch_cached(filename)
+            return entry['lines']
+
+        modules = {}
+        def tracked_load_module(module_id):
+            loaded = load_module(module_id)
+            modules[module_id] = lines_digest(*loaded)
+            return loaded
+
+        tracked_load_module(module_id)
+        lines = compile_lines(lines,
+                module_id=module_id,
+                load_module=tracked_load_module,
+                get_module_id=get_module_id,
+                parse_cache=self.parse_cache,
+                **add_context,
+                **context,
+            )
+        self.kompiled += 1
+        if filename is None: return lines
+        try:
+            write_atomically(filename, json.dumps({'modules': modules, 'lines': lines}).encode('utf-8'))
+        except OSError as exc:
+            warn_print(f"Warning: couldn't write to the kompile cache ({exc})", file=stderr)
+        return lines
+
+    def prune(self):
+        ''' delete the least recently used entries if the cache got too big '''
+        max_bytes = kompile_cache_size()
+        # the parse trees are only needed to kompile again, so they get half as much room
+        prune_cache(os.path.join(self.folder, 'parsed'), max_bytes // 2)
+        prune_cache(os.path.join(self.folder, 'kompiled'), max_bytes // 2)
@@ -0,0 +1,55 @@
+from sys import stdout
+import json
+import os
+
+from .utils import *
+
+# Interaction profiles: kg interactors time everything sent to and received from the users, and write a
+# summary to the file named by KG_INTERACTION_PROFILE. These are printed and merged across files here.
+
+def interaction_profile_env(filename):
+    return {**os.environ, 'KG_INTERACTION_PROFILE': filename}
+
+def read_interaction_profile(filename):
+    ''' returns None if the interactor didn't write a profile, e.g., if it's not a kg interactor '''
+    with open(filename) as f:
+        data = f.read()
+    return json.loads(data) if data else None
+
+def merge_interaction_profiles(total, profile):
+    if not total: return {**profile, 'latency': {'max': profile['latency']['max'], 'total': profile['latency']['total']}}
+    for key in 'queries', 'wall', 'waiting', 'writing':
+        total[key] += profile[key]
+    total['latency']['total'] += profile['latency']['total']
+    total['latency']['max'] = max(filter(lambda lat: lat is not None, (total['latency']['max'], profile['latency']['max'])),
+                                  default=None)
+    total['histogram'] = [a + b for a, b in zip(total['histogram'], profile['histogram'])]
+    return total
+
+def _ms(seconds):
+    return f"{seconds * 1000:.3f} ms" if seconds is not None else "n/a"
+
+def _duration(seconds):
+    return f"{seconds * 1e6:g}us" if seconds < 1e-3 else f"{seconds * 1e3:g}ms" if seconds < 1 else f"{seconds:g}s"
+
+def print_interaction_profile(profile, *, file=stdout, width=40):
+    latency = profile['latency']
+    queries = profile['queries']
+    stats = [f"p{p} {_ms(latency[f'p{p}'])}" for p in (50, 90, 99) if f'p{p}' in latency]
+    stats += [f"mean {_ms(latency['total'] / queries if queries else None)}", f"max {_ms(latency['max'])}"]
+    info_print(f"Interaction profile: {queries} queries; round trip {', '.join(stats)}", file=file)
+
+    wall = profile['wall']
+    thinking = max(0.0, wall - profile['waiting'] - profile['writing'])
+    def pct(part): return f"{part / wall:.1%}" if wall > 0 else "n/a"
+    info_print(f"    {wall:.3f} sec. in total: "
+               f"interactor {thinking:.3f} sec. ({pct(thinking)}), "
+               f"waiting for the solution {profile['waiting']:.3f} sec. ({pct(profile['waiting'])}), "
+               f"writing/flushing {profile['writing']:.3f} sec. ({pct(profile['writing'])})", file=file)
+
+    histogram = profile['histogram']
+    if not queries: return
+    labels = [f"<{_duration(bound)}" for bound in profile['bounds']] + [f">={_duration(profile['bounds'][-1])}"]
+    most = max(histogram)
+    for label, count in zip(labels, histogram):
+        print(f"    {label:>8} {count:>8} {'#' * -(-count * width // most)}", file=file)
@@ -1,5 +1,5 @@
 from collections import defaultdict, namedtuple
-from contextlib import contextmanager, ExitStack
+from contextlib import ExitStack
 from enum import Enum
 from functools import wraps, partial
 from itertools import chain
@@ -13,6 +13,8 @@ import subprocess
 import tempfile
 import time as timel
 
+from .supervisor import *
+from .transcripts import *
 from .utils import *
 
 class IMode(Enum):
@@ -212,12 +214,12 @@ class Program:
             if check and retcode:
                 raise subprocess.CalledProcessError(retcode, proc.args, output=None, stderr=None)
 
-        return ProgramResult(result=subprocess.CompletedProcess(proc.args, None, None, retcode), running_time=elapsed)
+        return ProgramResult(result=subprocess.CompletedProcess(proc.args, retcode), running_time=elapsed)
 
 
     def do_interact(self, interactor, *args, time=False, label=None, check=False, log_exc=True,
                     node_count=1, interaction_mode=IMode.STDIO, pass_id=False,
-                    interactor_args=(), interactor_kwargs=None, **kwargs):
+                    interactor_args=(), interactor_kwargs=None, transcript=None, **kwargs):
         """Interact with 'interactor'.
 
         There will be 'node_count' copies of the current program, and one copy of the interactor.
@@ -236,6 +238,11 @@ class Program:
         - A FIFO pair will be created for each node, for a total of 2*node_count FIFOs.
         - The FIFO names will be passed to the interactor as args: --from-user [...] --to-user [...]
         - This probably isn't possible in windows because there are no FIFOs there.
+
+        All processes are run from the calling thread, and each node is killed on its own timeout.
+
+        If a TranscriptWriter 'transcript' is given, everything passing between the nodes and the interactor
+        is relayed through this process and recorded there.
         """
         if not interactor:
             raise ProgramsError("No interactor passed")
@@ -266,76 +273,186 @@ class Program:
 
         # set a slightly larger timeout for the interactor
         interactor_kwargs.setdefault('timeout', float('inf'))
-        ext_timeout = None
         if timeout is not None:
-            ext_timeout = timeout + 2
-            interactor_kwargs['timeout'] = min(interactor_kwargs['timeout'], ext_timeout)
+            interactor_kwargs['timeout'] = min(interactor_kwargs['timeout'], timeout + 2)
         if interactor_kwargs['timeout'] >= float('inf'):
             del interactor_kwargs['timeout']
         else:
             info_print(f"  the timeout for the interactor is {interactor_kwargs['timeout']:.2f} sec.", file=stderr)
 
-        @contextmanager
-        def prepare_communication():
-            # setup communication channels
-            pargses = [[*args, *([str(idx)] if pass_id else [])] for idx in range(node_count)]
-
+        run_keys = {'time', 'label', 'check', 'log_exc', 'timeout'}
+        itc_run = {key: value for key, value in interactor_kwargs.items() if key in run_keys}
+        itc_popen = {key: value for key, value in interactor_kwargs.items() if key not in run_keys}
+        itc_labels = dict(label=itc_run['label'], time=itc_run.get('time', False))
+        def node_labels(idx):
+            return dict(label=label and label.format(id=idx), time=time)
+
+        relays = []
+        def relay(src, dst, idx, direction):
+            relays.append(start_relay(src, dst, partial(transcript.record, idx, direction)))
+
+        def take(process, stream):
+            # the relays own the pipes from now on; Popen mustn't close them while data is still in flight
+            file = getattr(process, stream)
+            setattr(process, stream, None)
+            return file
+
+        # everything is run and waited for in this thread; the supervisor also enforces each timeout
+        supervisor = Supervisor()
+        pargses = [[*args, *([str(idx)] if pass_id else [])] for idx in range(node_count)]
+        with ExitStack() as estack:
             # TODO match statement
             if interaction_mode == IMode.STDIO:
-
                 info_print("Weaving the stdin and stdout of the node and the interactor")
                 for stream in 'stdin', 'stdout':
-                    if stream in interactor_kwargs:
+                    if stream in itc_popen:
                         raise ProgramsError(f"You cannot pass the {stream!r} argument to the interactor in 'stdio' mode")
                 assert node_count == 1
                 [pargs] = pargses
-                run_process = partial(self._do_run_process, time=time, label=label.format(id=0), check=check, log_exc=log_exc, timeout=timeout)
-                process = self.get_runner_process(*pargs, stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kwargs)
-                interactor_kwargs['stdin'] = process.stdout
-                interactor_kwargs['stdout'] = process.stdin
-                yield run_process, [process]
+                pipes = dict(stdin=subprocess.PIPE, stdout=subprocess.PIPE, **(dict(bufsize=0) if transcript else {}))
+                process = self.get_runner_process(*pargs, **pipes, **kwargs)
+                if transcript:
+                    itc_process = interactor.get_runner_process(*interactor_args, **pipes, **itc_popen)
+                    relay(take(process, 'stdout'), take(itc_process, 'stdin'), 0, FROM_USER)
+                    relay(take(itc_process, 'stdout'), take(process, 'stdin'), 0, TO_USER)
+                else:
+                    itc_process = interactor.get_runner_process(*interactor_args,
+                            stdin=process.stdout, stdout=process.stdin, **itc_popen)
+                    # the interactor has them now; keeping them open here would hide EOFs from either side
+                    take(process, 'stdout').close()
+                    take(process, 'stdin').close()
+                itc_task = supervisor.add(lambda: itc_process, timeout=itc_run.get('timeout'), **itc_labels)
+                node_tasks = [supervisor.add(lambda: process, timeout=timeout, **node_labels(0))]
             else:
                 assert interaction_mode == IMode.FIFO
 
-                def run(idx, pargs, from_interactor_fifo, to_interactor_fifo):
-                    run_process = partial(self._do_run_process, time=time, label=label.format(id=idx), check=check, log_exc=log_exc, timeout=timeout)
-                    # see note on interactors.py about having to correspond to its (and CMS's) order of FIFO opening.
-                    # There should probably be an option to say whether to read the input or output first.
-                    # If you can use nonblocking mode here (os.open and NONBLOCK something), that might be even better; feel free to update.
-                    # But I think os.open only returns a file descriptor AND it's a Raw IO, not even a Binary (buffered) one.
-                    with open(from_interactor_fifo) as from_interactor_file, open(to_interactor_fifo, 'w') as to_interactor_file:
-                        return run_process(self.get_runner_process(*pargs, stdin=from_interactor_file, stdout=to_interactor_file, **kwargs))
-
                 info_print(f"Creating {node_count} FIFO pairs")
-                with tempfile.TemporaryDirectory(prefix='kg_tmp_dir_') as tmpdirname:
-                    info_print("The temporary directory is", tmpdirname)
-                    node_to_interactor_fifos = [os.path.join(tmpdirname, f"nod{idx}_to_itc") for idx in range(node_count)]
-                    interactor_to_node_fifos = [os.path.join(tmpdirname, f"itc_to_nod{idx}") for idx in range(node_count)]
-                    for fifo in chain(node_to_interactor_fifos, interactor_to_node_fifos):
-                        os.mkfifo(fifo)
-                        # set readable and writable by anyone
-                        os.chmod(fifo, os.stat(fifo).st_mode
-                                | stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
-                                | stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
-
-                    # connect these fifos to the stdio's of the nodes
-                    interactor_args.extend(['--from-user', *(fifo for fifo in node_to_interactor_fifos)])
-                    interactor_args.extend(['--to-user',   *(fifo for fifo in interactor_to_node_fifos)])
-                    yield run, range(node_count), pargses, interactor_to_node_fifos, node_to_interactor_fifos
-                    info_print("Deleting temporary directory", tmpdirname)
-
-
-        with prepare_communication() as (run, *argseqs), thread_pool_executor(
-                    'Running interaction',
-                    max_workers=node_count+1, # everything needs to be in their separate threads
-                    thread_name_prefix='kg_interact',
-                    logf=stderr,
-                ) as executor:
-
-            itc_future = executor.submit(interactor.do_run, *interactor_args, **interactor_kwargs)
-            cur_results = [*executor.map(run, *argseqs, timeout=ext_timeout)]
-
-            return cur_results, itc_future.result()
+                tmpdirname = estack.enter_context(tempfile.TemporaryDirectory(prefix='kg_tmp_dir_'))
+                info_print("The temporary directory is", tmpdirname)
+                node_to_interactor_fifos = [os.path.join(tmpdirname, f"nod{idx}_to_itc") for idx in range(node_count)]
+                interactor_to_node_fifos = [os.path.join(tmpdirname, f"itc_to_nod{idx}") for idx in range(node_count)]
+                for fifo in chain(node_to_interactor_fifos, interactor_to_node_fifos):
+                    os.mkfifo(fifo)
+                    # set readable and writable by anyone
+                    os.chmod(fifo, os.stat(fifo).st_mode
+                            | stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+                            | stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+                # Nothing here blocks on opening a FIFO. We hold each node's stdin open for reading from the start,
+                # so the interactor can open all of those for writing right away. A node is then started as soon as
+                # the interactor has opened its stdout for reading. Like CMS, the interactor must open its
+                # '--to-user' FIFO before the '--from-user' one of the same node, or the node might see an EOF.
+                node_stdins = {idx: open_fifo_nonblocking(fifo, os.O_RDONLY) for idx, fifo in enumerate(interactor_to_node_fifos)}
+                @estack.callback
+                def close_node_stdins():
+                    for fd in node_stdins.values(): os.close(fd)
+
+                def start_node(idx):
+                    stdout_fd = open_fifo_nonblocking(node_to_interactor_fifos[idx], os.O_WRONLY)
+                    if stdout_fd is None: return None
+                    stdin_fd = node_stdins.pop(idx)
+                    try:
+                        return self.get_runner_process(*pargses[idx], stdin=stdin_fd, stdout=stdout_fd, **kwargs)
+                    finally:
+                        os.close(stdin_fd)
+                        os.close(stdout_fd)
+
+                from_user_fifos, to_user_fifos = node_to_interactor_fifos, interactor_to_node_fifos
+                if transcript:
+                    # the interactor gets its own FIFOs; each node's relays open their ends in the same order
+                    # that the interactor does, and the node side first, so none of them waits on another node.
+                    from_user_fifos = [os.path.join(tmpdirname, f"rec_nod{idx}_to_itc") for idx in range(node_count)]
+                    to_user_fifos = [os.path.join(tmpdirname, f"rec_itc_to_nod{idx}") for idx in range(node_count)]
+                    for fifo in chain(from_user_fifos, to_user_fifos): os.mkfifo(fifo)
+                    def connect(idx):
+                        to_node = open(interactor_to_node_fifos[idx], 'wb', buffering=0)
+                        from_node = open(node_to_interactor_fifos[idx], 'rb', buffering=0)
+                        from_itc = open(to_user_fifos[idx], 'rb', buffering=0)
+                        to_itc = open(from_user_fifos[idx], 'wb', buffering=0)
+                        relay(from_itc, to_node, idx, TO_USER)
+                        relay(from_node, to_itc, idx, FROM_USER)
+                    for idx in range(node_count):
+                        relays.append(Thread(target=connect, args=(idx,), daemon=True))
+                        relays[-1].start()
+
+                # connect these fifos to the stdio's of the nodes
+                itc_process = interactor.get_runner_process(*interactor_args,
+                        '--from-user', *from_user_fifos, '--to-user', *to_user_fifos, **itc_popen)
+                itc_task = supervisor.add(lambda: itc_process, timeout=itc_run.get('timeout'), **itc_labels)
+                node_tasks = [supervisor.add(partial(start_node, idx), timeout=timeout, needs=itc_task, **node_labels(idx))
+                        for idx in range(node_count)]
+
+            supervisor.run()
+            if interaction_mode == IMode.FIFO: info_print("Deleting temporary directory", tmpdirname)
+
+        # a relay whose FIFO was never opened on the other side stays blocked; it's a daemon, so leave it
+        while relays: relays.pop(0).join(timeout=1)
+
+        def result_of(task, check):
+            if task.abandoned:
+                warn_print(f"Warning: {task.label} was never started since the interactor finished first", file=stderr)
+                return ProgramResult(result=None, running_time=None)
+            if task.timed_out:
+                raise subprocess.TimeoutExpired(task.process.args, task.timeout)
+            if check and task.process.returncode:
+                raise subprocess.CalledProcessError(task.process.returncode, task.process.args)
+            return ProgramResult(result=subprocess.CompletedProcess(task.process.args, task.process.returncode),
+                                 running_time=task.running_time if task.time else None)
+
+        cur_results = [self._run(log_exc, result_of, task, check) for task in node_tasks]
+        return cur_results, interactor._run(itc_run.get('log_exc', True), result_of, itc_task, itc_run.get('check', True))
+
+    def do_replay(self, transcript, *args, time=False, label='INTERACTOR', check=False, log_exc=True, **kwargs):
+        """Run only this interactor, feeding it what the nodes sent in the Transcript 'transcript'.
+
+        Returns the ProgramResult, and a list of (node, offset) where what the interactor sent first differs
+        from the transcript. If that's nonempty, the nodes would have behaved differently, so the result is
+        only as good as a guess.
+        """
+        for stream in 'stdin', 'stdout':
+            if stream in kwargs:
+                raise ProgramsError(f"You cannot pass the {stream!r} argument to a replayed interactor")
+        _fix_timeout(kwargs)
+        timeout = kwargs.pop('timeout', None)
+        node_count = transcript.node_count
+        got = {}
+        def take(file, idx):
+            with file: got[idx] = file.read()
+        def feed(file, data):
+            try:
+                with file: file.write(data)
+            except BrokenPipeError:
+                ...
+
+        # TODO match statement
+        if IMode(transcript.info.get('mode', 'stdio')) == IMode.STDIO:
+            process = self.get_runner_process(*args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kwargs)
+            # the threads own the pipes; Popen mustn't close them while data is still in flight
+            (stdin, stdout), process.stdin, process.stdout = (process.stdin, process.stdout), None, None
+            threads = [
+                Thread(target=feed, args=(stdin, transcript.data(0, FROM_USER)), daemon=True),
+                Thread(target=take, args=(stdout, 0), daemon=True),
+            ]
+            for thread in threads: thread.start()
+            result = self._do_run_process(process, time=time, label=label, check=check, log_exc=log_exc, timeout=timeout)
+            for thread in threads: thread.join()
+        else:
+            with tempfile.TemporaryDirectory(prefix='kg_tmp_dir_') as tmpdirname:
+                from_user_fifos = [os.path.join(tmpdirname, f"nod{idx}_to_itc") for idx in range(node_count)]
+                to_user_fifos = [os.path.join(tmpdirname, f"itc_to_nod{idx}") for idx in range(node_count)]
+                for fifo in chain(from_user_fifos, to_user_fifos): os.mkfifo(fifo)
+                threads = [Thread(target=lambda fifo, idx: feed(open(fifo, 'wb'), transcript.data(idx, FROM_USER)),
+                        args=(fifo, idx), daemon=True) for idx, fifo in enumerate(from_user_fifos)]
+                threads += [Thread(target=lambda fifo, idx: take(open(fifo, 'rb'), idx),
+                        args=(fifo, idx), daemon=True) for idx, fifo in enumerate(to_user_fifos)]
+                for thread in threads: thread.start()
+                result = self.do_run(*args, '--from-user', *from_user_fifos, '--to-user', *to_user_fifos,
+                        time=time, label=label, check=check, log_exc=log_exc,
+                        **({'timeout': timeout} if timeout is not None else {}), **kwargs)
+                # a FIFO the interactor never opened blocks its thread; it's a daemon, so leave it
+                for thread in threads: thread.join(timeout=1)
+
+        return result, [*transcript.divergences(got)]
 
 
     def matches_abbr(self, abbr):
@@ -5,9 +5,9 @@ from functools import wraps
 from html.parser import HTMLParser
 from operator import attrgetter
 from random import randrange, shuffle
-from shutil import rmtree, make_archive
+from shutil import rmtree
 from string import ascii_letters, ascii_uppercase, digits
-from subprocess import PIPE, CalledProcessError, SubprocessError, TimeoutExpired
+from subprocess import DEVNULL, PIPE, CalledProcessError, SubprocessError, TimeoutExpired
 from sys import stdin, stdout, stderr
 from textwrap import dedent
 import argparse
@@ -16,20 +16,27 @@ import os.path
 import re
 import tempfile
 import yaml
-import zipfile
 
 from argcomplete import autocomplete
 from jinja2 import Template
 from natsort import natsorted
 
 from ..black_magic import *
+from .archives import *
+from .batch import *
+from .compressed import *
 from .contest_details import *
 from .details import *
+from .extremes import *
 from .formats import *
+from .kompile_cache import *
 from .passwords import *
+from .profiling import *
 from .programs import *
 from .seating import *
 from .testscripts import *
+from .transcripts import *
+from .transfers import *
 from .utils import *
 
 
@@ -107,34 +114,75 @@ convert_p = subparsers.add_parser('konvert',
                 files, and another for the output files, with some additional validity checks (e.g., for HackerRank,
                 input/inputFOO.txt is rejected) and reindexing (e.g., Polygon starts at "1", e.g., tests/1, but
                 HackerRank starts at "00", e.g., input/input00.txt).
+
+
+                The destination can also be an archive, which is written in a single pass, e.g.,
+
+                $ [*[kg convert --from kg . --to polygon zip:path/to/polygon-tests.zip]*]
+
+                "zip:", "tar:", "tar.gz:", "tgz:", "tar.xz:" and "tar.bz2:" are understood.
         ''')))
 convert_p.add_argument('--from', nargs=2, help='source format and location', dest='fr',
                                  metavar=('FROM_FORMAT', 'FROM_FOLDER'), required=True)
 convert_p.add_argument('--to',   nargs=2, help='destination format and location',
                                  metavar=('TO_FORMAT', 'TO_FOLDER'), required=True)
 
+def _add_transfer_arguments(subparser):
+    subparser.add_argument('-m', '--mode', default='copy', choices=[mode.value for mode in TransferMode],
+                                help='how to transfer each file: "copy" (in the kernel if possible), "hardlink" '
+                                '(the new file is the same file, so editing one edits the other!), or "reflink" '
+                                '(copy-on-write, on filesystems that support it like btrfs and XFS). '
+                                'Files that can\'t be linked are copied instead. (default copy)')
+    subparser.add_argument('-V', '--verify', action='store_true',
+                                help='compare checksums of the source and destination files afterwards')
+    subparser.add_argument('-w', '--max-workers', type=int, help=
+            'number of workers to perform the task '
+            "(default is based on Python's default behavior according to "
+            "https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.ThreadPoolExecutor "
+            "which is min(32, os.cpu_count() + 4) as of Python 3.8)")
+
+_add_transfer_arguments(convert_p)
+
 @set_handler(convert_p)
 def kg_convert(format_, args):
     if args.main_command == 'convert':
         info_print("You spelled 'konvert' incorrectly. I'll let it slide for now.", file=stderr)
     
-    convert_formats(args.fr, args.to)
+    convert_formats(args.fr, args.to, mode=args.mode, verify=args.verify, max_workers=args.max_workers)
 
-def convert_formats(src, dest, *, src_kwargs={}, dest_kwargs={}):
+def convert_formats(src, dest, *, src_kwargs={}, dest_kwargs={}, mode=TransferMode.COPY, verify=False,
+        max_workers=None):
     sformat, sloc = src
     dformat, dloc = dest
+    # for archives, the destination names are computed relative to the archive's path, which isn't a folder,
+    # so nothing there is matched
+    archive, dloc = parse_archive_loc(dloc) or (None, dloc)
     src_format = get_format(argparse.Namespace(format=sformat, loc=sloc, input=None, output=None), read='io', **src_kwargs)
     dest_format = get_format(argparse.Namespace(format=dformat, loc=dloc, input=None, output=None), write='io', **dest_kwargs)
 
     copied_i = []
     copied_o = []
-    info_print("Copying now...")
+    pairs = []
     for (srci, srco), (dsti, dsto) in zip(src_format.thru_io(), dest_format.thru_expected_io()):
-        copy_file(srci, dsti)
-        copy_file(srco, dsto)
+        pairs += [(srci, dsti), (srco, dsto)]
         copied_i.append(dsti)
         copied_o.append(dsto)
-    succ_print("Copied", len(copied_i) + len(copied_o), "files")
+
+    if archive:
+        if TransferMode(mode) != TransferMode.COPY or verify:
+            warn_print("Warning: --mode and --verify don't apply when writing to an archive.", file=stderr)
+        info_print("Archiving now...")
+        with open_archive(dloc, archive, max_workers=max_workers) as arch:
+            for source, dest in pairs:
+                if compression_of(source):
+                    arch.add_decompressed(source, os.path.relpath(dest, dloc))
+                else:
+                    arch.add_file(source, os.path.relpath(dest, dloc))
+        succ_print("Archived", len(pairs), "files to", dloc)
+        return copied_i, copied_o
+
+    info_print("Copying now...")
+    succ_print(transfer_summary(transfer_files(pairs, mode, verify=verify, max_workers=max_workers)))
     return copied_i, copied_o
 
 
@@ -176,23 +224,20 @@ convert2_p = subparsers.add_parser('konvert-sequence',
         ''')))
 convert2_p.add_argument('--from', help='source file pattern', dest='fr', required=True)
 convert2_p.add_argument('--to', help='destination file pattern', required=True)
+_add_transfer_arguments(convert2_p)
 
 @set_handler(convert2_p)
 def kg_convert2(format_, args):
     if args.main_command == 'convert-sequence':
         info_print("You spelled 'konvert-sequence' incorrectly. I'll let it slide for now.", file=stderr)
 
-    convert_sequence(args.fr, args.to)
+    convert_sequence(args.fr, args.to, mode=args.mode, verify=args.verify, max_workers=args.max_workers)
 
-def convert_sequence(src, dest):
+def convert_sequence(src, dest, *, mode=TransferMode.COPY, verify=False, max_workers=None):
     format_ = get_format(argparse.Namespace(format=None, loc=None, input=src, output=dest), read='i', write='o')
 
-    copied = 0
     info_print("Copying now...")
-    for srcf, destf in format_.thru_io():
-        copy_file(srcf, destf)
-        copied += 1
-    succ_print("Copied", copied, "files")
+    succ_print(transfer_summary(transfer_files(format_.thru_io(), mode, verify=verify, max_workers=max_workers)))
 
 
 
@@ -428,7 +473,7 @@ def compute_subtasks(subtasks, detector, *, format=None, relpath=None, max_worke
     detector.do_compile()
 
     def produce(index, input_):
-        with open(input_) as f:
+        with data_stdin(input_) as f:
             try:
                 res = detector.do_run(*subtasks, stdin=f, stdout=PIPE, check=True, label='SUBTASK_DETECTOR')
             except CalledProcessError as cpe:
@@ -514,6 +559,7 @@ gen_p.add_argument('-c', '--command', nargs='+', help='solution/data_maker comma
 gen_p.add_argument('-f', '--file', help='solution/data_maker file')
 gen_p.add_argument('-jc', '--judge-command', nargs='+', help='judge command')
 gen_p.add_argument('-jf', '--judge-file', help='judge file')
+gen_p.add_argument('-z', '--compress', choices=[*COMPRESSIONS], help='compress the output files (e.g., "tests/000.ans.gz")')
 gen_p.add_argument('-w', '--max-workers', type=int, help=
         'number of workers to perform the task '
         "(default is based on Python's default behavior according to "
@@ -525,7 +571,7 @@ gen_p.add_argument('-w', '--max-workers', type=int, help=
 @set_handler(gen_p)
 def kg_gen(format_, args):
     if not args.format: args.format = format_
-    format_ = get_format(args, read='i', write='o')
+    format_ = get_format(args, read='i', write='o', compress=args.compress)
     details = Details.from_format_loc(args.format, args.details, relpath=args.loc)
 
     judge_data_maker = Program.from_args(args.file, args.command)
@@ -551,7 +597,11 @@ def generate_outputs(format_, data_maker, *, model_solution=None, judge=None, in
     data_maker_name = 'model_solution' if model_solution == data_maker else 'data_maker'
     interaction_mode = IMode.FIFO if node_count is not None and node_count > 1 else IMode.STDIO
 
+    # send the files to a few long-lived checker processes if possible
+    batch = BatchChecker(judge, max_workers=max_workers) if judge and model_solution and supports_batch(judge) else None
+
     def produce(index, input_, output_):
+        nonlocal batch
         def pref(print, *args, **kwargs):
             info_print(f"[{index}]".rjust(5), end=' ')
             print(*args, **kwargs)
@@ -561,15 +611,16 @@ def generate_outputs(format_, data_maker, *, model_solution=None, judge=None, in
             if interacts:
                 if not interactor:
                     raise CommandError('"interacts" is true but no interactor found')
-                data_maker.do_interact(interactor, time=True, label='DATA_MAKER_{id}', check=True,
-                        node_count=node_count,
-                        interaction_mode=interaction_mode,
-                        pass_id=interaction_mode == IMode.FIFO,
-                        interactor_args=[input_, output_],
-                        interactor_kwargs=dict(time=True, label='INTERACTOR', check=True),
-                    )
+                with plain_file(input_) as plain_input, plain_output(output_) as plain_out:
+                    data_maker.do_interact(interactor, time=True, label='DATA_MAKER_{id}', check=True,
+                            node_count=node_count,
+                            interaction_mode=interaction_mode,
+                            pass_id=interaction_mode == IMode.FIFO,
+                            interactor_args=[plain_input, plain_out],
+                            interactor_kwargs=dict(time=True, label='INTERACTOR', check=True),
+                        )
             else:
-                with open(input_) as inp, open(output_, 'w') as outp:
+                with data_stdin(input_) as inp, data_stdout(output_) as outp:
                     data_maker.do_run(stdin=inp, stdout=outp, time=True, label='DATA_MAKER', check=True)
         except InteractorException as ie:
             pref(err_print, f"The interactor raised an error with the {data_maker_name} for {input_}", file=stderr)
@@ -588,16 +639,17 @@ def generate_outputs(format_, data_maker, *, model_solution=None, judge=None, in
                         pref(info_print, f"  Running model solution on {input_}")
                         try:
                             if interactor:
-                                model_solution.do_interact(interactor,
-                                        label='MODEL_SOLUTION_{id}', check=True,
-                                        node_count=node_count,
-                                        interaction_mode=interaction_mode,
-                                        pass_id=interaction_mode == IMode.FIFO,
-                                        interactor_args=[input_, tmp.name],
-                                        interactor_kwargs=dict(label='INTERACTOR', check=True),
-                                    )
+                                with plain_file(input_) as plain_input:
+                                    model_solution.do_interact(interactor,
+                                            label='MODEL_SOLUTION_{id}', check=True,
+                                            node_count=node_count,
+                                            interaction_mode=interaction_mode,
+                                            pass_id=interaction_mode == IMode.FIFO,
+                                            interactor_args=[plain_input, tmp.name],
+                                            interactor_kwargs=dict(label='INTERACTOR', check=True),
+                                        )
                             else:
-                                with open(input_) as inp:
+                                with data_stdin(input_) as inp:
                                     model_solution.do_run(stdin=inp, stdout=tmp, label='MODEL_SOLUTION', check=True)
                         except InteractorException as ie:
                             pref(err_print, f"The interactor raised an error with the model_solution for {input_}", file=stderr)
@@ -606,21 +658,39 @@ def generate_outputs(format_, data_maker, *, model_solution=None, judge=None, in
                             pref(err_print, f"The interaction raised an error for {input_}", file=stderr)
                             raise CommandError(f"The interaction raised an error for {input_}") from se
                         yield tmp.name
-            with model_output() as model_out:
-                try:
-                    judge.do_run(*map(os.path.abspath, (input_, model_out, output_)), check=True, label='CHECKER')
-                except CalledProcessError as cpe:
-                    pref(err_print, f"The judge did not accept {output_}", file=stderr)
-                    raise CommandError(f"The judge did not accept {output_}") from cpe
+            # the checker takes file names, so it gets uncompressed copies
+            with model_output() as model_out, plain_file(input_) as plain_input, plain_file(output_) as plain_out, \
+                    plain_file(model_out) as plain_model_out:
+                result = None
+                runner = batch  # another thread may drop it
+                if runner:
+                    try:
+                        result = runner.check(plain_input, plain_model_out, plain_out, tc_id=index)
+                    except BatchWorkerError as exc:
+                        if batch: warn_print(f"{exc}. Running the checker once per file instead.", file=stderr)
+                        batch = None  # it's still closed at the end
+                if result is not None:
+                    if result['rcode']:
+                        pref(err_print, f"The judge did not accept {output_}: {result['verdict']}", file=stderr)
+                        raise CommandError(f"The judge did not accept {output_}")
+                else:
+                    try:
+                        judge.do_run(*map(os.path.abspath, (plain_input, plain_model_out, plain_out)),
+                                check=True, label='CHECKER')
+                    except CalledProcessError as cpe:
+                        pref(err_print, f"The judge did not accept {output_}", file=stderr)
+                        raise CommandError(f"The judge did not accept {output_}") from cpe
 
         pref(print, info_text('GENERATED ', input_, '-->'), key_text(output_))
         if max_workers == 1: print()
 
-    with thread_pool_executor(
+    with ExitStack() as estack:
+        if batch: estack.enter_context(batch)
+        executor = estack.enter_context(thread_pool_executor(
                 "Generating output files",
                 max_workers=max_workers,
                 thread_name_prefix="kg_gen_output_files",
-            ) as executor:
+            ))
         wait_all(
                 (executor.submit(produce, index, input_, output_) for index, (input_, output_) in enumerate(format_.thru_io())),
                 "generate files",
@@ -697,6 +767,18 @@ test_p = subparsers.add_parser('test',
                 part containing a "-". The "___" will be ignored. For example,
 
                 $ [*[kg test -c java ___-Xss128m Solution -jc java ___-Xss128m Checker]*]
+
+
+                For interactive problems, you may record every interaction with --transcripts, e.g.,
+
+                $ [*[kg test --transcripts transcripts]*]
+
+                This saves everything the solution and the interactor sent each other, so that the runs can be
+                judged again later with "kg replay", without running the solution.
+
+                With --profile-interaction, kg interactors time every line sent to and received from the solution,
+                and the number of queries, a histogram of their round-trip times, and how the time was split
+                between the interactor, the solution and the writing/flushing in between are printed.
         ''')))
 
 test_p.add_argument('-F', '--format', '--fmt', help='format of data')
@@ -720,6 +802,9 @@ test_p.add_argument('-tl', '--time-limit', type=float, help="the problem's time
                                                             "the code will be terminated if it exceeds 4x this time")
 test_p.add_argument('-n', '--node-count', type=int, help="The number of nodes that the solution will be run on. If this "
                                                          "is given, there must also be an interactor.")
+test_p.add_argument('--transcripts', metavar='DIR', help='record each interaction in this folder (for "kg replay")')
+test_p.add_argument('--profile-interaction', action='store_true',
+                                             help='time the round trips between the interactor and the solution')
 
 # I didn't put workers and Threads here for more accurate timing. TODO reconsider if 'num_cores - 1' threads is ok or something
 @set_handler(test_p)
@@ -750,6 +835,12 @@ def kg_test(format_, args):
         if not interactor: raise CommandError("There must be an interactor if node-count is given")
         interaction_mode = IMode.FIFO
 
+    if args.transcripts:
+        if not interactor: raise CommandError("Transcripts can only be recorded if there is an interactor")
+        os.makedirs(args.transcripts, exist_ok=True)
+    if args.profile_interaction and not interactor:
+        raise CommandError("Interactions can only be profiled if there is an interactor")
+
     interactor_strict_args = interactor and not interactor.filename.endswith('.py') # this is hacky for now...
     judge_strict_args = args.judge_strict_args
     # *_strict_args should probably be subsumed by arg formatting in details.json?
@@ -757,7 +848,11 @@ def kg_test(format_, args):
     solution.do_compile()
     judge.do_compile()
     if interactor: interactor.do_compile()
+
+    # a single long-lived checker process, if it supports it
+    batch = BatchChecker(judge, '-v', max_workers=1) if supports_batch(judge) and not judge_strict_args else None
     scoresheet = {}
+    profiles = []
     for index, (input_, output_) in enumerate(format_.thru_io()):
         def get_score():
             nonlocal interactor_strict_args, judge_strict_args
@@ -766,14 +861,25 @@ def kg_test(format_, args):
                 result_tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_res_{index:>03}_'))
                 if interactor and not interactor_strict_args:
                     dummy_tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_dmy_{index:>03}_'))
+                if args.profile_interaction:
+                    profile_tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_prf_{index:>03}_'))
                 info_print("\nFile", str(index).rjust(3), 'CHECKING AGAINST', input_)
                 solutions_res = None
                 interactor_res = None
+                plain_input = None  # an uncompressed copy, for the programs that take file names
                 try:
                     if interactor:
-                        iargs = [input_, tmp.name]
+                        plain_input = estack.enter_context(plain_file(input_))
+                        iargs = [plain_input, tmp.name]
                         if not interactor_strict_args:
                             iargs += [dummy_tmp.name, result_tmp.name, '-C', solution.filename, '-t', str(index), '-v']
+                        transcript = None
+                        if args.transcripts:
+                            transcript = estack.enter_context(TranscriptWriter(
+                                    os.path.join(args.transcripts, f'{index:>03}.kgt'),
+                                    input=os.path.abspath(input_), judge=os.path.abspath(output_), index=index,
+                                    solution=solution.filename, node_count=node_count, mode=interaction_mode.value))
+                            info_print("Recording the interaction in", transcript.filename)
                         solutions_res, interactor_res = solution.do_interact(
                                 interactor,
                                 time=True,
@@ -784,12 +890,14 @@ def kg_test(format_, args):
                                 pass_id=interaction_mode == IMode.FIFO,
                                 node_count=node_count,
                                 interactor_args=iargs,
-                                interactor_kwargs=dict(check=False),
+                                interactor_kwargs=dict(check=False,
+                                    **({'env': interaction_profile_env(profile_tmp.name)} if args.profile_interaction else {})),
+                                transcript=transcript,
                                 time_limit=time_limit,
                             )
                     else:
                         assert node_count == 1
-                        with open(input_) as inp:
+                        with data_stdin(input_) as inp:
                             solutions_res = [solution.do_run(
                                     stdin=inp,
                                     stdout=tmp,
@@ -812,14 +920,33 @@ def kg_test(format_, args):
                     if solutions_res:
                         runtimes = [sres.running_time for sres in solutions_res if sres.running_time is not None]
                         if runtimes: get_score.running_time = sum(runtimes), max(runtimes)
+                    if args.profile_interaction:
+                        profile = read_interaction_profile(profile_tmp.name)
+                        if profile:
+                            print_interaction_profile(profile)
+                            profiles.append(profile)
+                        else:
+                            warn_print("Warning: The interactor didn't write a profile (only kg interactors do).")
 
                 # Check if the interactor issues WA by itself. Don't invoke the judge
                 if interactor_res and getattr(interactor_res.result, 'returncode', 0):
                     err_print('The interactor did not accept the interaction...')
                     return False, 0
 
+                # the checker takes file names, so it gets uncompressed copies
+                if plain_input is None: plain_input = estack.enter_context(plain_file(input_))
+                plain_out = estack.enter_context(plain_file(output_))
                 def run_judge():
-                    jargs = list(map(os.path.abspath, (input_, tmp.name, output_)))
+                    nonlocal batch
+                    if batch:
+                        try:
+                            return batch.check(plain_input, tmp.name, plain_out,
+                                    result_file=result_tmp.name, code=solution.filename, tc_id=index)['rcode']
+                        except BatchWorkerError as exc:
+                            warn_print(f"{exc}. Running the checker once per file instead.", file=stderr)
+                            batch.close()
+                            batch = None
+                    jargs = list(map(os.path.abspath, (plain_input, tmp.name, plain_out)))
                     if not judge_strict_args:
                         jargs += [result_tmp.name, '-C', solution.filename, '-t', str(index), '-v']
                     return judge.do_run(*jargs, check=False).result.returncode
@@ -874,6 +1001,8 @@ def kg_test(format_, args):
         if not 0 <= score <= 1:
             warn_print(f"Warning: The score '{score}' is invalid; it must be in the interval [0, 1].")
 
+    if batch: batch.close()
+
     def abbreviate_indices(indices):
         if not indices: return 'none'
         return compress_t_sequence(','.join(map(str, sorted(indices))))
@@ -1024,11 +1153,133 @@ def kg_test(format_, args):
           sep='')
     info_print(f'using the scoring policy {details.logical_scoring}')
 
+    if profiles:
+        total = None
+        for profile in profiles: total = merge_interaction_profiles(total, profile)
+        print()
+        info_print(f"Over all {len(profiles)} profiled files:")
+        print_interaction_profile(total)
+
     print()
     info_print("You can clear temp files by running 'kg-aux clear-temp-files'")
 
 
 
+##########################################
+# judge recorded interactions again
+
+replay_p = subparsers.add_parser('replay',
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+               help='Judge recorded interactions again, without running the solution',
+        description=cformat_text(dedent('''\
+                Judge interactions recorded by "kg test --transcripts" again, without running the solution.
+
+                $ [*[kg replay [transcripts]]*]
+
+                This runs only the interactor, feeding it what the solution sent in each transcript, and then runs
+                the checker as "kg test" would. [transcripts] may be transcript files or folders containing them.
+                This is useful after fixing the interactor or the checker, for example,
+
+                $ [*[kg test --transcripts transcripts]*]
+                $ [*[kg replay transcripts -if interactor.py -jf checker.py]*]
+
+                If the interactor now sends something different, then the solution would have behaved differently,
+                so the verdict is only a guess; such transcripts are reported. Run "kg test" again for those.
+
+                If you wrote your problem using "kg init", then you may omit "-if" and "-jf"; they will be parsed
+                from details.json.
+        ''')))
+
+replay_p.add_argument('transcripts', nargs='+', help='transcript files, or folders containing them')
+replay_p.add_argument('-F', '--format', '--fmt', help='format of data')
+replay_p.add_argument('-l', '--loc', default='.', help='location to run commands on')
+replay_p.add_argument('-d', '--details', help=argparse.SUPPRESS)
+replay_p.add_argument('-jc', '--judge-command', nargs='+', help='judge command')
+replay_p.add_argument('-jf', '--judge-file', help='judge file')
+replay_p.add_argument('-js', '--judge-strict-args', action='store_true',
+                                                    help="whether the checker is strict and doesn't work if "
+                                                         "extra arguments are given to it")
+replay_p.add_argument('-ic', '--interactor-command', nargs='+', help='interactor command')
+replay_p.add_argument('-if', '--interactor-file', help='interactor file')
+
+@set_handler(replay_p)
+def kg_replay(format_, args):
+    if not args.format: args.format = format_
+    details = Details.from_format_loc(args.format, args.details, relpath=args.loc)
+
+    judge = Program.from_args(args.judge_file, args.judge_command) or details.checker
+    if not judge: raise CommandError("Missing judge")
+
+    interactor = Program.from_args(args.interactor_file, args.interactor_command) or details.interactor
+    if not interactor: raise CommandError("Missing interactor")
+
+    filenames = []
+    for path in args.transcripts:
+        if os.path.isdir(path):
+            filenames += natsorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.kgt'))
+        else:
+            filenames.append(path)
+    if not filenames: raise CommandError("No transcripts found")
+
+    interactor_strict_args = not interactor.filename.endswith('.py') # same as in 'kg test'
+    judge_strict_args = args.judge_strict_args
+    judge.do_compile()
+    interactor.do_compile()
+
+    corrects = []
+    diverged = []
+    for filename in filenames:
+        transcript = Transcript.read(filename)
+        index = transcript.info.get('index', 0)
+        input_, output_ = transcript.info['input'], transcript.info['judge']
+        code = transcript.info.get('solution', '')
+        with ExitStack() as estack:
+            tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_out_{index:>03}_'))
+            result_tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_res_{index:>03}_'))
+            info_print("\nReplaying", filename, 'AGAINST', input_)
+            input_ = estack.enter_context(plain_file(input_))
+            output_ = estack.enter_context(plain_file(output_))
+            iargs = [input_, tmp.name]
+            if not interactor_strict_args:
+                dummy_tmp = estack.enter_context(tempfile.NamedTemporaryFile(delete=False, prefix=f'kg_tmp_dmy_{index:>03}_'))
+                iargs += [dummy_tmp.name, result_tmp.name, '-C', code, '-t', str(index), '-v']
+            interactor_res, divergences = interactor.do_replay(transcript, *iargs, time=True, check=False)
+            for node, offset in divergences:
+                warn_print(f"Warning: The interactor now sends something else to node {node} (starting at byte {offset}); "
+                            "the solution would have to be run again to be sure.")
+            if divergences: diverged.append(filename)
+
+            def run_judge():
+                jargs = list(map(os.path.abspath, (input_, tmp.name, output_)))
+                if not judge_strict_args:
+                    jargs += [result_tmp.name, '-C', code, '-t', str(index), '-v']
+                return judge.do_run(*jargs, check=False).result.returncode
+
+            if interactor_res.result.returncode:
+                err_print('The interactor did not accept the interaction...')
+                correct = False
+            else:
+                info_print("Checking the output...")
+                returncode = run_judge()
+                if returncode == 3 and not judge_strict_args: # try again but assume the judge is strict
+                    judge_strict_args = True
+                    returncode = run_judge()
+                correct = returncode == 0
+
+        corrects.append(correct)
+        if correct:
+            succ_print(filename, 'correct')
+        else:
+            err_print(filename, 'WRONG' + '!'*11)
+
+    print()
+    (succ_print if all(corrects) else err_print)(f"{sum(corrects)} out of {len(corrects)} transcripts correct")
+    if diverged:
+        warn_print(f"The interactor behaved differently in {len(diverged)} transcript(s); run 'kg test' again for:",
+                *diverged)
+
+
+
 ##########################################
 # just run the solution
 
@@ -1101,7 +1352,7 @@ def kg_run(format_, args):
 
     solution.do_compile()
     for input_ in format_.thru_inputs():
-        with open(input_) as inp:
+        with data_stdin(input_) as inp:
             info_print('RUNNING FOR', input_, file=stderr)
             try:
                 solution.do_run(stdin=inp, time=True, label='PROGRAM', check=True)
@@ -1160,6 +1411,11 @@ make_p.add_argument('-l', '--loc', default='.', help='location to run commands o
 make_p.add_argument('-d', '--details', help=argparse.SUPPRESS)
 make_p.add_argument('-V', '--validation', action='store_true', help="Validate the input files against the validators")
 make_p.add_argument('-C', '--checks', action='store_true', help="Check the output file against the checker")
+make_p.add_argument('-X', '--extremes', action='store_true', help=
+        "Report the extreme values of the validator's bounds that no input file reaches (implies -V)")
+make_p.add_argument('-z', '--compress', choices=[*COMPRESSIONS], help=
+        'compress the output files (e.g., "tests/000.ans.gz"). Compressed input and output files are always '
+        'understood, and decompressed on the fly')
 make_p.add_argument('-w', '--max-workers', type=int, help=
         'number of workers to perform the task '
         "(default is based on Python's default behavior according to "
@@ -1172,9 +1428,11 @@ def _kg_make(format_, args):
         raise CommandError(f"You can't use '{format_}' format to 'make'.")
 
     details = Details.from_format_loc(format_, args.details, relpath=args.loc)
-    kg_make(args.makes, args.loc, format_, details, validation=args.validation, checks=args.checks, max_workers=args.max_workers)
+    kg_make(args.makes, args.loc, format_, details, validation=args.validation, checks=args.checks,
+            extremes=args.extremes, compress=args.compress, max_workers=args.max_workers)
 
-def kg_make(omakes, loc, format_, details, *, validation=False, checks=False, max_workers=None):
+def kg_make(omakes, loc, format_, details, *, validation=False, checks=False, extremes=False, compress=None,
+        max_workers=None):
     makes = set(omakes)
     valid_makes = {'all', 'inputs', 'outputs', 'subtasks'}
     if not (makes <= valid_makes):
@@ -1184,6 +1442,11 @@ def kg_make(omakes, loc, format_, details, *, validation=False, checks=False, ma
         makes |= valid_makes
         validation = checks = True
 
+    if extremes:
+        if 'inputs' not in makes:
+            raise CommandError("--extremes only works when making inputs")
+        validation = True
+
     if 'inputs' in makes:
         decor_print()
         decor_print('~~ '*14)
@@ -1196,21 +1459,27 @@ def kg_make(omakes, loc, format_, details, *, validation=False, checks=False, ma
 
         fmt = get_format_from_type(format_, loc, write='i', clear='i')
 
+        found_extremes = {} if extremes else None
         filenames = [*run_testscript(
                 fmt.thru_expected_inputs(),
                 script,
                 details.generators,
                 relpath=loc,
                 validator=details.validator if validation else None,
+                extremes=found_extremes,
                 max_workers=max_workers)]
 
+        if extremes:
+            collect_subtask_extremes(found_extremes, details, filenames, max_workers=max_workers)
+            print_extremes_report(found_extremes)
+
         succ_print('DONE MAKING INPUTS.')
 
     if 'outputs' in makes:
         decor_print()
         decor_print('~~ '*14)
         beginfo_print('MAKING OUTPUTS...' + ("WITH CHECKS..." if checks else 'WITHOUT CHECKS'))
-        fmt = get_format_from_type(format_, loc, read='i', write='o', clear='o')
+        fmt = get_format_from_type(format_, loc, read='i', write='o', clear='o', compress=compress)
         interacts = details.judge_data_maker.attributes.get('interacts') or details.interactor and details.model_solution == details.judge_data_maker
         generate_outputs(
                 fmt, details.judge_data_maker,
@@ -1262,6 +1531,40 @@ def kg_make(omakes, loc, format_, details, *, validation=False, checks=False, ma
     info_print("You can clear temp files by running 'kg-aux clear-temp-files'")
 
 
+def collect_subtask_extremes(found_extremes, details, filenames, *, max_workers=None):
+    if not (details.validator and details.valid_subtasks): return
+    info_print("Collecting extremes per subtask...")
+
+    batch = BatchValidator(details.validator, '--detect-subtasks', max_workers=max_workers, extremes=True) if (
+            supports_batch(details.validator)) else None
+
+    def collect(filename):
+        # a kg validator in subtask detection mode records the extremes of each subtask the file belongs to
+        nonlocal batch
+        runner = batch  # another thread may drop it
+        if runner:
+            try:
+                return runner.query(filename).get('extremes')
+            except BatchWorkerError as exc:
+                if batch: warn_print(f"{exc}. Running the validator once per file instead.", file=stderr)
+                batch = None  # it's still closed at the end
+        return run_validator_with_extremes(details.validator, filename, '--detect-subtasks',
+                check=False, stdout=DEVNULL, label='VALIDATOR')
+
+    with contextlib.ExitStack() as estack:
+        if batch: estack.enter_context(batch)
+        executor = estack.enter_context(thread_pool_executor(
+                "Collecting extremes",
+                max_workers=max_workers,
+                thread_name_prefix="kg_collect_extremes",
+            ))
+        for filename, records in zip(filenames, executor.map(collect, filenames)):
+            if records is None:
+                warn_print(f"Warning: the validator didn't record subtask extremes for {filename}")
+            else:
+                merge_extremes(found_extremes, records)
+
+
 def construct_subs_files(subtasks_of):
     prev, lf, rg = None, 0, -1
     for idx, file in enumerate(subtasks_of):
@@ -1498,6 +1801,18 @@ compile_p.add_argument('-w', '--max-workers', type=int, help=
         "(default is based on Python's default behavior according to "
         "https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.ThreadPoolExecutor "
         "which is min(32, os.cpu_count() + 4) as of Python 3.8)")
+compile_p.add_argument('-a', '--archive', nargs='?', const='zip', choices=[*ARCHIVE_KINDS],
+                                help='also pack each kompiled folder into an archive beside it '
+                                '(e.g., "kgkompiled/pg.zip"), with deterministic contents (default zip)')
+compile_p.add_argument('-nt', '--no-tree-shake', action='store_true',
+                                help="keep every function and class of the imported modules, even the ones that "
+                                "the program never uses. (By default, these are dropped to make the files smaller.)")
+compile_p.add_argument('-nc', '--no-cache', action='store_true',
+                                help='kompile everything from scratch, ignoring (and not updating) the kompile cache. '
+                                'By default, parsed modules and kompiled files are cached across runs in the folder '
+                                'KG_KOMPILE_CACHE (or in ~/.cache/kompgen), so only the files whose sources changed '
+                                'are kompiled again. Set KG_KOMPILE_CACHE to "off" to never use it, and '
+                                'KG_KOMPILE_CACHE_SIZE to the most megabytes it may take up (default 200).')
 
 @set_handler(compile_p)
 def _kg_compile(format_, args):
@@ -1511,16 +1826,20 @@ def _kg_compile(format_, args):
         loc=args.loc,
         shift_left=args.shift_left,
         compress=args.compress,
+        tree_shake=not args.no_tree_shake,
+        archive=args.archive,
         files=args.files,
         extra_files=args.extra_files,
         max_workers=args.max_workers,
+        cache=not args.no_cache,
         )
 
 def _get_cms_code(details, code_raw):
     return details.cms_options.get('name', ''.join(re.split(r'[._-]', code_raw)))
 
 def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, compress=False, python3='python3',
-        dest_loc=None, files=[], extra_files=[], statement_file=None, global_statement_file=None, max_workers=None):
+        dest_loc=None, files=[], extra_files=[], statement_file=None, global_statement_file=None, max_workers=None,
+        tree_shake=True, cache=True, archive=None):
 
     valid_formats = {'hr', 'pg', 'pc2', 'dom', 'cms', 'cms-it'}
     if not set(target_formats) <= valid_formats:
@@ -1574,6 +1893,15 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
 
         return nmodule
 
+    kompile_cache_dir = kompile_cache_folder() if cache else None
+    kompile_cache = KompileCache(kompile_cache_dir) if kompile_cache_dir else None
+    def kompile(module, **context):
+        if kompile_cache:
+            return kompile_cache.compile_lines(module, load_module, get_module_id, **context)
+        lines, add_context = load_module(module)
+        return list(compile_lines(lines, module_id=module, load_module=load_module, get_module_id=get_module_id,
+                **context, **add_context))
+
     # get the statement file
     statement_file = (
         statement_file or details.statement_compiled or global_statement_file or
@@ -1783,12 +2111,8 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
             module = get_module(filename)
             info_print(f'[{module}] converting {filename} to {targets[module]} (kompiling)')
             touch_container(targets[module])
-            lines, add_context = load_module(module)
-            lines = list(compile_lines(lines,
-                    module_id=module,
+            lines = kompile(module,
                     module_file=filename,
-                    load_module=load_module,
-                    get_module_id=get_module_id,
                     format=fmt,
                     details=details,
                     subtasks_files=subtasks_files,
@@ -1796,8 +2120,8 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
                     subtasks_only=False,
                     shift_left=shift_left,
                     compress=compress,
-                    **add_context,
-                ))
+                    tree_shake=tree_shake,
+                )
             with open(targets[module], 'w') as f:
                 shebanged = False
                 for line in lines:
@@ -1833,12 +2157,8 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
                     target = os.path.join(dest_folder, 'hr.pastable.version.' + os.path.basename(filename))
                     info_print(f'[{module}] writing snippet version of {filename} to {target}')
                     touch_container(target)
-                    lines, add_context = load_module(module)
-                    lines = list(compile_lines(lines,
-                            module_id=module,
+                    lines = kompile(module,
                             module_file=filename,
-                            load_module=load_module,
-                            get_module_id=get_module_id,
                             format=fmt,
                             details=details,
                             subtasks_files=subtasks_files,
@@ -1846,8 +2166,7 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
                             subtasks_only=False,
                             shift_left=shift_left,
                             compress=compress,
-                            **add_context,
-                        ))
+                        )
                     with open(target, 'w') as f:
                         print("# NOTE: THIS SCRIPT IS MEANT TO BE PASTED TO HACKERRANK'S CUSTOM CHECKER, NOT RUN ON ITS OWN.",
                                 file=f)
@@ -1858,20 +2177,15 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
                     target = os.path.join(dest_folder, 'hr.subtasks.only.' + os.path.basename(filename))
                     info_print(f'[{module}] writing the subtasks snippet of {filename} to {target}')
                     touch_container(target)
-                    lines, add_context = load_module(module)
-                    lines = list(compile_lines(lines,
-                            module_id=module,
+                    lines = kompile(module,
                             module_file=filename,
-                            load_module=load_module,
-                            get_module_id=get_module_id,
                             format=fmt,
                             details=details,
                             subtasks_files=subtasks_files,
                             snippet=True,
                             subtasks_only=True,
                             write=False,
-                            **add_context,
-                        ))
+                        )
                     with open(target, 'w') as f:
                         print('# NOTE: THIS SCRIPT IS NOT MEANT TO BE RUN ON ITS OWN.', file=f)
                         for line in lines:
@@ -1941,13 +2255,12 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
             else:
                 i_o_reps = i_os
 
-            copied = 0
             info_print("Copying now...")
-            for (srci, srco), (dsti, dsto) in zip(i_o_reps, CMSItFormat(dest_folder, write='io').thru_expected_io()):
-                copy_file(srci, dsti)
-                copy_file(srco, dsto)
-                copied += 2
-            succ_print(f"Copied {copied} files (originally {len(i_os)*2})")
+            pairs = [pair
+                    for (srci, srco), (dsti, dsto) in zip(i_o_reps, CMSItFormat(dest_folder, write='io').thru_expected_io())
+                    for pair in [(srci, dsti), (srco, dsto)]]
+            transfer_files(pairs, max_workers=max_workers)  # this also decompresses compressed tests
+            succ_print(f"Copied {len(pairs)} files (originally {len(i_os)*2})")
 
             # task.yaml
             info_print('writing task.yaml')
@@ -2102,19 +2415,19 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
             def get_arcname(filename):
                 assert os.path.samefile(tests_folder, os.path.commonpath([tests_folder, filename]))
                 return os.path.relpath(filename, start=tests_folder)
-            with zipfile.ZipFile(tests_zipname, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with open_archive(tests_zipname, 'zip', max_workers=max_workers) as arch:
                 for inp, outp in CMSFormat(dest_folder, read='io', **config).thru_io():
                     for fl in inp, outp:
-                        zipf.write(fl, arcname=get_arcname(fl))
+                        arch.add_file(fl, get_arcname(fl))
 
             all_zipname = os.path.join(dest_folder, 'cms_all.zip')
             info_print('making whole zip for CMS...', all_zipname)
-            with zipfile.ZipFile(all_zipname, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with open_archive(all_zipname, 'zip', max_workers=max_workers) as arch:
                 for fl in ([tests_zipname, config_file] + [
                             os.path.join(dest_folder, filename)
                             for filename in ['checker'] + [os.path.basename(grader.filename) for grader in graders]
                         ]):
-                    zipf.write(fl, arcname=os.path.basename(fl))
+                    arch.add_file(fl, os.path.basename(fl))
 
         if fmt == 'pg' and problem_code:
             zipname = os.path.join(dest_folder, 'upload_this_to_polygon_but_rarely.zip')
@@ -2123,9 +2436,9 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
             def get_arcname(filename):
                 assert os.path.samefile(tests_folder, os.path.commonpath([tests_folder, filename]))
                 return os.path.relpath(filename, start=tests_folder)
-            with zipfile.ZipFile(zipname, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with open_archive(zipname, 'zip', max_workers=max_workers) as arch:
                 for inp in PGFormat(dest_folder, read='i').thru_inputs():
-                    zipf.write(inp, arcname=get_arcname(inp))
+                    arch.add_file(inp, get_arcname(inp))
 
         if fmt == 'hr' and problem_code:
             zipname = os.path.join(dest_folder, 'upload_this_to_hackerrank.zip')
@@ -2133,15 +2446,26 @@ def kg_compile(format_, details, *target_formats, loc='.', shift_left=False, com
             def get_arcname(filename):
                 assert os.path.samefile(dest_folder, os.path.commonpath([dest_folder, filename]))
                 return os.path.relpath(filename, start=dest_folder)
-            with zipfile.ZipFile(zipname, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with open_archive(zipname, 'zip', max_workers=max_workers) as arch:
                 for inp, outp in HRFormat(dest_folder, read='io').thru_io():
                     for fl in inp, outp:
-                        zipf.write(fl, arcname=get_arcname(fl))
+                        arch.add_file(fl, get_arcname(fl))
+
+        if archive:
+            archive_name = dest_folder.rstrip(os.sep) + ARCHIVE_KINDS[archive]
+            info_print(f'packing {dest_folder} into {archive_name}...')
+            with open_archive(archive_name, archive, max_workers=max_workers) as arch:
+                arch.add_tree(dest_folder)
 
         succ_print(f'Done compiling problem "{problem_code}"" for {fmt} ({name})')
 
     decor_print('.. '*14)
 
+    if kompile_cache and kompile_cache.reused + kompile_cache.kompiled:
+        info_print(f'Kompile cache: reused {kompile_cache.reused}, kompiled {kompile_cache.kompiled} file(s) '
+                   f'(parsed {kompile_cache.parse_cache.misses} module(s), {kompile_cache.parse_cache.hits} cached)')
+    if kompile_cache: kompile_cache.prune()
+
     if subtask_score.missing:
         warn_print('Warning: some subtask scores missing. You may want to turn "valid_subtasks" into a list that '
                 'looks like [{"id": 1, "score": 20}, {"id": 2, "score": 30}] ...')
@@ -2203,6 +2527,9 @@ contest_p.add_argument('-m', '--make-all', action='store_true', help='Run "kg ma
 contest_p.add_argument('-ns', '--no-seating', action='store_true', help='Skip the creation of the seating arrangement')
 contest_p.add_argument('-t', '--target-loc', help='Specify the final location of the contest folder in the contest system')
 contest_p.add_argument('-s', '--seed', type=int, help='Initial seed to use')
+contest_p.add_argument('-a', '--archive', nargs='?', const='zip', choices=[*ARCHIVE_KINDS],
+                                help='also pack the contest folder into an archive beside it '
+                                '(e.g., "kgkompiled/[contestcode].zip"), with deterministic contents (default zip)')
 
 def problem_letters():
     for l in count(1):
@@ -2543,7 +2870,8 @@ def kg_contest(format_, args):
 
                     dest = os.path.join(contest_folder, 'UPLOADS', 'UPLOAD_1ST_executables', f'{name}_{problem_code}')
                     info_print('Zipping', name, 'to', f'{dest}.zip')
-                    make_archive(dest, 'zip', os.path.join(problems_folder, problem_code, targ))
+                    with open_archive(f'{dest}.zip') as arch:
+                        arch.add_tree(os.path.join(problems_folder, problem_code, targ))
 
             # copy model solution
             info_print("Copying model solution")
@@ -2566,12 +2894,11 @@ def kg_contest(format_, args):
             for data_loc in data_locs:
                 info_print("Copying to", data_loc)
                 dest_format = KGFormat(write='io', tests_folder=data_loc)
-                copied = 0
-                for (srci, srco), (dsti, dsto) in zip(src_format.thru_io(), dest_format.thru_expected_io()):
-                    copy_file(srci, dsti)
-                    copy_file(srco, dsto)
-                    copied += 2
-                succ_print("Copied", copied, "files")
+                pairs = [pair
+                        for (srci, srco), (dsti, dsto) in zip(src_format.thru_io(), dest_format.thru_expected_io())
+                        for pair in [(srci, dsti), (srco, dsto)]]
+                transfer_files(pairs)  # this also decompresses compressed tests
+                succ_print("Copied", len(pairs), "files")
 
             if args.format == 'dom':
                 # zip the whole problem folder (for upload)
@@ -2579,7 +2906,8 @@ def kg_contest(format_, args):
                 
                 info_print('Zipping the whole thing...')
                 info_print('target is', dest + '.zip')
-                make_archive(dest, 'zip', os.path.join(problems_folder, problem_code))
+                with open_archive(f'{dest}.zip') as arch:
+                    arch.add_tree(os.path.join(problems_folder, problem_code))
                 info_print('Done.')
 
 
@@ -2593,6 +2921,14 @@ def kg_contest(format_, args):
         warn_print("Note: There seems to be no way to import contest configuration to DOMjudge, ")
         warn_print("so you'll have to do that manually.")
 
+    if args.archive:
+        archive_name = contest_folder + ARCHIVE_KINDS[args.archive]
+        decor_print()
+        decor_print('-'*42)
+        beginfo_print(f'Packing {contest_folder} into {archive_name}')
+        with open_archive(archive_name, args.archive) as arch:
+            arch.add_tree(contest_folder, contest.code)
+
     decor_print()
     decor_print('-'*42)
     succ_print('See docs/CONTEST.md for the next steps to finish preparing the contest.')
@@ -0,0 +1,124 @@
+from selectors import DefaultSelector, EVENT_READ
+from sys import stderr
+import errno
+import os
+import time as timel
+
+from .utils import *
+
+# Runs a bunch of processes to completion from a single thread: processes that can't be started yet are
+# retried (with backoff), finished ones are noticed via pidfds if the OS has them (polled otherwise), and
+# each process is killed when its own timeout runs out.
+
+class Supervised:
+    def __init__(self, start, *, label=None, timeout=None, time=False, needs=None):
+        ''' 'start' returns the Popen, or None if it can't be started yet; it's dropped once 'needs' finishes. '''
+        self.start = start
+        self.label = label
+        self.timeout = timeout
+        self.time = time
+        self.needs = needs
+        self.process = None
+        self.abandoned = False
+        self.timed_out = False
+        self.start_time = self.end_time = None
+        super().__init__()
+
+    @property
+    def done(self):
+        return self.abandoned or self.end_time is not None
+
+    @property
+    def running_time(self):
+        return self.end_time - self.start_time if self.end_time is not None else None
+
+    @property
+    def deadline(self):
+        return self.start_time + self.timeout if self.timeout is not None and self.start_time is not None else None
+
+
+def open_fifo_nonblocking(path, flags):
+    ''' Returns a blocking fd, or None if it's for writing and nobody has the FIFO open for reading yet. '''
+    try:
+        fd = os.open(path, flags | os.O_NONBLOCK)
+    except OSError as exc:
+        if exc.errno == errno.ENXIO: return None
+        raise
+    os.set_blocking(fd, True)
+    return fd
+
+
+class Supervisor:
+    def __init__(self, *, interval=0.001, max_interval=0.05):
+        self.tasks = []
+        self.interval = interval
+        self.max_interval = max_interval
+        super().__init__()
+
+    def add(self, start, **kwargs):
+        task = Supervised(start, **kwargs)
+        self.tasks.append(task)
+        return task
+
+    def _finish(self, task, selector, pidfds):
+        task.process.wait()
+        task.end_time = timel.monotonic()
+        if task in pidfds:
+            selector.unregister(pidfds[task])
+            os.close(pidfds.pop(task))
+        if task.time:
+            info_print(f'{task.label or "":>18} elapsed time: {task.running_time:.2f} sec.', file=stderr)
+
+    def run(self):
+        pending = [*self.tasks]
+        running = []
+        pidfds = {}
+        interval = self.interval
+        with DefaultSelector() as selector:
+            try:
+                while pending or running:
+                    progress = False
+                    for task in [*pending]:
+                        if task.needs and task.needs.done:
+                            task.abandoned = True
+                        else:
+                            task.process = task.start()
+                            if task.process is None: continue
+                            task.start_time = timel.monotonic()
+                            running.append(task)
+                            try:
+                                pidfds[task] = os.pidfd_open(task.process.pid)
+                                selector.register(pidfds[task], EVENT_READ, task)
+                            except (AttributeError, OSError):
+                                ...  # no pidfds here; poll it instead
+                        pending.remove(task)
+                        progress = True
+
+                    now = timel.monotonic()
+                    for task in [*running]:
+                        if task.deadline is not None and now >= task.deadline:
+                            task.process.kill()
+                            task.timed_out = True
+                        if task.timed_out or (task not in pidfds and task.process.poll() is not None):
+                            self._finish(task, selector, pidfds)
+                            running.remove(task)
+                            progress = True
+
+                    if not (pending or running): break
+                    interval = self.interval if progress else min(interval * 2, self.max_interval)
+                    timeout = interval if pending or any(task not in pidfds for task in running) else None
+                    deadlines = [task.deadline for task in running if task.deadline is not None]
+                    if deadlines:
+                        until = max(0, min(deadlines) - now)
+                        timeout = until if timeout is None else min(timeout, until)
+                    for key, events in selector.select(timeout):
+                        task = key.data
+                        self._finish(task, selector, pidfds)
+                        running.remove(task)
+            finally:
+                # only on errors; the processes mustn't outlive the supervisor
+                for task in running:
+                    task.process.kill()
+                    task.process.wait()
+                for fd in pidfds.values(): os.close(fd)
+        return self.tasks
@@ -2,10 +2,13 @@ from collections import defaultdict, namedtuple
 from itertools import islice, count
 from subprocess import PIPE
 import concurrent.futures
+import contextlib
 import json
 import os.path
 import re
 
+from .batch import *
+from .extremes import *
 from .formats import *
 from .programs import *
 from .utils import *
@@ -37,7 +40,7 @@ TestScriptGenData = namedtuple('TestScriptGenData', ['src_line', 'gen', 'args',
 TestScriptGen = namedtuple('TestScriptGen', ['src_line', 'gen', 'args', 'single', 'target_indices', 'target', 'dollar_loc', 'rem_args', 'rep_args'])
 TestScript = namedtuple('TestScript', ['src', 'file_count', 'gens', 'start'])
 
-def run_testscript(inputs, testscript_src, generators, *, relpath=None, validator=None, max_workers=None):
+def run_testscript(inputs, testscript_src, generators, *, relpath=None, validator=None, extremes=None, max_workers=None):
     info_print("PARSING TESTSCRIPT")
     ts = compile_testscript(testscript_src, generators, relpath=relpath, max_workers=max_workers)
 
@@ -124,14 +127,32 @@ def run_testscript(inputs, testscript_src, generators, *, relpath=None, validato
         if validator:
             executor.submit(validator.do_compile)
 
+    # send the files to a few long-lived validator processes if possible
+    batch = BatchValidator(validator, max_workers=max_workers, extremes=extremes is not None) if (
+            validator and supports_batch(validator)) else None
+    ext_records = {}
     def validate(filename, index):
         def pref(print, *args, **kwargs):
             info_print(pref_v(index).rjust(mxl), end=' ')
             print(*args, **kwargs)
         if validator:
+            nonlocal batch
             pref(info_print, f'{filename!r} validating...')
-            with open(filename) as file:
-                validator.do_run(stdin=file, check=True, label='VALIDATOR')
+            result = None
+            runner = batch  # another thread may drop it
+            if runner:
+                try:
+                    result = runner.validate(filename)
+                except BatchWorkerError as exc:
+                    if batch: warn_print(f"{exc}. Running the validator once per file instead.", file=stderr)
+                    batch = None  # it's still closed at the end
+            if result is not None:
+                if extremes is not None: ext_records[index] = result.get('extremes')
+            elif extremes is not None:
+                ext_records[index] = run_validator_with_extremes(validator, filename, check=True)
+            else:
+                with open(filename) as file:
+                    validator.do_run(stdin=file, check=True, label='VALIDATOR')
             pref(info_print, f'{filename!r} validated')
             if max_workers == 1: print()
         return filename
@@ -139,11 +160,13 @@ def run_testscript(inputs, testscript_src, generators, *, relpath=None, validato
     def run_and_start_validation(gen):
         return [executor.submit(validate, file, index) for file, index in run_testscript_line(gen)]
 
-    with thread_pool_executor(
+    with contextlib.ExitStack() as estack:
+        if batch: estack.enter_context(batch)
+        executor = estack.enter_context(thread_pool_executor(
                 "Running testscript",
                 max_workers=max_workers,
                 thread_name_prefix="kg_run_testscript",
-            ) as executor:
+            ))
         validate_futures = [
             future
             for futures in wait_all(
@@ -158,6 +181,14 @@ def run_testscript(inputs, testscript_src, generators, *, relpath=None, validato
 
         assert len(set(got_files)) == len(got_files), (got_files, files)
         assert set(got_files) == set(files), (got_files, files)
+
+        if extremes is not None:
+            for index, records in sorted(ext_records.items()):
+                if records is None:
+                    warn_print(f"Warning: the validator didn't record extremes for file {index}")
+                else:
+                    merge_extremes(extremes, records)
+
         return got_files
 
 COMMENT_RE = re.compile(r'^(#.*)\Z')
@@ -0,0 +1,101 @@
+from threading import Lock, Thread
+import json
+import time as timel
+
+# A transcript records everything the nodes and the interactor sent each other: a header line, then one
+# record per chunk read, "<microseconds> <node> <direction> <size>\n" followed by the raw bytes.
+
+class TranscriptError(Exception): ...
+
+TRANSCRIPT_MAGIC = 'kg-transcript'
+FROM_USER = '>'
+TO_USER = '<'
+
+class TranscriptWriter:
+    ''' Thread-safe, so every relay can record into the same transcript. '''
+    def __init__(self, filename, **info):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(f'{TRANSCRIPT_MAGIC} {json.dumps(info)}\n'.encode())
+        self._lock = Lock()
+        self._start = timel.perf_counter()
+        super().__init__()
+
+    def record(self, node, direction, data):
+        stamp = int((timel.perf_counter() - self._start) * 1e6)
+        with self._lock:
+            if self.file.closed: return
+            self.file.write(b'%d %d %s %d\n' % (stamp, node, direction.encode(), len(data)))
+            self.file.write(data)
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Transcript:
+    def __init__(self, info, records):
+        self.info = info
+        self.records = records
+        super().__init__()
+
+    @classmethod
+    def read(cls, filename):
+        records = []
+        with open(filename, 'rb') as f:
+            magic, _, info = f.readline().decode().partition(' ')
+            if magic != TRANSCRIPT_MAGIC: raise TranscriptError(f"{filename} is not a transcript")
+            for header in iter(f.readline, b''):
+                stamp, node, direction, size = header.split()
+                data = f.read(int(size))
+                if len(data) != int(size): raise TranscriptError(f"{filename} is truncated")
+                records.append((int(stamp), int(node), direction.decode(), data))
+        return cls(json.loads(info), records)
+
+    @property
+    def node_count(self):
+        return self.info.get('node_count', 1)
+
+    def data(self, node, direction):
+        return b''.join(data for stamp, nd, dr, data in self.records if nd == node and dr == direction)
+
+    def divergences(self, got):
+        ''' Where what the interactor sent (got[node]) first differs from the transcript, as (node, offset) pairs '''
+        for node in range(self.node_count):
+            expected, actual = self.data(node, TO_USER), got.get(node, b'')
+            if expected != actual:
+                yield node, next((i for i, (x, y) in enumerate(zip(expected, actual)) if x != y), min(len(expected), len(actual)))
+
+
+def _relay(src, dst, record):
+    # copy everything from src to dst (raw binary files), recording each chunk along the way
+    try:
+        while True:
+            data = src.read(1 << 16)
+            if not data: break
+            record(data)
+            view = memoryview(data)
+            while view: view = view[dst.write(view):]
+    except (BrokenPipeError, ValueError):
+        ...
+    finally:
+        for file in src, dst:
+            try:
+                file.close()
+            except BrokenPipeError:
+                ...
+
+def start_relay(src, dst, record):
+    ''' src and dst are raw binary files, or paths (of FIFOs) which are opened by the relay, src first '''
+    def run():
+        _relay(open(src, 'rb', buffering=0) if isinstance(src, str) else src,
+               open(dst, 'wb', buffering=0) if isinstance(dst, str) else dst, record)
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,111 @@
+from collections import Counter
+from enum import Enum
+from sys import stderr
+import errno
+import hashlib
+import os
+import shutil
+
+from .compressed import *
+from .utils import *
+
+# Moving test data around (e.g., for "kg konvert"): files are copied in the kernel where possible, or linked
+# instead of copied, by a small pool of threads (the syscalls release the GIL).
+
+class TransferError(Exception): ...
+
+class TransferMode(Enum):
+    COPY = 'copy'
+    HARDLINK = 'hardlink'
+    REFLINK = 'reflink'
+
+# copying/linking fails with these if the filesystem (or the OS) doesn't support it; the fallback is a plain copy
+_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+_FICLONE = 0x40049409  # from linux/fs.h
+
+def _copy(source, dest):
+    if not hasattr(os, 'copy_file_range'):
+        shutil.copyfile(source, dest)  # uses sendfile where it can
+        return 'copied'
+    with open(source, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        copied = 0
+        try:
+            while True:
+                count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30)
+                if not count: break
+                copied += count
+        except OSError as exc:
+            if copied or exc.errno not in _UNSUPPORTED: raise
+        else:
+            return 'copied'
+    shutil.copyfile(source, dest)
+    return 'copied'
+
+def _reflink(source, dest):
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    with open(source, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED: raise
+            return None
+    return 'reflinked'
+
+def _hardlink(source, dest):
+    try:
+        os.link(source, dest)
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED: raise
+        return None
+    return 'hardlinked'
+
+def file_digest(filename, *, decompress=False):
+    digest = hashlib.sha256()
+    with (open_data if decompress else open)(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def transfer_file(source, dest, mode=TransferMode.COPY, *, verify=False):
+    '''
+    Returns how the file was transferred: 'copied', 'reflinked', 'hardlinked', 'recompressed' (if source and dest
+    have different compression extensions, e.g., "000.in.gz" and "000.in") or 'skipped' (same file).
+    '''
+    mode = TransferMode(mode)
+    if os.path.exists(dest) and os.path.samefile(source, dest): return 'skipped'
+    # writing over dest in place could change other files linked to it
+    if os.path.lexists(dest): os.unlink(dest)
+    if compression_of(source) != compression_of(dest):
+        recompress_file(source, dest)
+        if verify and file_digest(source, decompress=True) != file_digest(dest, decompress=True):
+            raise TransferError(f"Checksum mismatch after recompressing {source} to {dest}")
+        return 'recompressed'
+    how = (_hardlink(source, dest) if mode == TransferMode.HARDLINK else
+           _reflink(source, dest) if mode == TransferMode.REFLINK else None) or _copy(source, dest)
+    if verify and how != 'hardlinked' and file_digest(source) != file_digest(dest):
+        raise TransferError(f"Checksum mismatch after copying {source} to {dest}")
+    return how
+
+def transfer_files(pairs, mode=TransferMode.COPY, *, verify=False, max_workers=None):
+    ''' Transfers every (source, dest) pair, in parallel. Returns a Counter of how the files were transferred. '''
+    mode = TransferMode(mode)
+    pairs = list(pairs)
+    for folder in sorted({os.path.dirname(dest) for source, dest in pairs} - {''}):
+        touch_dir(folder)
+    with thread_pool_executor(
+                "Transferring files",
+                max_workers=max_workers,
+                thread_name_prefix="kg_transfer_files",
+            ) as executor:
+        hows = Counter(executor.map(lambda pair: transfer_file(*pair, mode, verify=verify), pairs))
+    if mode != TransferMode.COPY and hows['copied']:
+        warn_print(f"Warning: {hows['copied']} file(s) were copied instead, since the filesystem "
+                   f"doesn't support {mode.value}s here.", file=stderr)
+    return hows
+
+def transfer_summary(hows):
+    return ', '.join(f"{how} {count} file{'' if count == 1 else 's'}" for how, count in sorted(hows.items())).capitalize()
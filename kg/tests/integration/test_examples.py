@@ -0,0 +1,48 @@
+import glob, json, os, shutil, subprocess, sys, tempfile
+import unittest
+
+KG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+EXAMPLES = os.path.join(KG_ROOT, 'examples')
+
+def examples():
+    ''' the example problems that have all their programs '''
+    for details_file in sorted(glob.glob(os.path.join(EXAMPLES, '*', 'details.json'))):
+        folder = os.path.dirname(details_file)
+        with open(details_file) as f:
+            details = json.load(f)
+        programs = [details.get(key) for key in ('model_solution', 'validator', 'checker', 'interactor', 'judge_data_maker')]
+        programs += details.get('generators', [])
+        filenames = [program if isinstance(program, str) else program[0] for program in programs if program]
+        if all(os.path.isfile(os.path.join(folder, filename)) for filename in filenames):
+            yield os.path.basename(folder)
+
+def kg(folder, *args):
+    ''' run kg in folder, with this kg and with the kompile cache off '''
+    env = {**os.environ, 'PYTHONPATH': KG_ROOT, 'KG_KOMPILE_CACHE': 'off'}
+    return subprocess.run([sys.executable, '-m', 'kg', *args], cwd=folder, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+
+class TestExamples(unittest.TestCase):
+
+    def test_kompiled_examples(self):
+        # kompile each example, then use the kompiled programs in place of the originals
+        if not os.path.isdir(EXAMPLES): self.skipTest("the examples aren't here")
+        if not shutil.which('g++'): self.skipTest("g++ is needed by some examples")
+        for name in examples():
+            with self.subTest(example=name), tempfile.TemporaryDirectory() as tmp:
+                folder = os.path.join(tmp, name)
+                shutil.copytree(os.path.join(EXAMPLES, name), folder)
+                for args in ['make', 'all'], ['kompile', 'pg']:
+                    res = kg(folder, *args)
+                    self.assertEqual(res.returncode, 0, f'kg {" ".join(args)} failed:\n{res.stdout}')
+
+                kompiled = glob.glob(os.path.join(folder, 'kgkompiled', 'pg', '*.py'))
+                self.assertTrue(kompiled)
+                for filename in kompiled:
+                    shutil.copy(filename, folder)
+
+                for args in ['make', 'all'], ['test']:
+                    res = kg(folder, *args)
+                    self.assertEqual(res.returncode, 0, f'kg {" ".join(args)} failed with the kompiled programs:\n{res.stdout}')
+                self.assertNotIn('WRONG', res.stdout)
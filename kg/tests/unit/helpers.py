@@ -0,0 +1,30 @@
+import os, tempfile
+import unittest
+
+KG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+def write(filename, data):
+    ''' write data (bytes or str) to filename, and return filename '''
+    with open(filename, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
+    return filename
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+class TempDirTestCase(unittest.TestCase):
+    ''' each test gets its own temporary folder, self.tmp '''
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, *names):
+        return os.path.join(self.tmp.name, *names)
+
+    def write(self, name, data):
+        ''' write data to the file "name" in self.tmp, and return its full name '''
+        return write(self.path(name), data)
@@ -0,0 +1,98 @@
+import gzip, os, random, stat, tarfile, zipfile
+
+from ...script.archives import ARCHIVE_KINDS, ArchiveError, archive_kind, open_archive, parse_archive_loc
+from .helpers import TempDirTestCase, read, write
+
+FILES = {
+    'details.json': b'{"title": "Addition"}\n',
+    'tests/000.in': b'1\n2 3\n' * 5000,
+    'tests/000.ans': b'5\n',
+    'tests/empty.in': b'',
+    # incompressible, so it's stored instead
+    'tests/random.bin': random.Random(11).getrandbits(8 * 100000).to_bytes(100000, 'little'),
+}
+
+def make_tree(folder):
+    for name, data in FILES.items():
+        path = os.path.join(folder, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(path, data)
+    script = os.path.join(folder, 'run.sh')
+    write(script, b'#!/bin/sh\n')
+    os.chmod(script, 0o755)
+    with gzip.open(os.path.join(folder, 'big.in.gz'), 'wb') as f:
+        f.write(b'9 ' * 10000)
+
+
+class TestArchives(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = self.path('problem')
+        make_tree(self.folder)
+
+    def archive(self, kind, name, max_workers=None):
+        filename = self.path(name + ARCHIVE_KINDS[kind])
+        with open_archive(filename, max_workers=max_workers) as arch:
+            arch.add_tree(self.folder, 'problem')
+            arch.add_decompressed(os.path.join(self.folder, 'big.in.gz'), 'big.in')
+            arch.add_bytes(b'extra\n', 'extra.txt')
+        return filename, read(filename)
+
+    def test_deterministic(self):
+        for kind in ARCHIVE_KINDS:
+            with self.subTest(kind=kind):
+                filename, first = self.archive(kind, 'first', max_workers=1)
+                # the timestamps and the number of threads don't matter
+                for root, dirs, files in os.walk(self.folder):
+                    for name in dirs + files: os.utime(os.path.join(root, name), (12345, 67890))
+                _, second = self.archive(kind, 'second', max_workers=8)
+                self.assertEqual(first, second)
+
+    def test_zip_contents(self):
+        filename, _ = self.archive('zip', 'problem')
+        with zipfile.ZipFile(filename) as arch:
+            self.assertIsNone(arch.testzip())
+            for name, data in FILES.items():
+                self.assertEqual(arch.read('problem/' + name), data)
+            self.assertEqual(arch.read('big.in'), b'9 ' * 10000)
+            self.assertEqual(arch.read('extra.txt'), b'extra\n')
+            self.assertIn('problem/tests/', arch.namelist())
+            self.assertEqual(arch.getinfo('problem/tests/random.bin').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(arch.getinfo('problem/tests/000.in').compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(stat.S_IMODE(arch.getinfo('problem/run.sh').external_attr >> 16), 0o755)
+            self.assertEqual({info.date_time for info in arch.infolist()}, {(1980, 1, 1, 0, 0, 0)})
+
+    def test_tar_contents(self):
+        for kind in 'tar', 'tar.gz', 'tar.xz', 'tar.bz2':
+            with self.subTest(kind=kind):
+                filename, _ = self.archive(kind, 'problem')
+                with tarfile.open(filename) as arch:
+                    for name, data in FILES.items():
+                        self.assertEqual(arch.extractfile('problem/' + name).read(), data)
+                    self.assertEqual(arch.extractfile('big.in').read(), b'9 ' * 10000)
+                    self.assertTrue(arch.getmember('problem/tests').isdir())
+                    self.assertEqual(arch.getmember('problem/run.sh').mode, 0o755)
+                    self.assertEqual({member.mtime for member in arch.getmembers()}, {0})
+
+    def test_errors(self):
+        with open_archive(self.path('dup.zip')) as arch:
+            arch.add_bytes(b'a', 'a.txt')
+            with self.assertRaises(ArchiveError): arch.add_bytes(b'b', 'a.txt')
+        with self.assertRaises(ArchiveError): open_archive(self.path('problem.rar'))
+
+        # an archive inside the folder it's made of leaves itself out
+        filename = os.path.join(self.folder, 'self.zip')
+        with open_archive(filename) as arch:
+            arch.add_tree(self.folder)
+        with zipfile.ZipFile(filename) as arch:
+            self.assertNotIn('self.zip', arch.namelist())
+
+    def test_names(self):
+        self.assertEqual(archive_kind('pg.tar.gz'), 'tar.gz')
+        self.assertEqual(archive_kind('pg.tgz'), 'tgz')
+        self.assertEqual(archive_kind('pg.zip'), 'zip')
+        self.assertIsNone(archive_kind('pg'))
+        self.assertEqual(parse_archive_loc('tar.xz:out/pg.tar.xz'), ('tar.xz', 'out/pg.tar.xz'))
+        self.assertIsNone(parse_archive_loc('out/pg'))
+        self.assertIsNone(parse_archive_loc('rar:out/pg.rar'))
@@ -0,0 +1,149 @@
+from unittest import mock
+import io, json, os, sys
+
+from ...checkers import Fail, ParseError, Verdict, Wrong, _check_batch, kg_rcode
+from ...script.batch import BatchChecker, BatchValidationError, BatchValidator, BatchWorkerError, supports_batch
+from ...script.programs import Program
+from ...validators import Var, _validate_batch, validator
+from .helpers import KG_ROOT, TempDirTestCase
+
+def check(input_file, output_file, judge_file, **kwargs):
+    output = output_file.read()
+    if output == 'parse\n': raise ParseError("Not a number")
+    if output == 'fail\n': raise Fail("Bad judge data")
+    if output == 'oops\n': raise ValueError("A bug")
+    if output != judge_file.read(): raise Wrong("Different answer")
+    return 1.0
+
+subtasks = {
+    '1': {'n': 1 <= +Var <= 1},
+    '2': {},
+}
+
+@validator(bounds={'n': 1 <= +Var <= 10}, subtasks=subtasks)
+def validate(stream, subtask=None, *, lim):
+    [n] = stream.read.int(lim.n).eoln
+    [a] = stream.read.ints(n, 1, 10).eoln
+    stream.read.eof()
+
+CHECKER = '''\
+from kg.checkers import *
+
+def check(input_file, output_file, judge_file, **kwargs):
+    output = output_file.read()
+    if output == 'exit\\n': raise SystemExit(7)  # the worker dies
+    if output != judge_file.read(): raise Wrong("Different answer")
+    return 1.0
+
+if __name__ == '__main__': check_files(check)
+'''
+
+VALIDATOR = '''\
+from kg.validators import *
+
+@validator()
+def validate(stream, subtask=None):
+    [n] = stream.read.int(1, 10).eoln
+    stream.read.eof()
+
+if __name__ == '__main__': validate_or_detect_subtasks(validate, ['1'])
+'''
+
+# reads all of stdin like an ordinary validator, so it never says it's ready
+PLAIN = 'import sys\nsys.stdin.read()\n'
+
+
+class TestBatch(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.dict(os.environ, {'PYTHONPATH': KG_ROOT})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def program(self, name, source, **attributes):
+        self.write(name, source)
+        return Program(name, [], [sys.executable, name], relpath=self.tmp.name, **attributes).do_compile()
+
+    def test_check_requests(self):
+        input_ = self.write('000.in', '1\n')
+        judge = self.write('000.ans', '2\n')
+        cases = [
+            ('2\n', Verdict.AC, 1.0),
+            ('3\n', Verdict.WA, 0.0),
+            ('parse\n', Verdict.PAE, 0.0),
+            ('fail\n', Verdict.FAIL, 0.0),
+            ('oops\n', Verdict.EXC, 0.0),
+        ]
+        requests = []
+        for index, (output, *_) in enumerate(cases):
+            requests.append(json.dumps({'input': input_, 'output': self.write(f'{index}.out', output), 'judge': judge,
+                    'tc_id': index, 'result_file': self.path(f'{index}.json')}))
+        outfile = io.StringIO()
+        _check_batch(check, io.StringIO('\n'.join(requests) + '\n\n'), outfile, log_file=io.StringIO())
+
+        ready, *lines = outfile.getvalue().splitlines()
+        self.assertEqual(json.loads(ready), {'ready': True})
+        self.assertEqual(len(lines), len(cases))
+        for index, (line, (output, verdict, score)) in enumerate(zip(lines, cases)):
+            with self.subTest(output=output):
+                result = json.loads(line)
+                self.assertEqual(result['verdict'], verdict)
+                self.assertEqual(result['score'], score)
+                self.assertEqual(result['rcode'], kg_rcode[verdict])
+                self.assertEqual(bool(result['message']), verdict != Verdict.AC)
+                with open(self.path(f'{index}.json')) as f:
+                    self.assertEqual(json.load(f)['verdict'], verdict)
+
+    def test_validate_requests(self):
+        good = self.write('good.in', '2\n1 2\n')
+        bad = self.write('bad.in', '2\n1 11\n')
+        missing = self.path('missing.in')
+        outfile = io.StringIO()
+        _validate_batch(validate, subtasks, io.StringIO(f'{good}\n\n{bad}\n{missing}\n'), outfile)
+        ready, *results = map(json.loads, outfile.getvalue().splitlines())
+        self.assertEqual(ready, {'ready': True})
+        self.assertEqual([result['file'] for result in results], [good, bad, missing])
+        self.assertNotIn('error', results[0])
+        self.assertIn('error', results[1])
+        self.assertIn('FileNotFoundError', results[2]['error'])
+
+        outfile = io.StringIO()
+        _validate_batch(validate, subtasks, io.StringIO(f'{good}\n'), outfile, detect=True)
+        self.assertEqual(json.loads(outfile.getvalue().splitlines()[1])['subtasks'], ['2'])
+
+    def test_checker(self):
+        checker = self.program('checker.py', CHECKER)
+        input_ = self.write('000.in', '1\n')
+        judge = self.write('000.ans', '2\n')
+        with BatchChecker(checker, max_workers=2) as batch:
+            for index in range(6):
+                output = self.write(f'{index}.out', f'{index}\n')
+                result = batch.check(input_, output, judge, tc_id=index)
+                self.assertEqual(result['rcode'], kg_rcode[Verdict.AC if index == 2 else Verdict.WA])
+
+            # a worker that dies is replaced by a new one
+            with self.assertRaises(BatchWorkerError):
+                batch.check(input_, self.write('exit.out', 'exit\n'), judge)
+            self.assertEqual(batch.check(input_, self.write('ok.out', '2\n'), judge)['verdict'], Verdict.AC)
+            self.assertLessEqual(len(batch._procs), 2)
+
+    def test_validator(self):
+        self.assertTrue(supports_batch(self.program('validator.py', VALIDATOR)))
+        with BatchValidator(self.program('validator.py', VALIDATOR)) as batch:
+            self.assertEqual(batch.validate(self.write('good.in', '3\n'))['file'], self.path('good.in'))
+            with self.assertRaises(BatchValidationError):
+                batch.validate(self.write('bad.in', '11\n'))
+            self.assertIn('error', batch.query(self.write('bad.in', '11\n')))
+
+    def test_not_ready(self):
+        # a program that doesn't understand --batch is stopped, and every later request fails right away
+        program = self.program('validator.py', PLAIN)
+        self.assertTrue(supports_batch(program))
+        self.assertFalse(supports_batch(self.program('validator.py', PLAIN, batch=False)))
+        with BatchValidator(program, max_workers=2) as batch:
+            batch.ready_timeout = 0.5
+            for attempt in range(3):
+                with self.assertRaises(BatchWorkerError):
+                    batch.validate(self.write('good.in', '3\n'))
+            self.assertEqual(batch._procs, [])
@@ -0,0 +1,102 @@
+from unittest import mock
+import importlib.util, os, subprocess, sys
+
+from ...script.compressed import (CompressionError, compression_of, data_stdin, data_stdout, open_data, plain_file,
+        plain_output, recompress_file, strip_compression)
+from ...script.transfers import transfer_file
+from .helpers import TempDirTestCase
+
+DATA = b''.join(b'%d %d\n' % (i, i * i) for i in range(200000))
+
+EXTS = ['', '.gz']
+if importlib.util.find_spec('zstandard'): EXTS.append('.zst')
+
+# copies stdin to stdout, or only reads the first line if told to
+CAT = [sys.executable, '-c', 'import shutil, sys\n'
+        'if sys.argv[1:]: sys.stdout.buffer.write(sys.stdin.buffer.readline())\n'
+        'else: shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)']
+
+def write(filename, data):
+    with open_data(filename, 'wb') as f:
+        f.write(data)
+
+def read(filename):
+    with open_data(filename) as f:
+        return f.read()
+
+
+class TestCompressed(TempDirTestCase):
+
+    def test_names(self):
+        self.assertEqual(compression_of('tests/000.in.gz'), 'gz')
+        self.assertEqual(compression_of('tests/000.ans.zst'), 'zst')
+        self.assertIsNone(compression_of('tests/000.in'))
+        self.assertEqual(strip_compression('tests/000.in.zst'), 'tests/000.in')
+        self.assertEqual(strip_compression('tests/000.in'), 'tests/000.in')
+
+    def test_round_trips(self):
+        for ext in EXTS:
+            with self.subTest(ext=ext):
+                filename = self.path('000.in' + ext)
+                write(filename, DATA)
+                self.assertEqual(read(filename), DATA)
+                if ext: self.assertLess(os.path.getsize(filename), len(DATA))
+
+                # a program reading it
+                with data_stdin(filename) as stdin:
+                    self.assertEqual(subprocess.run(CAT, stdin=stdin, stdout=subprocess.PIPE, check=True).stdout, DATA)
+
+                # a program that stops reading early doesn't get the pump stuck
+                with data_stdin(filename) as stdin:
+                    self.assertEqual(subprocess.run([*CAT, 'line'], stdin=stdin, stdout=subprocess.PIPE, check=True).stdout,
+                                     b'0 0\n')
+
+                # a program writing it
+                out = self.path('000.ans' + ext)
+                with data_stdin(filename) as stdin, data_stdout(out) as stdout:
+                    subprocess.run(CAT, stdin=stdin, stdout=stdout, check=True)
+                self.assertEqual(read(out), DATA)
+
+                # programs that take file names
+                with plain_file(filename) as plain:
+                    self.assertEqual(compression_of(plain), None)
+                    with open(plain, 'rb') as f: self.assertEqual(f.read(), DATA)
+                self.assertTrue(os.path.exists(filename))
+                if ext: self.assertFalse(os.path.exists(plain))
+
+                with plain_output(out) as plain:
+                    with open(plain, 'wb') as f: f.write(b'42\n')
+                self.assertEqual(read(out), b'42\n')
+                if ext: self.assertFalse(os.path.exists(plain))
+
+    def test_recompress(self):
+        for source_ext in EXTS:
+            source = self.path('source.in' + source_ext)
+            write(source, DATA)
+            for dest_ext in EXTS:
+                with self.subTest(source=source_ext, dest=dest_ext):
+                    dest = self.path(os.path.join('out', 'dest.in' + dest_ext))
+                    recompress_file(source, dest)
+                    self.assertEqual(read(dest), DATA)
+                    os.remove(dest)
+                    self.assertEqual(transfer_file(source, dest, verify=True),
+                                     'copied' if source_ext == dest_ext else 'recompressed')
+                    self.assertEqual(read(dest), DATA)
+
+    def test_deterministic(self):
+        # the same data always gives the same compressed file (gzip stores the file name, but not the time)
+        os.mkdir(self.path('a'))
+        os.mkdir(self.path('b'))
+        for ext in EXTS:
+            with self.subTest(ext=ext):
+                write(self.path(os.path.join('a', '000.in' + ext)), DATA)
+                write(self.path(os.path.join('b', '000.in' + ext)), DATA)
+                with open(self.path(os.path.join('a', '000.in' + ext)), 'rb') as a, \
+                        open(self.path(os.path.join('b', '000.in' + ext)), 'rb') as b:
+                    self.assertEqual(a.read(), b.read())
+
+    def test_missing_zstandard(self):
+        with mock.patch.dict(sys.modules, {'zstandard': None}):
+            with self.assertRaises(CompressionError): open_data(self.path('000.in.zst'), 'wb')
+            with self.assertRaises(CompressionError):
+                with data_stdin(self.path('000.in.zst')): ...
@@ -0,0 +1,112 @@
+import contextlib, io
+
+from ...checkers import Verdict, _check_generic
+from ...diff.exact import check_exactly_equal
+from ...diff.tokens import check_tokens
+from ...utils.streams import _PREFIX_BLOCK, InteractiveStream, _common_prefix_len, skip_common_prefix
+from .helpers import TempDirTestCase
+
+BLOCK = _PREFIX_BLOCK
+LINE = 16  # so that the lines end exactly at the block boundaries
+DATA = ''.join(f'{i:010} abcd\n' for i in range(3 * BLOCK // LINE))
+
+def change(data, at):
+    return data[:at] + ('X' if data[at] != 'X' else 'Y') + data[at + 1:]
+
+
+class TestDiff(TempDirTestCase):
+
+    def skip(self, data1, data2, **kwargs):
+        ''' returns the number of bytes skipped, and the lines left in each '''
+        with open(self.write('a', data1)) as f1, open(self.write('b', data2)) as f2:
+            stream1, stream2 = InteractiveStream(f1), InteractiveStream(f2)
+            return skip_common_prefix(stream1, stream2, **kwargs), [*stream1], [*stream2]
+
+    def check(self, check, output, judge):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            verdict, score, message = _check_generic(check,
+                    input=self.write('000.in', ''), output=self.write('000.out', output), judge=self.write('000.ans', judge))
+        return verdict, out.getvalue()
+
+    def test_common_prefix_len(self):
+        data = DATA.encode()
+        for at in [0, 1, BLOCK // 2, BLOCK - 1, BLOCK, BLOCK + 1, 2 * BLOCK - 1, 2 * BLOCK, len(data) - 1]:
+            with self.subTest(at=at):
+                self.assertEqual(_common_prefix_len(data, change(DATA, at).encode()), at)
+        self.assertEqual(_common_prefix_len(data, data), len(data))
+        for length in [0, 1, BLOCK - 1, BLOCK, BLOCK + 1]:
+            with self.subTest(length=length):
+                self.assertEqual(_common_prefix_len(data[:length], data), length)
+                self.assertEqual(_common_prefix_len(data, data[:length]), length)
+
+    def test_skip(self):
+        lines = DATA.splitlines()
+        for at in [BLOCK - 2, BLOCK - 1, BLOCK, BLOCK + 1, 2 * BLOCK]:
+            with self.subTest(at=at):
+                # it stops just after the last full line before the difference
+                skipped, rest1, rest2 = self.skip(change(DATA, at), DATA)
+                self.assertEqual(skipped, at // LINE * LINE)
+                self.assertEqual(rest2, lines[skipped // LINE:])
+                self.assertEqual(rest1, change(DATA, at)[skipped:].splitlines())
+
+                # or the last token
+                skipped, _, _ = self.skip(change(DATA, at), DATA, ends={' ', '\n'})
+                self.assertEqual(skipped, max(DATA.rfind(' ', 0, at), DATA.rfind('\n', 0, at)) + 1)
+
+        self.assertEqual(self.skip(DATA, DATA), (len(DATA), [], []))
+
+    def test_skip_prefix_and_empty(self):
+        # one is a prefix of the other
+        self.assertEqual(self.skip(DATA, DATA + 'extra\n'), (len(DATA), [], ['extra']))
+        self.assertEqual(self.skip(DATA + 'extra\n', DATA), (len(DATA), ['extra'], []))
+        self.assertEqual(self.skip('abc\nde', 'abc\ndef\n'), (4, ['de'], ['def']))
+        self.assertEqual(self.skip(DATA[:-1], DATA)[0], len(DATA) - LINE)
+
+        # nothing to skip
+        self.assertEqual(self.skip('', ''), (0, [], []))
+        self.assertEqual(self.skip('', DATA)[0], 0)
+        self.assertEqual(self.skip('abc', 'abd')[0], 0)
+
+        # a stream that was read from already isn't skipped
+        with open(self.write('a', DATA)) as f1, open(self.write('b', DATA)) as f2:
+            stream1, stream2 = InteractiveStream(f1), InteractiveStream(f2)
+            stream1.read_line()
+            self.assertEqual(skip_common_prefix(stream1, stream2), 0)
+
+    def test_exact(self):
+        self.assertEqual(self.check(check_exactly_equal, DATA, DATA)[0], Verdict.AC)
+        self.assertEqual(self.check(check_exactly_equal, '', '')[0], Verdict.AC)
+        # like before the prefix is skipped, only the trailing newline may be missing
+        self.assertEqual(self.check(check_exactly_equal, DATA[:-1], DATA)[0], Verdict.AC)
+        for output, judge in [('', '1\n'), ('1\n', ''), (DATA, DATA + 'extra\n'), (DATA + 'extra\n', DATA)]:
+            with self.subTest(output=output[-10:], judge=judge[-10:]):
+                self.assertEqual(self.check(check_exactly_equal, output, judge)[0], Verdict.WA)
+
+        for at in [BLOCK - 1, BLOCK, BLOCK + 1]:
+            with self.subTest(at=at):
+                output = change(DATA, at)
+                verdict, out = self.check(check_exactly_equal, output, DATA)
+                self.assertEqual(verdict, Verdict.WA)
+
+                # the diff is of the whole files, so it shows where they differ
+                header, diff = out.split('\n', 1)
+                self.assertEqual(header, 'Incorrect. Diff:')
+                self.assertLessEqual(len(diff.rstrip('\n')), 1111 + 3)
+                self.assertIn('--- Output File', diff)
+                self.assertIn('+++ Judge File', diff)
+                line = at // LINE
+                self.assertIn(f'@@ -{line - 2},7 +{line - 2},', diff)
+                self.assertIn('\n-' + output.splitlines()[line], diff)
+                self.assertIn('\n+' + DATA.splitlines()[line], diff)
+
+    def test_tokens(self):
+        self.assertEqual(self.check(check_tokens, DATA, DATA)[0], Verdict.AC)
+        self.assertEqual(self.check(check_tokens, DATA.replace('\n', ' '), DATA)[0], Verdict.AC)
+        self.assertEqual(self.check(check_tokens, DATA[:-1], DATA)[0], Verdict.AC)
+        self.assertEqual(self.check(check_tokens, '', '')[0], Verdict.AC)
+        self.assertEqual(self.check(check_tokens, '1  2\n3', '1 2 3\n')[0], Verdict.AC)
+        for at in [BLOCK - 1, BLOCK, BLOCK + 1]:
+            with self.subTest(at=at):
+                self.assertEqual(self.check(check_tokens, change(DATA, at), DATA)[0], Verdict.WA)
+        self.assertEqual(self.check(check_tokens, DATA, DATA + 'extra')[0], Verdict.WA)
+        self.assertEqual(self.check(check_tokens, DATA + 'extra', DATA)[0], Verdict.WA)
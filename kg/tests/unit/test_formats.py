@@ -0,0 +1,70 @@
+from glob import glob
+from unittest import mock
+import os, time
+
+from ...script import formats
+from ...script.formats import KGFormat, find_files, list_folder
+from .helpers import TempDirTestCase, write
+
+def touch(*paths):
+    for path in paths: write(path, b'')
+
+def age(folder, seconds=60):
+    ''' pretend the folder last changed a while ago, so its listing can be trusted '''
+    past = time.time() - seconds
+    os.utime(folder, (past, past))
+
+
+class TestFormats(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tests = self.path('tests')
+        os.mkdir(self.tests)
+        formats._listings.clear()
+
+    def test_same_as_glob(self):
+        touch(*(os.path.join(self.tests, name) for name in ['000.in', '000.ans', '1.in', '10.in', '.hidden.in', 'a[1].in']))
+        os.mkdir(os.path.join(self.tests, 'sub'))
+        touch(os.path.join(self.tests, 'sub', '002.in'))
+        age(self.tests)
+        for pattern in ['*.in', '*.ans', '*', '.*', '0*.in', '?.in', '[01]*.in', '.*.in', '000.in', 'nope.in',
+                        os.path.join('*', '*.in')]:
+            pattern = os.path.join(self.tests, pattern)
+            with self.subTest(pattern=pattern):
+                self.assertEqual(sorted(find_files(pattern)), sorted(glob(pattern)))
+        self.assertEqual(find_files(self.path('missing', '*.in')), [])
+
+    def test_invalidation(self):
+        touch(os.path.join(self.tests, '000.in'))
+        age(self.tests)
+        pattern = os.path.join(self.tests, '*.in')
+        self.assertEqual(find_files(pattern), [os.path.join(self.tests, '000.in')])
+
+        # an old enough listing is reused while the folder is unchanged...
+        with mock.patch('os.scandir', side_effect=AssertionError("listed again")):
+            self.assertEqual(find_files(pattern), [os.path.join(self.tests, '000.in')])
+
+        # ...but adding or removing a file changes the folder's mtime
+        touch(os.path.join(self.tests, '001.in'))
+        self.assertEqual(sorted(find_files(pattern)), [os.path.join(self.tests, f'00{i}.in') for i in range(2)])
+        os.remove(os.path.join(self.tests, '000.in'))
+        self.assertEqual(find_files(pattern), [os.path.join(self.tests, '001.in')])
+
+        # a listing taken right after a change isn't trusted, even if the mtime stays the same
+        stat = os.stat(self.tests)
+        touch(os.path.join(self.tests, '002.in'))
+        os.utime(self.tests, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIn('002.in', list_folder(self.tests))
+
+        os.rename(self.tests, self.tests + '_old')
+        self.assertEqual(list_folder(self.tests), [])
+
+    def test_format(self):
+        touch(*(os.path.join(self.tests, f'{i:03}.in') for i in range(12)))
+        age(self.tests)
+        fmt = KGFormat(self.tmp.name, read='i')
+        self.assertEqual(fmt.thru_inputs(), [os.path.join(self.tests, f'{i:03}.in') for i in range(12)])
+
+        touch(os.path.join(self.tests, '012.in'))
+        self.assertEqual(len(KGFormat(self.tmp.name, read='i').thru_inputs()), 13)
@@ -0,0 +1,289 @@
+from glob import glob
+from unittest import mock
+import importlib, io, multiprocessing, os, queue, sys, threading, time
+import unittest
+
+from ...formatters import formatter
+from ...generators import (DistribCase, GeneratorError, KGRandom, LazySeq, _ChunkReader, _kg_digest, _source_digest,
+        group_into, write_to_file, write_to_files)
+from ...utils.parsers import ParsingError
+from ...validators import ValidationError, Var, ensure, validator
+from .helpers import TempDirTestCase
+
+@formatter
+def format_case(stream, cases, *, print, **kwargs):
+    print(len(cases))
+    for arr in cases:
+        print(len(arr))
+        print(*arr)
+
+def many_cases(rand, new_case, *args):
+    T, N = map(int, args[:2])
+    for n in range(1, N + 1):
+        @new_case(n)
+        def make_case(rand, n):
+            return [rand.randint(-10**9, 10**9) for i in range(n)]
+
+    while new_case.total_cases % T:
+        new_case(N)(lambda rand, n: [rand.randrange(n)] * n)
+
+def distribute(rand, new_case, casemakers, *args):
+    return group_into(int(args[0]), rand.shuff(casemakers))
+
+@validator(bounds={'a': abs(+Var) <= 10**9})
+def validate_cases(stream, *, lim):
+    [t] = stream.read.int(1, 10**5).eoln
+    for cas in range(t):
+        [n] = stream.read.int(1, 10**6).eoln
+        [a] = stream.read.ints(n, lim.a).eoln
+        ensure(a != [17], "no 17s", exc=ValidationError)
+
+def big_cases(rand, *args):
+    n, bad = map(int, args)
+    return [[rand.randint(-10**9, 10**9) for i in range(n)], [bad]]
+
+def shared_rand_cases(rand, *args):
+    # a plain 'make', whose cases all come from the same rand
+    for n in range(1, int(args[0]) + 1):
+        yield [[rand.randint(1, n) for i in range(n)]]
+
+
+class TestGenerators(TempDirTestCase):
+
+    def write_files(self, name, make, *args, **kwargs):
+        folder = self.path(name)
+        os.mkdir(folder)
+        filenames = [os.path.join(folder, f'{index:03}.in') for index in range(100)]
+        write_to_files(format_case, make, filenames, *args, **kwargs)
+        contents = []
+        for filename in filenames:
+            if not os.path.exists(filename): break
+            with open(filename, 'rb') as f:
+                contents.append(f.read())
+        return contents
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "the files are only written in parallel with fork")
+    def test_parallel_files(self):
+        # each group has its own seed, so the files are the same however many processes write them
+        serial = self.write_files('serial', (many_cases, distribute), '3', '40', workers=1)
+        self.assertEqual(len(serial), 14)
+        for workers in 2, 5, 64:
+            with self.subTest(workers=workers):
+                self.assertEqual(self.write_files(f'parallel{workers}', (many_cases, distribute), '3', '40', workers=workers),
+                                 serial)
+        with mock.patch.dict(os.environ, {'KG_GENERATOR_WORKERS': 'auto'}):
+            self.assertEqual(self.write_files('auto', (many_cases, distribute), '3', '40'), serial)
+
+        # a plain 'make' is always written one case after another
+        self.assertEqual(self.write_files('plain_serial', shared_rand_cases, '12', workers=1),
+                         self.write_files('plain_parallel', shared_rand_cases, '12', workers=4))
+
+        with self.assertRaises(GeneratorError):
+            write_to_files(format_case, (many_cases, distribute), [self.path('only.in')], '3', '40',
+                           workers=2)
+        with mock.patch.dict(os.environ, {'KG_GENERATOR_WORKERS': 'many'}), self.assertRaises(GeneratorError):
+            self.write_files('invalid', (many_cases, distribute), '3', '40')
+
+    def test_group_cache(self):
+        make = DistribCase(many_cases, distribute)
+        def groups(*args):
+            return [make[index](KGRandom(11), *args) for index in range(14)]
+
+        cache = self.path('cache')
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}):
+            # off unless asked for
+            os.environ.pop('KG_GENERATOR_CACHE', None)
+            expected = groups('3', '40')
+            self.assertEqual(os.listdir(self.tmp.name), [])
+
+            os.environ['KG_GENERATOR_CACHE'] = cache
+            self.assertEqual(groups('3', '40'), expected)
+            entries = glob(os.path.join(cache, '*', '*'))
+            self.assertEqual(len(entries), 1)
+            with mock.patch.object(DistribCase, 'lazy', side_effect=AssertionError("not cached")):
+                self.assertEqual(groups('3', '40'), expected)
+
+            # another version of kg doesn't use the same groups
+            with mock.patch.object(_kg_digest, 'value', 'another version'):
+                self.assertEqual(groups('3', '40'), expected)
+            [other] = set(glob(os.path.join(cache, '*', '*'))) - set(entries)
+
+            # the least recently used groups are deleted first
+            size = sum(os.path.getsize(file) for file in glob(os.path.join(other, '*')))
+            past = time.time() - 60
+            os.utime(entries[0], (past, past))
+            os.utime(other, (past - 10, past - 10))
+            # ...and using them counts
+            with mock.patch.object(_kg_digest, 'value', 'another version'):
+                make[0](KGRandom(11), '3', '40')
+            os.environ['KG_GENERATOR_CACHE_SIZE'] = str(2.5 * size / 10**6)
+            make[0](KGRandom(11), '3', '39')
+            self.assertEqual(len(glob(os.path.join(cache, '*', '*'))), 2)
+            self.assertTrue(os.path.isdir(other))
+            self.assertFalse(os.path.isdir(entries[0]))
+
+    def test_source_digest(self):
+        # the generator imports a module from another folder, which imports yet another one
+        for folder in 'gen', 'lib', 'sub': os.mkdir(self.path(folder))
+        self.write('lib/kgtest_lib.py', 'import json\nimport kgtest_sub\ndef size(n): return kgtest_sub.scale * n\n')
+        self.write('sub/kgtest_sub.py', 'scale = 1\n')
+        self.write('gen/kgtest_gen.py', 'import random\nfrom kgtest_lib import size\n'
+                                        'def make(rand, new_case, *args): return []\n'
+                                        'def distribute(rand, new_case, casemakers, *args): return []\n')
+        self.write('gen/kgtest_other.py', '')
+        with mock.patch.object(sys, 'path', [*(self.path(folder) for folder in ('gen', 'lib', 'sub')), *sys.path]):
+            gen = importlib.import_module('kgtest_gen')
+            importlib.import_module('kgtest_other')
+        self.addCleanup(lambda: [sys.modules.pop(name, None) for name in ('kgtest_gen', 'kgtest_lib', 'kgtest_sub', 'kgtest_other')])
+
+        roots = [gen.make, gen.distribute]
+        digest = _source_digest(roots)
+        self.assertEqual(_source_digest(roots), digest)
+        for name, source in [
+                ('gen/kgtest_gen.py', '# changed\n'), # the generator
+                ('gen/kgtest_other.py', '# changed\n'), # anything next to it
+                ('lib/kgtest_lib.py', '# changed\n'), # what it imports
+                ('sub/kgtest_sub.py', 'scale = 2\n')]: # and what that imports
+            with self.subTest(name=name):
+                with open(self.path(name), 'a') as f:
+                    f.write(source)
+                self.assertNotEqual(_source_digest(roots), digest)
+                digest = _source_digest(roots)
+
+    def test_validating_writer(self):
+        filename = self.path('case.in')
+        def write(args, validate=None):
+            with open(filename, 'w') as file:
+                write_to_file(format_case, big_cases, args, file, validate=validate)
+            with open(filename) as file:
+                return file.read()
+
+        # the output is the same with and without validating it, even over many chunks
+        for n in '1', '10', '100000':
+            with self.subTest(n=n):
+                self.assertEqual(write([n, '1'], validate_cases), write([n, '1']))
+
+        # an invalid case fails, whether it's found at the end or early on
+        for args in ['10', '17'], ['100000', '17']:
+            with self.subTest(args=args), self.assertRaises(ValidationError):
+                write(args, validate_cases)
+        with self.assertRaises(ParsingError): write(['1', '2000000000'], validate_cases)
+
+        # validation that stops early doesn't make the writing wait forever
+        def stop_early(file):
+            file.read(10)
+            raise ValidationError("stopped")
+        with self.assertRaises(ValidationError): write(['300000', '1'], stop_early)
+
+        # neither does validation that doesn't read everything
+        def read_some(file):
+            file.readline()
+        self.assertEqual(write(['300000', '1'], read_some), write(['300000', '1']))
+
+        # the formatter's own errors aren't hidden
+        @formatter
+        def bad_format(stream, cases, *, print, **kwargs):
+            print(len(cases))
+            raise ValueError("formatter failed")
+        with self.assertRaises(ValueError):
+            write_to_file(bad_format, big_cases, ['10', '1'], io.StringIO(), validate=validate_cases)
+        self.assertEqual(threading.active_count(), 1)
+
+    def test_chunk_reader(self):
+        def reader(*chunks):
+            q = queue.Queue()
+            for chunk in chunks: q.put(chunk)
+            q.put(None)
+            return _ChunkReader(q)
+
+        chunks = ['ab', 'c\nde', '', 'f\n', 'gh']
+        self.assertEqual(reader(*chunks).read(), 'abc\ndef\ngh')
+        self.assertEqual(list(iter(reader(*chunks).readline, '')), ['abc\n', 'def\n', 'gh'])
+
+        r = reader(*chunks)
+        self.assertEqual([r.read(2), r.read(3), r.readline(), r.readline(1), r.read(None), r.read(), r.readline()],
+                         ['ab', 'c\nd', 'ef\n', 'g', 'h', '', ''])
+        self.assertTrue(r.eof)
+
+    def test_lazy_seq(self):
+        seq = KGRandom(11).lazy_seq(1000, lambda rand: rand.randint(1, 10**9))
+        self.assertIsInstance(seq, LazySeq)
+        self.assertEqual(len(seq), 1000)
+        values = list(seq)
+        self.assertEqual(len(values), 1000)
+        # every iteration gives the same values, even interleaved with another one
+        self.assertEqual(list(seq), values)
+        self.assertEqual([*zip(seq, seq)], [*zip(values, values)])
+        # and so does the same seed
+        self.assertEqual(list(KGRandom(11).lazy_seq(1000, lambda rand: rand.randint(1, 10**9))), values)
+        self.assertNotEqual(list(KGRandom(12).lazy_seq(1000, lambda rand: rand.randint(1, 10**9))), values)
+
+        # the values are only made while iterating
+        made = []
+        seq = KGRandom(11).lazy_seq(5, lambda rand: made.append(rand.random()) or len(made))
+        self.assertEqual(made, [])
+        it = iter(seq)
+        self.assertEqual(next(it), 1)
+        self.assertEqual(len(made), 1)
+
+        # it doesn't use up the rand it came from any more than one getrandbits
+        rand, other = KGRandom(11), KGRandom(11)
+        rand.lazy_seq(10**9, lambda rand: rand.random())
+        other.getrandbits(64)
+        self.assertEqual(rand.random(), other.random())
+
+        self.assertEqual(list(KGRandom(11).lazy_seq(0, lambda rand: 1)), [])
+
+        # a case with lazy parts is formatted and validated the same
+        def lazy_cases(rand, *args):
+            n = int(args[0])
+            return [rand.lazy_seq(n, lambda rand: rand.randint(-10**9, 10**9))]
+        def list_cases(rand, *args):
+            return [list(case) for case in lazy_cases(rand, *args)]
+        outputs = []
+        filename = self.path('case.in')
+        for make, validate in (lazy_cases, None), (lazy_cases, validate_cases), (list_cases, None):
+            with open(filename, 'w') as file:
+                write_to_file(format_case, make, ['100000'], file, validate=validate)
+            with open(filename) as file:
+                outputs.append(file.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+    def test_randdistrib(self):
+        # version 1 gives the same partitions as it always has
+        self.assertEqual(KGRandom(11).randdistrib(30, 5), [6, 2, 8, 8, 6])
+        self.assertEqual(KGRandom(11).randdistrib(100, 7, min_=3, max_=20, skew=3), [20, 20, 10, 20, 11, 7, 12])
+        self.assertEqual(KGRandom(11).randdistrib(30, 5, version=1), [6, 2, 8, 8, 6])
+
+        rand = KGRandom(11)
+        for total, count, min_, max_, skew in [
+                (30, 5, 0, None, 1), (100, 7, 3, 20, 3), (10**18, 1000, 0, None, 1), (10**18, 1000, 10**12, None, 0.1),
+                (10**6, 100, 1, 10**4 + 5, 2), (10**6, 100, 0, 10**4, 1), (5, 10, 0, 1, 1), (12, 3, 4, 4, 1),
+                (7, 1, 0, None, 1), (0, 0, 0, None, 1), (50, 10, 0, 30, 40)]:
+            with self.subTest(total=total, count=count, min_=min_, max_=max_, skew=skew):
+                for it in range(20):
+                    dist = rand.randdistrib(total, count, min_=min_, max_=max_, skew=skew, version=2)
+                    self.assertEqual(len(dist), count)
+                    self.assertEqual(sum(dist), total)
+                    self.assertTrue(all(isinstance(part, int) for part in dist))
+                    if dist: self.assertTrue(min_ <= min(dist) and (max_ is None or max(dist) <= max_))
+
+        # the same seed gives the same partition
+        self.assertEqual(KGRandom(5).randdistrib(10**9, 50, version=2), KGRandom(5).randdistrib(10**9, 50, version=2))
+
+        # no part is favored
+        sums = [0] * 4
+        for it in range(2000):
+            for index, part in enumerate(rand.randdistrib(100, 4, max_=40, version=2)): sums[index] += part
+        for part_sum in sums: self.assertAlmostEqual(part_sum / 2000, 25, delta=1)
+
+        # huge totals are fast
+        start = time.perf_counter()
+        rand.randdistrib(10**100, 10**4, min_=10**90, version=2)
+        self.assertLess(time.perf_counter() - start, 2)
+
+        for kwargs in [{'version': 3}, {'version': 2, 'min_': 7}, {'version': 2, 'max_': 5}, {'version': 2, 'skew': 0}]:
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValueError):
+                rand.randdistrib(60, 10, **kwargs)
+        with self.assertRaises(ValueError): rand.randdistrib(5, 0, version=2)
@@ -0,0 +1,261 @@
+from threading import Thread
+import os, subprocess, sys, time
+
+from ...script.programs import IMode, Program
+from ...script.supervisor import Supervisor, open_fifo_nonblocking
+from ...script.transcripts import FROM_USER, TO_USER, Transcript, TranscriptError, TranscriptWriter, start_relay
+from .helpers import KG_ROOT, TempDirTestCase, read, write
+
+# the first argument is a file saying what to do: "play" sends 0, 1, ..., 4 to each node and expects 2*i + (the
+# node's ID) back, "other" sends 1, 2, ..., 5 instead, and "quit" exits before that. It then writes "ok" to the
+# second argument, if there's one
+INTERACTOR = '''\
+import os, sys
+args = sys.argv[1:]
+rest = args[:args.index('--from-user')] if '--from-user' in args else args
+with open(rest[0]) as f: mode = f.read().strip()
+if '--from-user' in args:
+    k = args.index('--to-user')
+    pairs = []
+    for from_user, to_user in zip(args[len(rest) + 1:k], args[k + 1:]):
+        to_node = open(to_user, 'w')  # before the other one, like kg expects
+        pairs.append((open(from_user), to_node))
+else:
+    pairs = [(sys.stdin, sys.stdout)]
+if mode == 'quit': sys.exit(0)
+shift = 1 if mode == 'other' else 0
+try:
+    for idx, (from_node, to_node) in enumerate(pairs):
+        for i in range(shift, 5 + shift):
+            print(i, file=to_node, flush=True)
+            line = from_node.readline()
+            if not line: os._exit(3)  # the node quit
+            if int(line) != 2 * i + idx: os._exit(4)
+        print(-1, file=to_node, flush=True)
+except BrokenPipeError:
+    os._exit(3)
+if len(rest) > 1:
+    with open(rest[1], 'w') as f: f.write('ok\\n')
+'''
+
+CHECKER = '''\
+from kg.checkers import *
+
+def check(input_file, output_file, judge_file, **kwargs):
+    if output_file.read() != judge_file.read(): raise Wrong("Different output")
+    return 1.0
+
+if __name__ == '__main__': check_files(check)
+'''
+
+# "quit" exits right away, "sleep" never answers
+SOLUTION = '''\
+import sys, time
+mode, *rest = sys.argv[1:]
+idx = int(rest[0]) if rest else 0
+if mode == 'quit': sys.exit(0)
+if mode == 'sleep': time.sleep(60)
+for line in sys.stdin:
+    x = int(line)
+    if x < 0: break
+    print(2 * x + idx, flush=True)
+'''
+
+
+class TestInteraction(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.interactor = self.program('interactor.py', INTERACTOR)
+        self.solution = self.program('solution.py', SOLUTION)
+        for mode in 'play', 'other', 'quit':
+            self.write(f'{mode}.in', mode + '\n')
+
+    def program(self, name, source):
+        self.write(name, source)
+        return Program(name, [], [sys.executable, name], relpath=self.tmp.name).do_compile()
+
+    def interact(self, mode, itc_mode='play', node_count=1, interaction_mode=None, **kwargs):
+        return self.solution.do_interact(self.interactor, mode, node_count=node_count,
+                interaction_mode=interaction_mode or (IMode.FIFO if node_count > 1 else IMode.STDIO),
+                pass_id=node_count > 1, interactor_args=[f'{itc_mode}.in'], interactor_kwargs=dict(check=False), **kwargs)
+
+    def test_modes(self):
+        for node_count, interaction_mode in [(1, IMode.STDIO), (1, IMode.FIFO), (3, IMode.FIFO)]:
+            with self.subTest(node_count=node_count, mode=interaction_mode):
+                results, itc_result = self.interact('play', node_count=node_count, interaction_mode=interaction_mode,
+                        check=True)
+                self.assertEqual(len(results), node_count)
+                self.assertEqual([res.result.returncode for res in results], [0] * node_count)
+                self.assertEqual(itc_result.result.returncode, 0)
+
+    def test_solution_exits_early(self):
+        for node_count in 1, 2:
+            with self.subTest(node_count=node_count):
+                results, itc_result = self.interact('quit', node_count=node_count)
+                self.assertEqual(results[0].result.returncode, 0)
+                self.assertEqual(itc_result.result.returncode, 3)
+
+    def test_interactor_exits_early(self):
+        for node_count in 1, 2:
+            with self.subTest(node_count=node_count):
+                results, itc_result = self.interact('play', 'quit', node_count=node_count)
+                self.assertEqual(itc_result.result.returncode, 0)
+                # the nodes see an EOF, or were never started at all
+                for res in results:
+                    if res.result is not None: self.assertEqual(res.result.returncode, 0)
+
+    def test_timeout(self):
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.interact('sleep', timeout=0.5, log_exc=False)
+        self.assertLess(time.monotonic() - start, 30)
+
+        # an interactor that never answers is killed on its own timeout, and the node then sees an EOF
+        sleepy = self.program('sleepy.py', 'import time\ntime.sleep(60)\n')
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.solution.do_interact(sleepy, 'play', interactor_kwargs=dict(timeout=0.5, log_exc=False))
+        self.assertLess(time.monotonic() - start, 30)
+
+    def record(self, name, node_count=1, interaction_mode=IMode.STDIO):
+        filename = self.path(name)
+        with TranscriptWriter(filename, input=self.path('play.in'), judge=self.path('play.ans'), index=0,
+                solution='solution.py', node_count=node_count, mode=interaction_mode.value) as transcript:
+            self.interact('play', node_count=node_count, interaction_mode=interaction_mode, transcript=transcript,
+                    check=True)
+        return Transcript.read(filename)
+
+    def test_record_and_replay(self):
+        for node_count, interaction_mode in [(1, IMode.STDIO), (1, IMode.FIFO), (2, IMode.FIFO)]:
+            with self.subTest(node_count=node_count, mode=interaction_mode):
+                transcript = self.record('000.kgt', node_count, interaction_mode)
+                self.assertEqual(transcript.node_count, node_count)
+                for idx in range(node_count):
+                    self.assertEqual(transcript.data(idx, TO_USER), b'0\n1\n2\n3\n4\n-1\n')
+                    self.assertEqual(transcript.data(idx, FROM_USER), b''.join(b'%d\n' % (2 * i + idx) for i in range(5)))
+
+                # the same interactor sends the same things...
+                result, divergences = self.interactor.do_replay(transcript, 'play.in')
+                self.assertEqual(result.result.returncode, 0)
+                self.assertEqual(divergences, [])
+
+                # ...but a different one doesn't
+                result, divergences = self.interactor.do_replay(transcript, 'other.in')
+                self.assertEqual(result.result.returncode, 4)
+                self.assertEqual(divergences, [(idx, 0) for idx in range(node_count)])
+
+    def test_kg_replay(self):
+        self.write('play.ans', 'ok\n')
+        self.write('checker.py', CHECKER)
+        os.mkdir(self.path('transcripts'))
+        self.record(os.path.join('transcripts', '000.kgt'))
+
+        def replay():
+            return subprocess.run([sys.executable, '-m', 'kg', 'replay', 'transcripts', '-if', 'interactor.py',
+                    '-jf', 'checker.py'], cwd=self.tmp.name, env={**os.environ, 'PYTHONPATH': KG_ROOT},
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=True).stdout
+
+        out = replay()
+        self.assertIn('1 out of 1 transcripts correct', out)
+        self.assertNotIn('behaved differently', out)
+
+        # the interactor now sends something else
+        self.write('play.in', 'other\n')
+        out = replay()
+        self.assertIn('0 out of 1 transcripts correct', out)
+        self.assertIn('behaved differently', out)
+
+    def test_transcript_file(self):
+        filename = self.path('000.kgt')
+        with TranscriptWriter(filename, node_count=2) as writer:
+            writer.record(0, TO_USER, b'5\n')
+            writer.record(0, FROM_USER, b'1\n')
+            writer.record(1, TO_USER, b'7 8\n')
+            writer.record(0, FROM_USER, b'2 3\n')
+        writer.record(0, FROM_USER, b'late\n')  # ignored once it's closed
+
+        transcript = Transcript.read(filename)
+        self.assertEqual(transcript.info, {'node_count': 2})
+        self.assertEqual([record[1:] for record in transcript.records],
+                [(0, TO_USER, b'5\n'), (0, FROM_USER, b'1\n'), (1, TO_USER, b'7 8\n'), (0, FROM_USER, b'2 3\n')])
+        self.assertEqual(transcript.data(0, FROM_USER), b'1\n2 3\n')
+        self.assertEqual([*transcript.divergences({0: b'5\n', 1: b'7 8\n'})], [])
+        self.assertEqual([*transcript.divergences({0: b'5\n', 1: b'7 9\n'})], [(1, 2)])
+        self.assertEqual([*transcript.divergences({0: b'5\n1'})], [(0, 2), (1, 0)])
+
+        truncated = self.write('truncated.kgt', read(filename)[:-1])
+        with self.assertRaises(TranscriptError): Transcript.read(truncated)
+        with self.assertRaises(TranscriptError): Transcript.read(self.path('play.in'))
+
+    def test_relay(self):
+        data = bytes(range(256)) * 1000
+
+        # files, and the paths of FIFOs
+        src_r, src_w = os.pipe()
+        dst_r, dst_w = os.pipe()
+        src, dst = self.path('src'), self.path('dst')
+        os.mkfifo(src)
+        os.mkfifo(dst)
+        for relay_src, relay_dst, writer, reader in [
+                (open(src_r, 'rb', buffering=0), open(dst_w, 'wb', buffering=0), src_w, dst_r),
+                (src, dst, src, dst)]:
+            with self.subTest(src=relay_src):
+                chunks = []
+                relay = start_relay(relay_src, relay_dst, chunks.append)
+                thread = Thread(target=write, args=(writer, data))
+                thread.start()
+                with open(reader, 'rb') as f:
+                    self.assertEqual(f.read(), data)
+                thread.join()
+                relay.join()
+                self.assertEqual(b''.join(chunks), data)
+
+
+class TestSupervisor(TempDirTestCase):
+
+    def test_run(self):
+        supervisor = Supervisor()
+        quick = supervisor.add(lambda: subprocess.Popen([sys.executable, '-c', 'pass']), time=False)
+        slow = supervisor.add(lambda: subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']),
+                timeout=0.5)
+
+        # started only after a few tries
+        tries = []
+        def start_later():
+            tries.append(None)
+            return subprocess.Popen([sys.executable, '-c', 'exit(5)']) if len(tries) >= 3 else None
+        later = supervisor.add(start_later)
+
+        # never startable, so it's dropped once what it needs is done
+        never = supervisor.add(lambda: None, needs=quick)
+
+        start = time.monotonic()
+        self.assertEqual(supervisor.run(), [quick, slow, later, never])
+        self.assertLess(time.monotonic() - start, 30)
+
+        self.assertEqual(quick.process.returncode, 0)
+        self.assertFalse(quick.timed_out)
+        self.assertTrue(slow.timed_out)
+        self.assertGreaterEqual(slow.running_time, 0.5)
+        self.assertEqual(later.process.returncode, 5)
+        self.assertGreaterEqual(len(tries), 3)
+        self.assertTrue(never.abandoned)
+        self.assertIsNone(never.process)
+        self.assertTrue(all(task.done for task in supervisor.tasks))
+
+    def test_fifo(self):
+        fifo = self.path('fifo')
+        os.mkfifo(fifo)
+        # nobody reads it yet
+        self.assertIsNone(open_fifo_nonblocking(fifo, os.O_WRONLY))
+        reader = open_fifo_nonblocking(fifo, os.O_RDONLY)
+        writer = open_fifo_nonblocking(fifo, os.O_WRONLY)
+        try:
+            self.assertTrue(os.get_blocking(reader))
+            self.assertTrue(os.get_blocking(writer))
+            os.write(writer, b'hello')
+            self.assertEqual(os.read(reader, 5), b'hello')
+        finally:
+            os.close(reader)
+            os.close(writer)
@@ -0,0 +1,166 @@
+from unittest import mock
+import io, time
+import unittest
+
+from ...interactors import InteractionProfile, interactor
+from ...utils.streams import FlushPolicy
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+        super().__init__()
+
+    def __call__(self):
+        return self.now
+
+class User(io.StringIO):
+    ''' takes 'delay' seconds to answer each read, and 'cost' seconds for each write or flush '''
+    def __init__(self, clock, data='', *, delay=0.0, cost=0.0):
+        self.clock = clock
+        self.delay = delay
+        self.cost = cost
+        super().__init__(data)
+
+    def readline(self, *args):
+        self.clock.now += self.delay
+        return super().readline(*args)
+
+    def write(self, *args):
+        self.clock.now += self.cost
+        return super().write(*args)
+
+    def flush(self):
+        self.clock.now += self.cost
+        return super().flush()
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_profile(self):
+        clock = Clock()
+        with mock.patch.object(time, 'perf_counter', clock):
+            profile = InteractionProfile()
+            to0 = profile.wrap(0, User(clock, cost=0.5))
+            from0 = profile.wrap(0, User(clock, '1\n2\n3\n', delay=2e-5))
+            from1 = profile.wrap(1, User(clock, '4\n', delay=0.75))
+
+            # a read before anything was sent isn't a query
+            self.assertEqual(from0.readline(), '1\n')
+            self.assertEqual(profile.latencies, [])
+
+            # the query counts as sent when the last write (or flush) to that user starts
+            to0.write('x\n')
+            to0.flush()
+            self.assertEqual(from0.readline(), '2\n')
+            [latency] = profile.latencies
+            self.assertAlmostEqual(latency, 0.5 + 2e-5)
+
+            # reading from another user doesn't complete it
+            to0.write('y\n')
+            self.assertEqual(from1.readline(), '4\n')
+            self.assertEqual(len(profile.latencies), 1)
+            self.assertEqual(from0.readline(), '3\n')
+            self.assertAlmostEqual(profile.latencies[1], 0.5 + 0.75 + 2e-5)
+
+            # neither does reaching the end
+            to0.write('z\n')
+            self.assertEqual(from0.readline(), '')
+            self.assertEqual(len(profile.latencies), 2)
+
+            # everything else goes straight to the file, and the binary buffer is timed too
+            self.assertEqual(to0.getvalue(), 'x\ny\nz\n')
+            wrapped = profile.wrap(0, io.TextIOWrapper(io.BytesIO()))
+            self.assertEqual(wrapped.buffer.write(b'raw'), 3)
+            self.assertEqual(wrapped.buffer.getvalue(), b'raw')
+            self.assertEqual(len(profile.latencies), 2)
+
+            profile.end = clock.now
+
+        dump = profile.dump()
+        self.assertEqual(dump['queries'], 2)
+        self.assertAlmostEqual(dump['wall'], clock.now - 100.0)
+        self.assertAlmostEqual(dump['waiting'], 4 * 2e-5 + 0.75)
+        self.assertAlmostEqual(dump['writing'], 4 * 0.5)
+        self.assertEqual(dump['latency']['max'], max(profile.latencies))
+        self.assertAlmostEqual(dump['latency']['total'], sum(profile.latencies))
+        self.assertEqual(dump['latency']['p50'], max(profile.latencies))
+        self.assertEqual(dump['latency']['p90'], max(profile.latencies))
+        self.assertEqual(sum(dump['histogram']), 2)
+        self.assertEqual(len(dump['histogram']), len(dump['bounds']) + 1)
+        # one was over a second, the other one under it
+        self.assertEqual(dump['histogram'][-1], 1)
+        self.assertEqual(dump['histogram'][dump['bounds'].index(1.0)], 1)
+
+        empty = InteractionProfile().dump()
+        self.assertEqual(empty['queries'], 0)
+        self.assertIsNone(empty['latency']['p50'])
+        self.assertEqual(sum(empty['histogram']), 0)
+
+
+class Sink(io.BytesIO):
+    ''' keeps what was written to it after it's closed '''
+    def close(self):
+        if not self.closed: self.final = self.getvalue()
+        return super().close()
+
+    @property
+    def data(self): return (self.final if self.closed else self.getvalue()).decode()
+
+class Pipe(io.StringIO):
+    ''' a user that remembers what had reached every user by the time each of its answers was read '''
+    def __init__(self, answers, group):
+        self.sink = Sink()
+        self.writer = io.TextIOWrapper(self.sink, write_through=True)
+        self.seen = []
+        self.group = group
+        super().__init__(answers)
+
+    @property
+    def reader(self): return self
+
+    def seekable(self): return False
+
+    def readline(self, *args):
+        self.seen.append([pipe.sink.data for pipe in self.group])
+        return super().readline(*args)
+
+
+def interact(input_stream, *users, output_stream=None, **kwargs):
+    for query in range(3):
+        for user in users:
+            user.print(query)
+            user.write(f'{query}!\n')
+        for user in users:
+            [answer] = user.read.int(0, 9).eoln
+            assert answer == query
+    for user in users:
+        user.print('done')
+
+
+class TestFlush(unittest.TestCase):
+
+    def run_interactor(self, *args, users=2, **kwargs):
+        pipes = []
+        pipes += [Pipe('0\n1\n2\n', pipes) for user in range(users)]
+        interactor(*args, **kwargs)(interact)(io.StringIO(), *pipes, output_file=None)
+        for pipe in pipes:
+            # everything is flushed at the end
+            self.assertEqual(pipe.sink.data, '0\n0!\n1\n1!\n2\n2!\ndone\n')
+        return pipes
+
+    def test_before_read(self):
+        # by default, everything written to all users is flushed right before reading from any of them
+        for pipes in [self.run_interactor(), self.run_interactor(flush='before_read')]:
+            for pipe in pipes:
+                self.assertEqual(pipe.seen[:3], [[sent] * 2 for sent in ['0\n0!\n', '0\n0!\n1\n1!\n', '0\n0!\n1\n1!\n2\n2!\n']])
+
+    def test_line(self):
+        [pipe] = self.run_interactor(flush=FlushPolicy.LINE, users=1)
+        self.assertEqual(pipe.seen[:3], [[sent] for sent in ['0\n0!\n', '0\n0!\n1\n1!\n', '0\n0!\n1\n1!\n2\n2!\n']])
+        self.assertTrue(pipe.writer.line_buffering)
+
+    def test_explicit(self):
+        [pipe] = self.run_interactor(flush=FlushPolicy.EXPLICIT, users=1)
+        self.assertEqual(pipe.seen[:3], [['']] * 3)
+        self.assertFalse(pipe.writer.line_buffering)
+        self.assertFalse(pipe.writer.write_through)
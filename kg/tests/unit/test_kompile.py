@@ -0,0 +1,131 @@
+from unittest import mock
+import glob, os, time
+import unittest
+
+from ...black_magic.compiler import tree_shake
+from ...script.details import Details
+from ...script.kompile_cache import KompileCache
+from ...utils.utils import prune_cache
+from .helpers import TempDirTestCase, write
+
+
+class TestKompile(unittest.TestCase):
+
+    def test_tree_shake_multiline(self):
+        # a "line" with a newline would throw off the line numbers of the tree
+        lines = ['s = """two\nlines"""', 'def f(): return 1', 'print(s)']
+        self.assertEqual(tree_shake(lines), lines)
+        self.assertEqual(tree_shake(['def f(): return 1', 'def g(): return 2', 'print(g())']),
+                         ['def g(): return 2', 'print(g())'])
+
+
+class Thing:
+    def __init__(self, value):
+        self.value = value
+        super().__init__()
+
+    def __repr__(self): return 'Thing(...)'
+
+
+class TestKompileCache(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sources = {
+            'main': ['from helper import * ### @import', 'print(f())'],
+            'helper': ['def f(): return 1', 'def g(): return 2'],
+        }
+
+    def load_module(self, module_id):
+        if module_id not in self.sources: raise KeyError(module_id)
+        return self.sources[module_id], {'location': f'{module_id}.py', 'label': f'{module_id}.py'}
+
+    def kompile(self, **context):
+        # a new cache object each time, like separate runs
+        cache = KompileCache(self.tmp.name)
+        context.setdefault('details', Details({'title': 'Test'}))
+        lines = cache.compile_lines('main', self.load_module, lambda module, context: module, tree_shake=True, **context)
+        return lines, cache
+
+    def entries(self):
+        return sorted(glob.glob(self.path('kompiled', '*', '*.json')))
+
+    def test_hit_miss_invalidate(self):
+        lines, cache = self.kompile(format='pg')
+        self.assertIn('def f(): return 1', lines)
+        self.assertNotIn('def g(): return 2', lines)
+        self.assertEqual((cache.kompiled, cache.reused), (1, 0))
+        self.assertEqual((cache.parse_cache.hits, cache.parse_cache.misses), (0, 2))
+        self.assertEqual(len(self.entries()), 1)
+
+        # the same target is reused
+        again, cache = self.kompile(format='pg')
+        self.assertEqual(again, lines)
+        self.assertEqual((cache.kompiled, cache.reused), (0, 1))
+
+        # a different context is kompiled again, but the modules don't have to be parsed again
+        _, cache = self.kompile(format='hr')
+        self.assertEqual((cache.kompiled, cache.reused), (1, 0))
+        self.assertEqual((cache.parse_cache.hits, cache.parse_cache.misses), (2, 0))
+        _, cache = self.kompile(format='pg', details=Details({'title': 'Other'}))
+        self.assertEqual((cache.kompiled, cache.reused), (1, 0))
+        self.assertEqual(len(self.entries()), 3)
+
+        # changing an imported module makes it stale
+        self.sources['helper'] = ['def f(): return 3']
+        changed, cache = self.kompile(format='pg')
+        self.assertEqual((cache.kompiled, cache.reused), (1, 0))
+        self.assertIn('def f(): return 3', changed)
+        self.assertEqual(self.kompile(format='pg')[1].reused, 1)
+
+        # and so does removing it
+        del self.sources['helper']
+        with self.assertRaises(KeyError):
+            self.kompile(format='pg')
+
+    def test_uncacheable_context(self):
+        # both have the same repr, so a key made from it would make the second one reuse the first one's result
+        for value in [Thing(1), Thing(2), object(), object()]:
+            lines, cache = self.kompile(format='pg', thing=value)
+            self.assertIn('def f(): return 1', lines)
+            self.assertEqual((cache.kompiled, cache.reused), (1, 0))
+        self.assertEqual(self.entries(), [])
+
+    def test_prune(self):
+        self.kompile(format='pg')
+        self.kompile(format='hr')
+        self.assertEqual(len(self.entries()), 2)
+        with mock.patch.dict(os.environ, {'KG_KOMPILE_CACHE_SIZE': '0'}):
+            KompileCache(self.tmp.name).prune()
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(glob.glob(self.path('parsed', '*', '*')), [])
+
+    def test_prune_cache(self):
+        now = time.time()
+        def entry(name, size, age):
+            filename = self.path(name)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            write(filename, bytes(size))
+            os.utime(filename, (now - age, now - age))
+
+        entry('aa/old', 100, 30)
+        entry('aa/new', 100, 10)
+        entry('bb/newest', 100, 0)
+        entry('bb/older', 100, 20)
+        entry('bb/writing.tmp', 1000, 40)
+        entry('cc/dir/x', 60, 25)  # a folder entry at depth 2 in its own right
+        entry('cc/dir/y', 60, 25)
+        os.utime(self.path('cc', 'dir'), (now - 25, now - 25))
+
+        def left(): return sorted(os.path.relpath(path, self.tmp.name) for path in glob.glob(self.path('*', '*')))
+
+        prune_cache(self.tmp.name, 1000)
+        self.assertEqual(left(), ['aa/new', 'aa/old', 'bb/newest', 'bb/older', 'bb/writing.tmp', 'cc/dir'])
+
+        # the least recently used go first, and a temp file is never deleted
+        prune_cache(self.tmp.name, 300)
+        self.assertEqual(left(), ['aa/new', 'bb/newest', 'bb/older', 'bb/writing.tmp'])
+        prune_cache(self.tmp.name, 150)
+        self.assertEqual(left(), ['bb/newest', 'bb/writing.tmp'])
+        prune_cache(self.tmp.name, 0)
+        self.assertEqual(left(), ['bb/writing.tmp'])
@@ -1,6 +1,7 @@
 from decimal import Decimal
 import unittest
 
+from ...utils.intervals import Bounds, ExtremeTracker, Var
 from ...utils.parsers import strict_int, strict_real, ParsingError
 
 class TestParsers(unittest.TestCase):
@@ -140,6 +141,35 @@ class TestParsers(unittest.TestCase):
         # TODO more strict_real tests
 
 
+    def test_extreme_tracker(self):
+        tracker = Bounds._tracker = ExtremeTracker()
+        try:
+            for subtask, values in [('1', ['1', '7']), ('1', ['3', '9']), ('2', ['10', '2'])]:
+                lim = Bounds(n=1 <= +Var <= 10, m=0 < +Var < 10)
+                tracker.begin()
+                strict_int(values[0], lim.n)
+                strict_int(values[1], lim.m)
+                tracker.commit(subtask)
+
+            # rejected files are not recorded
+            tracker.begin()
+            strict_int('5', lim.n)
+            with self.assertRaises(ParsingError): strict_int('10', lim.m)
+            tracker.begin()
+        finally:
+            Bounds._tracker = None
+
+        self.assertEqual(tracker.dump(), [
+            {'subtask': '1', 'extremes': {
+                'n': {'lo': '1', 'hi': '10', 'min': '1', 'max': '3'},
+                'm': {'lo': '1', 'hi': '9', 'min': '7', 'max': '9'},
+            }},
+            {'subtask': '2', 'extremes': {
+                'n': {'lo': '1', 'hi': '10', 'min': '10', 'max': '10'},
+                'm': {'lo': '1', 'hi': '9', 'min': '2', 'max': '2'},
+            }},
+        ])
+
     # TODO test strict_real params
 
     # TODO test strict_real intervals
@@ -0,0 +1,249 @@
+import io, random
+import unittest
+
+from ...utils.streams import IBytesStreamState, InteractiveStream, ISMode, IStreamState, StreamError, _scan_re
+
+def text_file(data):
+    # like a file opened in text mode: '\r\n' and '\r' are read as '\n'
+    return io.TextIOWrapper(io.BytesIO(data.encode()))
+
+def read_all_tokens(stream):
+    tokens = []
+    while True:
+        try:
+            tokens.append(stream.read_token())
+        except StreamError:
+            return tokens
+
+def read_all_lines(stream):
+    lines = []
+    while True:
+        try:
+            lines.append(stream.read_line(include_ends=True))
+        except StreamError:
+            return lines
+
+class Pipe(io.TextIOBase):
+    ''' a non-seekable reader that only has the lines "sent" so far, and fails if read past them '''
+    def __init__(self):
+        self.lines = []
+        self.reads = 0
+        super().__init__()
+
+    def readable(self): return True
+    def seekable(self): return False
+
+    def read(self, size=-1):
+        raise AssertionError("an interactive stream must not read ahead")
+
+    def readline(self, size=-1):
+        if not self.lines: raise AssertionError("read past what was sent")
+        self.reads += 1
+        return self.lines.pop(0)
+
+class Writes(io.StringIO):
+    ''' remembers the size of each write '''
+    def __init__(self):
+        self.sizes = []
+        super().__init__()
+
+    def write(self, data):
+        self.sizes.append(len(data))
+        return super().write(data)
+
+
+class TestStreams(unittest.TestCase):
+
+    def test_line_endings(self):
+        for data in ['1 2\n3 4\n', '1 2\r\n3 4\r\n', '1 2\r3 4\r']:
+            with self.subTest(data=data):
+                self.assertEqual(read_all_tokens(InteractiveStream(text_file(data), mode=ISMode.TOKENS)), ['1', '2', '3', '4'])
+                self.assertEqual(read_all_lines(InteractiveStream(text_file(data))), ['1 2\n', '3 4\n'])
+
+        # untranslated, '\r' is just another character
+        stream = InteractiveStream(io.StringIO('1 2\r\n3\r\n', newline=''), mode=ISMode.TOKENS)
+        self.assertEqual(read_all_tokens(stream), ['1', '2\r', '3\r'])
+
+    def test_no_trailing_newline(self):
+        self.assertEqual(read_all_lines(InteractiveStream(text_file('a b\nc'))), ['a b\n', 'c'])
+        self.assertEqual(read_all_tokens(InteractiveStream(text_file('a b\nc'), mode=ISMode.TOKENS)), ['a', 'b', 'c'])
+
+        stream = InteractiveStream(text_file('5\n6'))
+        self.assertEqual(stream.read_int(), 5)
+        stream.read_eoln()
+        self.assertEqual(stream.read_int(), 6)
+        stream.read_eof()
+
+        with self.assertRaises(StreamError):
+            with InteractiveStream(text_file('5\n6'), require_trailing_eoln=True) as stream:
+                stream.read_int(); stream.read_eoln(); stream.read_int()
+
+        self.assertEqual(read_all_lines(InteractiveStream(text_file(''))), [])
+        self.assertEqual(read_all_lines(InteractiveStream(text_file('\n\n'))), ['\n', '\n'])
+
+    def test_block_boundaries(self):
+        # tokens and lines that straddle the 64K blocks the stream reads in
+        block = 1 << 16
+        for shift in range(-3, 4):
+            head = 'x' * (block + shift - 3)
+            tokens = [head, 'abcdef', 'y' * (2*block + 5), '12345']
+            data = ' '.join(tokens[:2]) + '\n' + ' '.join(tokens[2:]) + '\n'
+            with self.subTest(shift=shift):
+                self.assertEqual(read_all_tokens(InteractiveStream(io.StringIO(data), mode=ISMode.TOKENS)), tokens)
+                self.assertEqual(read_all_lines(InteractiveStream(io.StringIO(data))), data.splitlines(keepends=True))
+
+        # many short lines across several blocks
+        data = ''.join(f'{i} {i*i}\n' for i in range(50000))
+        stream = InteractiveStream(io.StringIO(data))
+        for i in range(50000):
+            self.assertEqual(stream.read_int(), i)
+            stream.read_space()
+            self.assertEqual(stream.read_int(), i*i)
+            stream.read_eoln()
+        stream.read_eof()
+
+    def test_interactive(self):
+        pipe = Pipe()
+        stream = InteractiveStream(pipe, mode=ISMode.TOKENS)
+
+        # each read only takes what it needs; anything more would block on a real pipe
+        pipe.lines.append('3 4\n')
+        self.assertEqual(stream.read_int(), 3)
+        self.assertEqual(stream.read_int(), 4)
+        self.assertEqual(pipe.reads, 1)
+
+        pipe.lines.append('hello\n')
+        self.assertEqual(stream.read_token(), 'hello')
+        self.assertEqual(pipe.reads, 2)
+
+        pipe.lines.append('a long line\n')
+        stream = InteractiveStream(pipe)
+        self.assertEqual(stream.read_line(include_ends=True), 'a long line\n')
+
+        pipe.lines.append('')  # EOF
+        with self.assertRaises(StreamError): stream.read_line()
+
+    def test_scan(self):
+        # the precompiled scanners agree with checking one char at a time, in text and in bytes
+        rand = random.Random(29)
+        alphabet = ' \t-]^\\ab.*'
+        char_sets = [frozenset(), frozenset(' '), frozenset(' \t'), frozenset('-]^\\'), frozenset('.*a'),
+                     frozenset(['ab', ' ']), frozenset(alphabet)]
+        for chars in char_sets:
+            for negate in False, True:
+                with self.subTest(chars=chars, negate=negate):
+                    for it in range(100):
+                        line = ''.join(rand.choice(alphabet) for _ in range(rand.randrange(8)))
+                        start = rand.randrange(len(line) + 1)
+                        end = start
+                        while end < len(line) and (line[end] in chars) != negate: end += 1
+                        self.assertEqual(_scan_re(chars, negate).match(line, start).end(), end)
+                        self.assertEqual(_scan_re(chars, negate, True).match(line.encode(), start).end(), end)
+
+        # non-ASCII chars can't be matched in bytes
+        self.assertEqual(_scan_re(frozenset(' é'), False, True).match(' é'.encode()).end(), 1)
+
+    def test_skip(self):
+        data = '  1\t 2 \n\n \t\nab  c  \n'
+        for state_class, file in (IStreamState, io.StringIO(data)), (IBytesStreamState, io.BytesIO(data.encode())):
+            with self.subTest(state=state_class.__name__):
+                state = state_class(file)
+                decode = (lambda s: s.decode()) if state_class._BINARY else (lambda s: s)
+                self.assertEqual(decode(state.next_line()), '  1\t 2 \n')
+                self.assertFalse(state.skip(frozenset(' ')))
+                self.assertEqual(state.peek(), '1')
+                self.assertFalse(state.skip(frozenset(' ')))  # nothing skipped
+                self.assertEqual(decode(state.consume_until(frozenset(' \t\n'))), '1')
+                self.assertFalse(state.skip({' ', '\t'}))
+                self.assertEqual(decode(state.consume_until({' ', '\n'})), '2')
+                self.assertTrue(state.skip(frozenset(' \n')))  # the line ran out
+                self.assertEqual(state.remaining(), 0)
+
+                self.assertEqual(decode(state.next_line()), '\n')
+                self.assertTrue(state.skip(frozenset('\n')))
+                self.assertEqual(decode(state.next_line()), ' \t\n')
+                self.assertFalse(state.skip(frozenset(' ')))
+                self.assertEqual(state.peek(), '\t')
+                self.assertTrue(state.skip(frozenset(' \t\n')))
+
+                self.assertEqual(decode(state.next_line()), 'ab  c  \n')
+                self.assertEqual(decode(state.consume_until(frozenset())), 'ab  c  \n')
+                self.assertEqual(decode(state.next_line()), '')
+
+    def test_bytes_mode(self):
+        # on ASCII data, the same tokens, lines and errors as in text mode
+        block = 1 << 16
+        datas = ['1 2\n3 4\n', '  a  b \n\n c\n', 'a b\nc', '', '\n\n', ' \n',
+                 'x' * (block - 2) + ' yz\n' + '7 ' * block + '\n' + 'w' * (block + 1)]
+        for data in datas:
+            for mode in None, ISMode.TOKENS, ISMode.LINES, ISMode.RAW_LINES:
+                with self.subTest(data=data[:10], mode=mode):
+                    def both():
+                        # a binary file works as well
+                        return (InteractiveStream(text_file(data), mode=mode),
+                                InteractiveStream(io.BytesIO(data.encode()), mode=mode, bytes_mode=True))
+                    text, raw = both()
+                    self.assertEqual([*raw], [*text])
+                    text, raw = both()
+                    if mode == ISMode.TOKENS:
+                        self.assertEqual(read_all_tokens(raw), read_all_tokens(text))
+                    elif mode != ISMode.LINES:
+                        self.assertEqual(read_all_lines(raw), read_all_lines(text))
+
+        def read_all_ints(stream):
+            ints = []
+            while True:
+                try:
+                    ints.append(stream.read_int())
+                except StreamError:
+                    return ints
+        for data in ['1 -2 +3 0\n', '007 -0\n', '1a 2\n', '99999999999999999999 -1\n', '- 1\n', '1.5\n']:
+            with self.subTest(data=data):
+                self.assertEqual(read_all_ints(InteractiveStream(text_file(data), mode=ISMode.TOKENS, bytes_mode=True)),
+                                 read_all_ints(InteractiveStream(text_file(data), mode=ISMode.TOKENS)))
+
+        # the lines before a non-ASCII char can still be read
+        stream = InteractiveStream(text_file('1 2\nx é\n'), bytes_mode=True)
+        self.assertEqual(stream.read_line(), '1 2')
+        with self.assertRaises(StreamError): stream.read_line()
+
+        with self.assertRaises(TypeError): InteractiveStream(io.StringIO('1\n'), bytes_mode=True)
+
+    def test_bulk_writers(self):
+        count, block = InteractiveStream._WRITE_COUNT, InteractiveStream._WRITE_BLOCK
+        def writes(write):
+            out = Writes()
+            write(InteractiveStream(None, out))
+            return out
+
+        def printed(lines):
+            out = io.StringIO()
+            for args, kwargs in lines: print(*args, **kwargs, file=out)
+            return out.getvalue()
+
+        for seq in [], [5], [-1, 0, 10**20], [*range(count)], [*range(count + 1)], [*range(3 * count + 7)]:
+            for kwargs in {}, {'sep': ', '}, {'end': ''}, {'sep': '', 'end': '$\n'}:
+                with self.subTest('write_ints', length=len(seq), **kwargs):
+                    expected = printed([(seq, kwargs)])
+                    self.assertEqual(writes(lambda stream: stream.write_ints(seq, **kwargs)).getvalue(), expected)
+                    out = writes(lambda stream: stream.write_ints(iter(seq), **kwargs))
+                    self.assertEqual(out.getvalue(), expected)
+                    # a few big writes, not one per value
+                    self.assertLessEqual(len(out.sizes), 2 * (len(seq) // count + 1) + 1)
+
+        # lines that cross the write blocks
+        matrices = [[], [[]], [[1, 2], [3], []], [[i] * (i % 50) for i in range(2000)], [[*range(30000)], [1]]]
+        for matrix in matrices:
+            for kwargs in {}, {'sep': ','}, {'end': '\r\n'}:
+                with self.subTest('write_rows', rows=len(matrix), **kwargs):
+                    out = writes(lambda stream: stream.write_rows(matrix, **kwargs))
+                    self.assertEqual(out.getvalue(), printed((row, kwargs) for row in matrix))
+                    self.assertLessEqual(len(out.sizes), len(out.getvalue()) // block + 1)
+
+        grids = [[], [''], ['#.#', [*'..#'], ''], ['#' * (i % 300) for i in range(1000)], ['.' * (3 * block)]]
+        for grid in grids:
+            for kwargs in {}, {'end': ';\n'}:
+                with self.subTest('write_grid', rows=len(grid), **kwargs):
+                    out = writes(lambda stream: stream.write_grid(grid, **kwargs))
+                    self.assertEqual(out.getvalue(), printed(((''.join(row),), kwargs) for row in grid))
+                    self.assertLessEqual(len(out.sizes), len(out.getvalue()) // block + 1)
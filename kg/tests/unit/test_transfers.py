@@ -0,0 +1,85 @@
+from unittest import mock
+import errno, os
+
+from ...script.transfers import TransferError, TransferMode, transfer_file, transfer_files
+from .helpers import TempDirTestCase, read, write
+
+def unsupported(*args, **kwargs):
+    raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+
+class TestTransfers(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.source = self.write('source.in', b'1\n2 3\n' * 1000)
+        self.dest = self.path('dest.in')
+
+    def test_modes(self):
+        self.assertEqual(transfer_file(self.source, self.dest), 'copied')
+        self.assertEqual(read(self.dest), read(self.source))
+        self.assertFalse(os.path.samefile(self.source, self.dest))
+
+        self.assertEqual(transfer_file(self.source, self.dest, TransferMode.HARDLINK), 'hardlinked')
+        self.assertTrue(os.path.samefile(self.source, self.dest))
+        self.assertEqual(transfer_file(self.source, self.dest, 'hardlink'), 'skipped')
+
+        # the old dest is replaced, not written over, so the source doesn't change with it
+        self.assertEqual(transfer_file(self.dest, self.source), 'skipped')
+        other = self.write('other.in', b'other\n')
+        self.assertEqual(transfer_file(other, self.dest), 'copied')
+        self.assertEqual(read(self.dest), b'other\n')
+        self.assertEqual(read(self.source), b'1\n2 3\n' * 1000)
+
+        os.unlink(self.dest)
+        self.assertIn(transfer_file(self.source, self.dest, TransferMode.REFLINK, verify=True), {'reflinked', 'copied'})
+        self.assertEqual(read(self.dest), read(self.source))
+
+        with self.assertRaises(ValueError): transfer_file(self.source, self.dest, 'symlink')
+
+    def test_fallbacks(self):
+        # where linking isn't supported, the files are copied instead
+        with mock.patch('os.link', unsupported):
+            self.assertEqual(transfer_file(self.source, self.dest, TransferMode.HARDLINK, verify=True), 'copied')
+        self.assertEqual(read(self.dest), read(self.source))
+        self.assertFalse(os.path.samefile(self.source, self.dest))
+
+        with mock.patch('fcntl.ioctl', unsupported):
+            self.assertEqual(transfer_file(self.source, self.dest, TransferMode.REFLINK, verify=True), 'copied')
+        self.assertEqual(read(self.dest), read(self.source))
+
+        if hasattr(os, 'copy_file_range'):
+            with mock.patch('os.copy_file_range', unsupported):
+                self.assertEqual(transfer_file(self.source, self.dest, verify=True), 'copied')
+            self.assertEqual(read(self.dest), read(self.source))
+
+        # but the other errors aren't hidden
+        def denied(*args, **kwargs):
+            raise OSError(errno.EACCES, "Permission denied")
+        with mock.patch('os.link', denied), self.assertRaises(OSError):
+            transfer_file(self.source, self.dest, TransferMode.HARDLINK)
+
+    def test_verify(self):
+        def bad_copy(source, dest):
+            write(dest, b'garbage\n')
+            return 'copied'
+        with mock.patch('kg.script.transfers._copy', bad_copy):
+            self.assertEqual(transfer_file(self.source, self.dest), 'copied')
+            with self.assertRaises(TransferError):
+                transfer_file(self.source, self.dest, verify=True)
+
+    def test_transfer_files(self):
+        sources = []
+        for index in range(20):
+            sources.append(self.path(f'{index:03}.in'))
+            write(sources[-1], f'{index}\n'.encode())
+        dests = [self.path('out', 'deeper', os.path.basename(source)) for source in sources]
+
+        with mock.patch('os.link', unsupported):
+            hows = transfer_files(zip(sources, dests), 'hardlink', verify=True, max_workers=4)
+        self.assertEqual(hows, {'copied': 20})
+        for index, dest in enumerate(dests):
+            self.assertEqual(read(dest), f'{index}\n'.encode())
+
+        self.assertEqual(transfer_files(zip(sources, dests), 'hardlink'), {'hardlinked': 20})
+        self.assertEqual(transfer_files(zip(sources, dests), 'hardlink'), {'skipped': 20})
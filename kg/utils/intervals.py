@@ -68,7 +68,7 @@ class Intervals(collections.abc.Hashable): ### @@ rem {
     """
     ### @@ }
 
-    __slots__ = '_bds', '_hash', '_complement'
+    __slots__ = '_bds', '_hash', '_complement', '_label'
 
     def __init__(self, bounds, *, _complement=None):
         self._bds = []
@@ -92,6 +92,7 @@ class Intervals(collections.abc.Hashable): ### @@ rem {
             raise ValueError("The intervals must be a subset of [-inf, +inf]")
         self._hash = None
         self._complement = _complement
+        self._label = None
         super().__init__()
 
     def __hash__(self):
@@ -214,6 +215,12 @@ class Intervals(collections.abc.Hashable): ### @@ rem {
                 yield uvl, BRACK_BTYPE[uch]
         return cls(bounds())
 
+    def _labeled(self, label):
+        # an equal copy that remembers which Bounds attribute it came from ### @rem
+        labeled = Intervals(self._bds)
+        labeled._label = label
+        return labeled
+
     @property
     def lower_bound(self): return self._bds[0][0]  if self._bds else +float('inf')
 
@@ -311,7 +318,66 @@ class Var(metaclass=VarMeta):
 def interval(l, r): return l <= +Var <= r
 Interval = interval = warn_on_call("'interval' deprecated; use a <= +Var <= b instead")(interval)
 
+class ExtremeTracker: ### @@ rem {
+    """Records the smallest and largest values that passed a range check against each named bound.
+
+    Opt-in: it is only active while Bounds._tracker is set to an instance. Values checked between
+    begin() and commit() are only kept if the file is accepted.
+    """
+    ### @@ }
+
+    def __init__(self):
+        self.results = {}
+        self._pending = {}
+        super().__init__()
+
+    def begin(self):
+        self._pending = {}
+
+    def record(self, intervals, x):
+        seen = self._pending.get(intervals._label)
+        if seen is None:
+            self._pending[intervals._label] = [intervals, x, x]
+        else:
+            if x < seen[1]: seen[1] = x
+            if x > seen[2]: seen[2] = x
+
+    def commit(self, subtask=None):
+        results = self.results.setdefault(subtask, {})
+        for name, (intervals, lo, hi) in self._pending.items():
+            if name in results:
+                _, plo, phi = results[name]
+                lo, hi = min(lo, plo), max(hi, phi)
+            results[name] = intervals, lo, hi
+        self._pending = {}
+
+    @staticmethod
+    def _extreme(bound, btype, integral):
+        if abs(bound) == float('inf'): return None
+        if btype in (BType.LI, BType.UI): return bound
+        # an exclusive bound can only be approached by integers ### @rem
+        if integral: return bound + 1 if btype == BType.LE else bound - 1
+
+    def dump(self):
+        """JSON-friendly form of the results; numbers are stringified to keep them exact.""" ### @rem
+        def _str(v): return None if v is None else str(v)
+        def _entry(intervals, lo, hi):
+            integral = isinstance(lo, int) and isinstance(hi, int)
+            return {
+                'lo': _str(ExtremeTracker._extreme(*intervals._bds[0], integral)),
+                'hi': _str(ExtremeTracker._extreme(*intervals._bds[-1], integral)),
+                'min': str(lo),
+                'max': str(hi),
+            }
+        return [
+            {'subtask': subtask, 'extremes': {name: _entry(*seen) for name, seen in results.items()}}
+            for subtask, results in self.results.items()
+        ]
+
+
 class Bounds(collections.abc.Mapping):
+    _tracker = None # set to an ExtremeTracker to record the values checked against each bound
+
     def __init__(self, bounds=None, **kwbounds):
         if isinstance(bounds, Bounds):
             bounds = bounds._attrs
@@ -352,6 +418,7 @@ class Bounds(collections.abc.Mapping):
         if name in self._attrs:
             self.accessed.add(name)
             value = self._attrs[name]
+            if Bounds._tracker is not None and isinstance(value, Intervals): value = value._labeled(name)
             setattr(self, name, value)
             return value
         raise AttributeError
@@ -15,6 +15,8 @@ def strict_check_range(x, *args, type="Number"):
         if isinstance(r, Intervals):
             if x not in r:
                 raise ParsingError(f"{type} {x} not in {r}")
+            if r._label is not None and Bounds._tracker is not None:
+                Bounds._tracker.record(r, x)
         else:
             if not (0 <= x < r):
                 raise ParsingError(f"{type} {x} not in [0, {r})")
@@ -25,7 +27,11 @@ def strict_check_range(x, *args, type="Number"):
     return x
 
 
+def _token_str(x):
+    return x.decode() if isinstance(x, bytes) else x
+
 _int_re = re.compile(r'^(?:0|-?[1-9]\d*)\Z')
+_int_re_bytes = re.compile(_int_re.pattern.encode())
 intchars = {'-', *string.digits}
 def strict_int(x, *args, as_str=False, validate=True): ### @@ rem {
     ''' Check if the string x is a valid integer token, and that it satisfies certain constraints.
@@ -37,13 +43,15 @@ def strict_int(x, *args, as_str=False, validate=True): ### @@ rem {
     strict_int(x, 5) # checks if x is in the half-open interval [0, 5)
     strict_int(x, 5, 8) # checks if x is in the closed interval [5, 8]
     strict_int(x, intervals) # check if  is in the 'intervals' Intervals
+
+    x can also be an ASCII bytes object; it is parsed without decoding.
     '''
     ### @@ }
     
     # validate
     if validate:
-        if not _int_re.fullmatch(x):
-            raise ParsingError(f"Expected integer literal, got {x!r}")
+        if not (_int_re_bytes if isinstance(x, bytes) else _int_re).fullmatch(x):
+            raise ParsingError(f"Expected integer literal, got {_token_str(x)!r}")
     
     # allow to return as string
     if [*args] == ['str']:
@@ -52,13 +60,13 @@ def strict_int(x, *args, as_str=False, validate=True): ### @@ rem {
         args = []
     if as_str:
         if args: raise ParsingError("Additional arguments not allowed if as_str is True")
-        return x
+        return x.decode() if isinstance(x, bytes) else x
     
     # parse and check range
     try:
         x = int(x)
     except ValueError as ex:
-        raise ParsingError(f"Cannot parse {overflow_ell(x)!r} to int") from ex
+        raise ParsingError(f"Cannot parse {overflow_ell(_token_str(x))!r} to int") from ex
     strict_check_range(x, *args, type="Integer")
     return x
 
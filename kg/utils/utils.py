@@ -1,4 +1,5 @@
 import collections, collections.abc, functools, os, os.path, pathlib, re, sys
+import shutil ### @rem
 
 warn_print = print
 
@@ -391,6 +392,34 @@ def pop_callable(s):
     return f, s
 
 
+### @@ rem {
+def prune_cache(folder, max_bytes, depth=2):
+    ''' Delete the least recently used entries of a cache (the files or folders "depth" levels inside "folder")
+    until they take up at most "max_bytes" in total. A cache hit should touch its entry to mark it as used. '''
+    def entry_size(path):
+        if not path.is_dir(): return path.stat().st_size
+        return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+
+    entries = []
+    for path in pathlib.Path(folder).glob('/'.join(['*'] * depth)):
+        if path.name.endswith('.tmp'): continue  # still being written
+        try:
+            entries.append((path.stat().st_mtime, entry_size(path), path))
+        except OSError:
+            ...  # deleted by another run
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except OSError:
+            ...
+        total -= size
+### @@ }
+
 ### @@ rem {
 if __name__ == '__main__':
     # TODO make proper unit tests
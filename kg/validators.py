@@ -1,4 +1,4 @@
-import argparse, functools, io, itertools, re, sys
+import argparse, contextlib, functools, io, itertools, json, os, re, sys
 
 from .utils import * ### @import
 from .utils.intervals import * ### @import
@@ -17,8 +17,11 @@ class StrictInputStream:
         self.last = None
         self.next = None
         # NOTE: in the future, if we want to handle OS-based newlines, this step needs to be reconsidered ### @rem
+        # read in blocks, so the whole file is never in memory; an interactive file is read one char at a time ### @rem
+        self._source = None
         if not interactive and not isinstance(file, io.StringIO):
-            file = io.StringIO(file.read())
+            self._source = file
+            file = io.StringIO()
         self.file = file
         # self._found = {}  # TODO add labels ### @rem
         self._read = ChainRead(self)
@@ -32,16 +35,24 @@ class StrictInputStream:
     # def __getitem__(self, key): return self._found[key]
     ### @@ }
 
+    _BLOCK = 1 << 16
+    def _read_block(self):
+        # the current block is used up; returns the first char of the next one (or EOF)
+        block = self._source.read(self._BLOCK) if self._source else EOF
+        if not block: return EOF
+        self.file = io.StringIO(block)
+        return self.file.read(1)
+
     def _next_char(self):
         if self.last == EOF: raise ValidationStreamError("Read past EOF")
-        if self.next is None: self.next = self.file.read(1)
+        if self.next is None: self.next = self.file.read(1) or self._read_block()
         self.last = self.next
         self.next = None
         return self.last
 
     def peek_char(self):
         if self.last == EOF: raise ValidationStreamError("Peeked past EOF")
-        if self.next is None: self.next = self.file.read(1)
+        if self.next is None: self.next = self.file.read(1) or self._read_block()
         return self.next
 
     def _read_cond(self, good, bad, *, l=None, n=None, maxn=None, include_end=False, _called="_read_cond"):
@@ -190,9 +201,12 @@ def validator(f=None, *, bounds=None, subtasks=None, extra_chars_allowed=False,
                 if bounds: lim &= Bounds(bounds)
                 if subtasks: lim &= Bounds(subtasks.get(kwargs['subtask']))
                 kwargs['lim'] = lim
+            tracker = Bounds._tracker
+            if tracker is not None: tracker.begin()
             res = f(stream, *args, **kwargs)
             if stream.last != EOF and not extra_chars_allowed:
                 stream.read_eof()
+            if tracker is not None: tracker.commit(kwargs.get('subtask'))
             ### @@ if format == 'pc2' {
             if CURR_PLATFORM == 'pc2':
                 exit(42) # magic number to indicate successful validation (PC^2)
@@ -213,14 +227,40 @@ def detect_subtasks(validate, file, subtasks, *args, **kwargs):
         else:
             yield subtask
 
+def _validate_batch(validate, subtasks, pathfile, outfile, *args, subtask=None, detect=False, extremes=False, **kwargs):
+    # one JSON line per path, flushed right away since the other end waits for it. The first line says we're ready
+    print(json.dumps({'ready': True}), file=outfile, flush=True)
+    for line in iter(pathfile.readline, ''):
+        path = line.rstrip('\n')
+        if not path: continue
+        if extremes: Bounds._tracker = ExtremeTracker()
+        result = {'file': path}
+        try:
+            # keep stray prints away from the results
+            with open(path) as file, contextlib.redirect_stdout(sys.stderr):
+                if detect:
+                    result['subtasks'] = [*detect_subtasks(validate, file, subtasks, *args, **kwargs)]
+                else:
+                    validate(file, *args, subtask=subtask, **kwargs)
+        except Exception as exc:
+            result['error'] = f'{exc.__class__.__name__}: {exc}'
+        if extremes: result['extremes'] = Bounds._tracker.dump()
+        print(json.dumps(result), file=outfile, flush=True)
+
 def validate_or_detect_subtasks(validate, subtasks, file=sys.stdin, outfile=sys.stdout, *args, title='', **kwargs):
     desc = CURR_PLATFORM + ' validator for the problem' + (f' "{title}"' if title else '')
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument('subtask', nargs='?', help='which subtask to check the file against')
     parser.add_argument('--detect-subtasks', '-d', action='store_true', help='detect subtasks instead')
+    parser.add_argument('--batch', action='store_true',
+            help='read file paths from stdin, one per line, and print a JSON result line for each')
     pargs, unknown = parser.parse_known_args()
     subtask = pargs.subtask
 
+    # opt-in: record the values checked against each bound (used by 'kg make --extremes')
+    extremes_file = os.environ.get('KG_EXTREMES_FILE')
+    if extremes_file: Bounds._tracker = ExtremeTracker()
+
     ### @@ if format != 'pg' {
     # suppress error messages when uploaded to Polygon
     if subtask is not None and subtask not in subtasks:
@@ -229,8 +269,16 @@ def validate_or_detect_subtasks(validate, subtasks, file=sys.stdin, outfile=sys.
         raise ValidationError("Invalid subtask name.")
     ### @@ }
 
+    if pargs.batch:
+        _validate_batch(validate, subtasks, file, outfile, *args, subtask=subtask, detect=pargs.detect_subtasks,
+                extremes=bool(extremes_file), **kwargs)
+        return
+
     if pargs.detect_subtasks:
         print(*detect_subtasks(validate, file, subtasks, *args, **kwargs), file=outfile)
     else:
         validate(file, *args, subtask=subtask, **kwargs)
 
+    if extremes_file:
+        with open(extremes_file, 'w') as f:
+            json.dump(Bounds._tracker.dump(), f)
@@ -54,4 +54,7 @@ setup(name='KompGen',
           'pytz',
           'PyYAML',
       ],
+      extras_require={
+          'zstd': ['zstandard'],
+      },
 )